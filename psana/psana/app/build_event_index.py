@@ -0,0 +1,29 @@
+from psana.psexp.event_index import EventIndex, get_index_filename, get_run_smd_files
+
+import os
+import sys
+import time
+import argparse
+
+def build_event_index():
+
+  parser = argparse.ArgumentParser(description='Builds the event index of a run (used by run.event_at() and run.events(timestamps=...))')
+  parser.add_argument("xtc_files", nargs='+', help="bigdata xtc2 file(s) of the run(s) to index (e.g. /cds/data/psdm/xpp/xpptut15/xtc/xpptut15-r0001-s000-c000.xtc2)")
+  parser.add_argument('-o','--output', dest='output', default=None, help='Output filename (default: <xtc_dir>/smalldata/<exp>-r<run>.smd.idx.npz)')
+  args = parser.parse_args()
+
+  for xtc_file in args.xtc_files:
+    smd_files = get_run_smd_files([xtc_file])
+    if not smd_files:
+      sys.exit(f'No smd files found for {xtc_file}')
+    if any([smd_file.endswith('.inprogress') for smd_file in smd_files]):
+      print(f'Warning: run of {xtc_file} is still in progress, the index will be out of date when the run ends')
+
+    st = time.monotonic()
+    index = EventIndex.build(smd_files)
+    output = args.output if args.output else get_index_filename([xtc_file])
+    index.save(output)
+    print(f'{output}: {index.n_rows} rows from {len(smd_files)} streams ({os.path.getsize(output)/1e6:.1f} MB) in {time.monotonic()-st:.1f}s')
+
+if __name__ == '__main__':
+  build_event_index()
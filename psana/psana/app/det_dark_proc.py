@@ -17,6 +17,7 @@ USAGE = 'Usage:'\
       + '\n\nTest:'\
       + '\n  %s -k "{\'exp\':\'tmoc00118\', \'run\':123}" -d tmoopal -o ./work' % SCRNAME\
       + '\n  %s -k exp=tmoc00118,run=123 -d tmoopal -o ./work' % SCRNAME\
+      + '\n  mpirun -n 8 %s -k exp=tmoc00118,run=123 -d tmoopal -o ./work # parallel processing' % SCRNAME\
       + '\n  %s -k /cds/data/psdm/prj/public01/xtc/tmoc00318-r0010-s000-c000.xtc2 -d epix100 -o ./work' % SCRNAME\
       + '\n  %s -k /cds/data/psdm/prj/public01/xtc/tmoc00118-r0222-s006-c000.xtc2 -d tmo_atmopal -o ./work' % SCRNAME\
       + '\n  %s -k /cds/data/psdm/prj/public01/xtc/rixl1013320-r0093-s006-c000.xtc2 -d atmopal -o ./work' % SCRNAME\
@@ -73,6 +74,7 @@ def argument_parser():
     d_run_end = 'end'
     d_comment = 'no comment'
     d_plotim  = 0
+    d_qstream = False
 
     h_dskwargs= 'string of comma-separated (no spaces) simple parameters for DataSource(**kwargs),'\
                 ' ex: exp=<expname>,run=<runs>,dir=<xtc-dir>, ...,'\
@@ -111,6 +113,7 @@ def argument_parser():
     h_run_end = 'last run for validity range, default = %s' % str(d_run_end)
     h_comment = 'comment added to constants metadata, default = %s' % str(d_comment)
     h_plotim  = 'plot image/s of pedestals, default = %s' % str(d_plotim)
+    h_qstream = 'use streaming approximate quantiles at 1st stage instead of the data block of nrecs1 records, default = %s' % d_qstream
 
     parser = ArgumentParser(usage=USAGE, description='%s - proceses dark run xtc raw data fro specified detector' % SCRNAME)
     parser.add_argument('-k', '--dskwargs',default=d_dskwargs,   type=str,   help=h_dskwargs)
@@ -145,6 +148,7 @@ def argument_parser():
     parser.add_argument('-R', '--run_end', default=d_run_end,    type=str,   help=h_run_end)
     parser.add_argument('-C', '--comment', default=d_comment,    type=str,   help=h_comment)
     parser.add_argument('-p', '--plotim',  default=d_plotim,     type=int,   help=h_plotim)
+    parser.add_argument('--qstream',       action='store_true',              help=h_qstream)
 
     return parser
 
@@ -26,6 +26,12 @@ Usage::
   rows_cols = hole_rows_cols(img_holes)
   fill_holes(img, hrows, hcols)
   statistics_of_holes(rows, cols, **kwa)
+  plan = image_plan(rows, cols)
+  rows, cols = rows_cols_from_image_plan(plan)
+  img = img_entries_from_image_plan(plan)
+  img = img_from_image_plan(plan, nda, mapmode=2, fillholes=True, vbase=0, dtype=np.float32)
+  key = image_plan_key(geo, segnums, **kwa)
+  plan = cached_image_plan(key, rows_cols)
   img = img_default(arr)
 
   #TBD init_interpolation_parameters(rows, cols, x, y, **kwa)
@@ -310,6 +316,127 @@ def statistics_of_holes(rows, cols, **kwa):
     return img_pix_ascend_ind, img_holes, hole_rows, hole_cols, hole_inds1d
 
 
+IMAGE_PLAN_KEYS = ('arr_shape', 'img_shape', 'inds', 'multi_pix', 'multi_ptr', 'multi_img', 'multi_num', 'hole_rows', 'hole_cols')
+
+
+def image_plan(rows, cols):
+    """Returns image plan - dict of flat arrays which maps data array to image for any mapmode<4:
+       - arr_shape, img_shape - shapes of data and image arrays,
+       - inds - ravel image index for each pixel of ravel data array,
+       - multi_pix, multi_ptr - CSR-style groups of data pixel indexes mapped to the same image bin,
+         pixels of group i are multi_pix[multi_ptr[i]:multi_ptr[i+1]] in ascending order,
+       - multi_img, multi_num - ravel image index and number of entries for each group,
+       - hole_rows, hole_cols - image rows and cols of holes, see statistics_of_holes.
+    """
+    assert isinstance(rows, np.ndarray)
+    assert isinstance(cols, np.ndarray)
+    assert rows.size == cols.size
+
+    t0_sec = time()
+    img_shape = nrows, ncols = image_shape(rows, cols)
+    dtype = np.int32 if nrows * ncols < 0x7fffffff else np.int64
+    inds = (rows.ravel().astype(np.int64) * ncols + cols.ravel().astype(np.int64)).astype(dtype)
+    nentries = np.bincount(inds, minlength=nrows * ncols)
+
+    order = np.argsort(inds, kind='stable')
+    multi = nentries[inds[order]] > 1
+    multi_pix = order[multi].astype(dtype)
+    minds = inds[multi_pix]
+    first = np.ones(minds.size, dtype=bool)
+    first[1:] = minds[1:] != minds[:-1]
+    multi_ptr = np.append(np.flatnonzero(first), minds.size).astype(dtype)
+    multi_img = minds[first]
+    multi_num = nentries[multi_img].astype(np.float32)
+
+    hole_rows, hole_cols = hole_rows_cols(image_of_holes(nentries.reshape(img_shape) > 0))
+
+    logger.debug('image_plan for %d pixels, %d multi-pixel image bins, %d holes, time (sec) = %.6f'%\
+                 (inds.size, multi_img.size, hole_rows.size, time()-t0_sec))
+
+    return dict(arr_shape=np.array(rows.shape), img_shape=np.array(img_shape), inds=inds,\
+                multi_pix=multi_pix, multi_ptr=multi_ptr, multi_img=multi_img, multi_num=multi_num,\
+                hole_rows=hole_rows, hole_cols=hole_cols)
+
+
+def rows_cols_from_image_plan(plan):
+    """Returns pixel index arrays rows, cols shaped as data, the same as used in image_plan."""
+    shape = tuple(plan['arr_shape'])
+    rows, cols = np.divmod(plan['inds'], int(plan['img_shape'][1]))
+    return rows.astype(np.uint).reshape(shape), cols.astype(np.uint).reshape(shape)
+
+
+def img_entries_from_image_plan(plan):
+    """Returns image of number of data pixel entries in image bins, the same as img_sta of statistics_of_pixel_arrays."""
+    img_shape = tuple(plan['img_shape'])
+    return np.bincount(plan['inds'], minlength=img_shape[0] * img_shape[1]).astype(np.uint16).reshape(img_shape)
+
+
+def img_from_image_plan(plan, nda, mapmode=2, fillholes=True, vbase=0, dtype=np.float32):
+    """Returns image for data array nda using image plan.
+       mapmode 1/2/3 - last/max/mean pixel intensity for image bins with multiple entries.
+    """
+    img_shape = tuple(plan['img_shape'])
+    weight = nda.ravel()
+    img = np.full(img_shape[0] * img_shape[1], vbase, dtype=dtype) if vbase else\
+          np.zeros(img_shape[0] * img_shape[1], dtype=dtype)
+    img[plan['inds']] = weight # mapmode==1
+    multi_pix, multi_ptr, multi_img = plan['multi_pix'], plan['multi_ptr'], plan['multi_img']
+    if mapmode in (2,3) and multi_img.size:
+        w = weight[multi_pix].astype(dtype)
+        if mapmode==2: img[multi_img] = np.maximum.reduceat(w, multi_ptr[:-1])
+        else:          img[multi_img] = np.add.reduceat(w, multi_ptr[:-1]) / plan['multi_num']
+    img.shape = img_shape
+    if fillholes: fill_holes(img, plan['hole_rows'], plan['hole_cols'])
+    return img
+
+
+def image_plan_key(geo, segnums, **kwa):
+    """Returns (str) key of image plan for GeometryAccess object geo, segment numbers, and geometry kwargs."""
+    import hashlib
+    s = '%s|%s|%s|%s|%s|%s' % (geo.str_geo_pars(), str(tuple(int(i) for i in segnums)),\
+        str(kwa.get('pix_scale_size_um', None)), str(kwa.get('xy0_off_pix', None)),\
+        str(kwa.get('do_tilt', True)), str(kwa.get('cframe', 0)))
+    return hashlib.sha1(s.encode()).hexdigest()
+
+
+IMAGE_PLANS_MAX = 8 # max number of image plans cached in memory
+_image_plans = {}
+
+
+def cached_image_plan(key, rows_cols):
+    """Returns image plan for key from memory, on-disk calibration cache (if LCLS_CALIB_CACHE_DIR is set),
+       or evaluates it as image_plan(*rows_cols()) and caches.
+    """
+    plan = _image_plans.get(key, None)
+    if plan is not None: return plan
+
+    import io
+    from psana.pscalib.calib.MDBWebCache import calib_cache
+    cache = calib_cache()
+    s = None if cache is None else cache.get_blob('imgplan', key)
+    if s is not None:
+        try:
+            with np.load(io.BytesIO(s)) as f:
+                plan = {k:f[k] for k in IMAGE_PLAN_KEYS}
+            logger.debug('image plan %s is loaded from cache' % key)
+        except (OSError, ValueError, KeyError) as err:
+            logger.warning('image plan %s in cache is corrupted: %s' % (key, err))
+            plan = None
+
+    if plan is None:
+        rows, cols = rows_cols()
+        if rows is None or cols is None: return None
+        plan = image_plan(rows, cols)
+        if cache is not None:
+            buf = io.BytesIO()
+            np.savez(buf, **plan)
+            cache.put_blob('imgplan', key, buf.getvalue())
+
+    if len(_image_plans) >= IMAGE_PLANS_MAX: _image_plans.pop(next(iter(_image_plans)))
+    _image_plans[key] = plan
+    return plan
+
+
 def img_default(arr):
     med = np.median(arr)
     spr = np.median(np.abs(arr-med))
@@ -9,6 +9,14 @@ Usage::
     #OR
     import psana.detector.UtilsCalib as uac
 
+    # parallel dark processing, e.g. mpirun -n 8 det_dark_proc ...
+    # events are split between bigdata ranks, 1st stage gates are evaluated on rank 0
+    # and broadcasted, 2nd stage accumulators are reduced on rank 0, which saves constants
+    dpo = uac.DarkProc(comm=uac.bd_comm(ds), **kwa)
+
+    # streaming approximate quantiles at 1st stage (P-square algorithm), w/o data block in memory
+    dpo = uac.DarkProc(qstream=True, **kwa)
+
 This software was developed for the LCLS project.
 If you use all or part of it, please give an appropriate acknowledgment.
 
@@ -68,6 +76,85 @@ def tstamps_run_and_now(trun_sec): # unix epoch time, e.g. 1607569818.532117 sec
     return ts_run, ts_now
 
 
+def gate_limits(arr_qlo, arr_qhi, dtype, int_lo=1, int_hi=16000):
+    """Returns gate_lo, gate_hi - per-pixel limits of intensities accepted at 2nd stage
+       from the low and high quantiles of intensity distributions.
+    """
+    arr1_u16 = np.ones(arr_qlo.shape, dtype=np.uint16)
+    gate_lo = np.maximum(np.floor(arr_qlo), arr1_u16 * int_lo).astype(dtype=dtype)
+    gate_hi = np.minimum(np.ceil(arr_qhi),  arr1_u16 * int_hi).astype(dtype=dtype)
+    cond = gate_hi>gate_lo
+    gate_hi[np.logical_not(cond)] +=1
+    return gate_lo, gate_hi
+
+
+class P2Quantile():
+    """Streaming approximate quantile of per-pixel intensity distributions
+       using the P-square algorithm (R. Jain, I. Chlamtac, Comm. ACM 28 (1985) 1076)
+       vectorized over pixels. Memory does not depend on the number of events.
+    """
+    def __init__(self, p):
+        self.p    = p
+        self.nobs = 0
+        self.q    = None # (5, <raw-shape>) marker heights
+        self.n    = None # (5, <raw-shape>) marker positions
+        self.ndes = np.array((1, 1+2*p, 1+4*p, 3+2*p, 5), dtype=np.float64) # desired marker positions
+        self.dn   = np.array((0, p/2, p, (1+p)/2, 1), dtype=np.float64)
+
+
+    def add(self, x):
+        if self.nobs < 5:
+            if self.q is None: self.q = np.empty((5,)+x.shape, dtype=np.float32)
+            self.q[self.nobs] = x
+            self.nobs += 1
+            if self.nobs == 5:
+                self.q.sort(axis=0)
+                self.n = np.empty_like(self.q)
+                for i in range(5): self.n[i] = i+1
+            return
+
+        self.nobs += 1
+        q, n = self.q, self.n
+        np.minimum(q[0], x, out=q[0])
+        np.maximum(q[4], x, out=q[4])
+        for i in (1,2,3): n[i] += x < q[i]
+        n[4] += 1
+        self.ndes += self.dn
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+          for i in (1,2,3):
+            d = self.ndes[i] - n[i]
+            up = (d >= 1)  & (n[i+1] - n[i] > 1)
+            dw = (d <= -1) & (n[i-1] - n[i] < -1)
+            adj = up | dw
+            if not adj.any(): continue
+            s = np.where(up, 1, -1).astype(q.dtype)
+            qp = q[i] + s / (n[i+1] - n[i-1])\
+                 * ((n[i] - n[i-1] + s) * (q[i+1] - q[i]) / (n[i+1] - n[i])\
+                  + (n[i+1] - n[i] - s) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+            ql = q[i] + s * (np.where(up, q[i+1], q[i-1]) - q[i]) / (np.where(up, n[i+1], n[i-1]) - n[i])
+            q[i] = np.where(adj, np.where((q[i-1] < qp) & (qp < q[i+1]), qp, ql), q[i])
+            n[i] += np.where(adj, s, 0)
+
+
+    def value(self):
+        if self.nobs == 0: return None
+        if self.nobs < 5: return np.quantile(self.q[:self.nobs], self.p, axis=0)
+        return self.q[2]
+
+
+def bd_comm(ds):
+    """Returns MPI communicator of bigdata ranks of DataSource ds in psana parallel mode
+       with more than one bigdata rank, None otherwise.
+    """
+    comms = getattr(ds, 'comms', None)
+    if comms is None: return None
+    from mpi4py import MPI
+    comm = comms.bd_only_comm()
+    if comm == MPI.COMM_NULL or comm.Get_size() < 2: return None
+    return comm
+
+
 def proc_block(block, **kwa):
     """Dark data 1st stage processing to define gate limits.
        block.shape = (nrecs, <raw-detector-shape>),
@@ -89,9 +176,6 @@ def proc_block(block, **kwa):
     nrecs1= block.shape[0]
     shape = block.shape[1:] #(ny, nx)
 
-    arr1_u16 = np.ones(shape, dtype=np.uint16)
-    arr1     = np.ones(shape, dtype=np.uint64)
-
     t1_sec = time()
 
     """
@@ -128,13 +212,7 @@ def proc_block(block, **kwa):
       + '\n    event spectrum spread    median(abs(raw-med)): %.3f ADU - spectral peak width estimator' % med_abs_dev
     logger.info(s)
 
-    gate_lo    = arr1_u16 * int_lo
-    gate_hi    = arr1_u16 * int_hi
-
-    gate_lo = np.maximum(np.floor(arr_qlo), gate_lo).astype(dtype=block.dtype)
-    gate_hi = np.minimum(np.ceil(arr_qhi),  gate_hi).astype(dtype=block.dtype)
-    cond = gate_hi>gate_lo
-    gate_hi[np.logical_not(cond)] +=1
+    gate_lo, gate_hi = gate_limits(arr_qlo, arr_qhi, block.dtype, int_lo, int_hi)
 
     logger.debug('proc_block results'\
                 +info_ndarr(arr_med,     '\n    arr_med[100:105]', first=100, last=105)\
@@ -163,20 +241,81 @@ class DarkProc():
         self.rmsnlo = kwa.get('rmsnlo', 6.0)     # rms ditribution number-of-sigmas low
         self.rmsnhi = kwa.get('rmsnhi', 6.0)     # rms ditribution number-of-sigmas high
         self.datbits= kwa.get('datbits', 0x3fff) # data bits 0x3fff is 14-bit mask for epix10ka and Jungfrau
+        self.qstream= kwa.get('qstream', False)  # use streaming approximate quantiles at 1st stage
+        self.comm   = kwa.get('comm', None)      # MPI communicator of ranks processing events in parallel
+
+        self.rank, self.size = (0, 1) if self.comm is None else (self.comm.Get_rank(), self.comm.Get_size())
+        if self.size > 1: # nrecs1 and nrecs are split between ranks
+            self.nrecs1 = -(-self.nrecs1 // self.size)
+            self.nrecs  = -(-self.nrecs  // self.size)
 
         self.status = 0 # 0/1/2 stage
         self.kwa    = kwa
         self.block  = None
+        self.p2qs   = None # P2Quantile objects for fraclo, 0.5, frachi and abs deviation in qstream mode
+        self.stage1 = False # 1st stage is completed
         self.irec   = -1
 
 
     def accumulate_block(self, raw):
-        self.block[self.irec,:] = raw # & M14 is not applied
+        if self.qstream:
+            self.accumulate_stream(raw)
+        else:
+            self.block[self.irec,:] = raw # & M14 is not applied
+
+
+    def accumulate_stream(self, raw):
+        if self.p2qs is None:
+            self.dtype_raw = raw.dtype
+            self.p2qs = [P2Quantile(p) for p in (self.kwa.get('fraclo', 0.05), 0.5, self.kwa.get('frachi', 0.95), 0.5)]
+        qlo, qmed, qhi, qdev = self.p2qs
+        for o in (qlo, qmed, qhi): o.add(raw)
+        qdev.add(np.abs(raw - qmed.value()))
+
+
+    def _block_part(self):
+        """Returns this rank part of 1st stage data: block of raw data or
+           (nrecs, arr_qlo, arr_med, arr_qhi, arr_abs_dev) in qstream mode, None if no data.
+        """
+        nrecs = min(self.irec+1, self.nrecs1)
+        if nrecs < 1: return None
+        if self.qstream:
+            return (nrecs,) + tuple(o.value() for o in self.p2qs) + (self.dtype_raw,)
+        return self.block[:nrecs]
+
+
+    def _proc_block_parts(self, parts):
+        """Returns gate_lo, gate_hi, arr_med, arr_abs_dev for 1st stage data parts of all ranks."""
+        parts = [p for p in parts if p is not None]
+        if not parts: return None
+        if self.qstream: # weighted average of quantiles over ranks
+            w = np.array([p[0] for p in parts], dtype=np.float64)
+            w /= w.sum()
+            arr_qlo, arr_med, arr_qhi, arr_abs_dev = [sum(wi*p[i] for wi,p in zip(w, parts)) for i in (1,2,3,4)]
+            gate_lo, gate_hi = gate_limits(arr_qlo, arr_qhi, parts[0][5], self.int_lo, self.int_hi)
+            logger.info('streaming quantiles for %d events' % sum(p[0] for p in parts)\
+                +info_ndarr(arr_qlo, '\n  arr_qlo[100:105]', first=100, last=105)\
+                +info_ndarr(arr_qhi, '\n  arr_qhi[100:105]', first=100, last=105))
+            return gate_lo, gate_hi, arr_med, arr_abs_dev
+        block = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return proc_block(block, **self.kwa)
 
 
     def proc_block(self):
+        """1st stage processing, collective call for all ranks in parallel mode:
+           data block parts are gathered and processed on rank 0 and results are broadcasted.
+        """
         t0_sec = time()
-        self.gate_lo, self.gate_hi, self.arr_med, self.abs_dev = proc_block(self.block, **self.kwa)
+        part = self._block_part()
+        parts = [part] if self.comm is None else self.comm.gather(part, root=0)
+        results = self._proc_block_parts(parts) if self.rank == 0 else None
+        if self.comm is not None: results = self.comm.bcast(results, root=0)
+        self.stage1 = True
+        if results is None:
+            self.gate_lo = self.gate_hi = self.arr_med = self.abs_dev = None
+            logger.info('data block processing: there is no data')
+            return
+        self.gate_lo, self.gate_hi, self.arr_med, self.abs_dev = results
         logger.info('data block processing total time %.3f sec' % (time()-t0_sec)\
               +info_ndarr(self.arr_med, '\n  arr_med[100:105]', first=100, last=105)\
               +info_ndarr(self.abs_dev, '\n  abs_dev[100:105]', first=100, last=105)\
@@ -213,9 +352,42 @@ class DarkProc():
         self.arr_min    = np.ones (shape_raw, dtype=dtype_raw) * 0xffff
 
 
+    def proc_stage1(self):
+        """Completes 1st stage processing and initializes 2nd stage with data of the block."""
+        self.proc_block()
+        if self.gate_lo is None: return
+        self.init_proc()
+        self.add_block()
+        sys.stdout.write('1st stage event block processing is completed\n')
+
+
+    def reduce_stage2(self):
+        """Reduces 2nd stage accumulators and number of records of all ranks on rank 0."""
+        from mpi4py import MPI
+        for name, op in (('arr_sum0', MPI.SUM), ('arr_sum1', MPI.SUM), ('arr_sum2', MPI.SUM),\
+                         ('sta_int_lo', MPI.SUM), ('sta_int_hi', MPI.SUM),\
+                         ('arr_max', MPI.MAX), ('arr_min', MPI.MIN)):
+            arr = getattr(self, name)
+            if self.rank == 0:
+                self.comm.Reduce(MPI.IN_PLACE, arr, op=op, root=0)
+            else:
+                self.comm.Reduce(arr, None, op=op, root=0)
+        nrecs = self.comm.reduce(self.irec+1, op=MPI.SUM, root=0)
+        if self.rank == 0: self.irec = nrecs - 1
+
+
     def summary(self):
         t0_sec = time()
 
+        if not self.stage1: self.proc_stage1()
+
+        if self.comm is not None and self.gate_lo is not None:
+            self.reduce_stage2()
+            if self.rank != 0:
+                self.block = None
+                self.irec = -1
+                return
+
         logger.info('summary')
         logger.info('%s\nraw data found/selected in %d events' % (80*'_', self.irec+1))
 
@@ -289,6 +461,8 @@ class DarkProc():
         if plotim: self.plot_images(titpref='')
 
         self.block = None
+        self.p2qs = None
+        self.stage1 = False
         self.irec = -1
         logger.info('summary consumes %.3f sec' % (time()-t0_sec))
 
@@ -314,8 +488,10 @@ class DarkProc():
 
 
     def add_block(self):
-        logger.info(info_ndarr(self.block, 'add to gated average statistics the block of initial data'))
-        for i,raw in enumerate(self.block): self.add_event(raw,i)
+        if self.block is None: return # qstream mode
+        block = self.block[:min(self.irec+1, self.nrecs1)]
+        logger.info(info_ndarr(block, 'add to gated average statistics the block of initial data'))
+        for i,raw in enumerate(block): self.add_event(raw,i)
 
 
     def event(self, raw, evnum):
@@ -327,7 +503,7 @@ class DarkProc():
 
         if raw is None: return self.status
 
-        if self.block is None :
+        if self.block is None and not self.qstream:
            self.block=np.zeros((self.nrecs1,)+tuple(raw.shape), dtype=raw.dtype)
            logger.info(info_ndarr(self.block,'created empty data block'))
 
@@ -339,10 +515,7 @@ class DarkProc():
             self.add_event(raw, self.irec)
 
         else:
-            self.proc_block()
-            self.init_proc()
-            self.add_block()
-            sys.stdout.write('1st stage event block processing is completed\n')
+            self.proc_stage1()
             self.add_event(raw, self.irec)
 
         if self.irec > self.nrecs-2:
@@ -533,6 +706,15 @@ def pedestals_calibration(parser):
   logger.info('DataSource kwargs: %s' % str(dskwargs))
   ds = DataSource(**dskwargs)
 
+  comm = bd_comm(ds) # in parallel mode events are split between bigdata ranks
+  rank = 0 if comm is None else comm.Get_rank()
+  if comm is not None:
+      nranks = comm.Get_size()
+      evskip = -(-evskip // nranks)
+      events = -(-events // nranks)
+      logger.info('parallel processing on rank %d of %d bigdata ranks, per rank --evskip=%d --events=%d'%\
+                  (rank, nranks, evskip, events))
+
   t0_sec = time()
   tdt = t0_sec
   dpo = None
@@ -586,11 +768,12 @@ def pedestals_calibration(parser):
               break
 
       if dpo is None:
-         dpo = DarkProc(**kwa)
+         dpo = DarkProc(comm=comm, **kwa)
          dpo.runnum = orun.runnum
          dpo.exp = expname
          dpo.ts_run, dpo.ts_now = ts_run, ts_now #uc.tstamps_run_and_now(env, fmt=uc.TSTAMP_FORMAT)
 
+      ievt = -1
       for ievt,evt in enumerate(step.events()):
         #print('Event %04d' % ievt, end='\r')
         sys.stdout.write('Event %04d\r' % ievt)
@@ -636,16 +819,21 @@ def pedestals_calibration(parser):
       if ievt < events: logger.info('==== Ev:%04d end of events in run %d step %d'%\
                                      (ievt, orun.runnum, istep))
       if True:
-          dpo.summary()
-          ctypes = ('pedestals', 'pixel_rms', 'pixel_status') # 'status_extra'
-          consts = arr_av1, arr_rms, arr_sta = dpo.constants_av1_rms_sta()
-          dic_consts = dict(zip(ctypes, consts))
-          kwa_depl = add_metadata_kwargs(orun, odet, **kwa)
-          kwa_depl['repoman'] = repoman
-          deploy_constants(dic_consts, **kwa_depl)
+          dpo.summary() # collective call in parallel mode
+          if rank == 0:
+              ctypes = ('pedestals', 'pixel_rms', 'pixel_status') # 'status_extra'
+              consts = arr_av1, arr_rms, arr_sta = dpo.constants_av1_rms_sta()
+              dic_consts = dict(zip(ctypes, consts))
+              kwa_depl = add_metadata_kwargs(orun, odet, **kwa)
+              kwa_depl['repoman'] = repoman
+              deploy_constants(dic_consts, **kwa_depl)
           del(dpo)
           dpo=None
 
+      if comm is not None: # all ranks should terminate loops together
+          from mpi4py import MPI
+          break_loop = comm.allreduce(break_loop, op=MPI.LOR)
+
       if break_loop:
         logger.info('terminate_steps')
         break # break step loop
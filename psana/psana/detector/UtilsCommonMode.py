@@ -15,11 +15,22 @@ Usage::
     ucm.common_mode_rows_hsplit_nbanks(data, mask, nbanks=4, cormax=None)
     ucm.common_mode_2d_hsplit_nbanks(data, mask, nbanks=4, cormax=None)
 
+    # vectorized engine for stacks of segments
+    med, npix = ucm.masked_median(lanes, lmask)
+    cmode = ucm.common_mode_lanes(lanes, lmask=None, cormax=None, npix_min=10, algo='median', npix_strict=True)
+    ucm.common_mode_segments(arrf, mask, mode, cormax=None, npix_min=10, nbanks_rows_cols=(2,8), algo='median', nthreads=1)
+
+    Algorithms (algo):
+      'median' - exact median of good pixels by partial selection (the same as np.ma.median)
+      'hist'   - median from per-lane histograms of values rounded to integer ADU (exact for integer data)
+      'mean'   - mean of good pixels with iterative outlier clipping (CM_CLIP_NSIGMA, CM_CLIP_NITER)
+
 This software was developed for the LCLS project.
 If you use all or part of it, please give an appropriate acknowledgment.
 
 Created on 2018-01-31 by Mikhail Dubrovin
 2021-02-02 adopted to LCLS2
+2026-10 vectorized engine w/o masked arrays
 """
 
 import logging
@@ -27,83 +38,195 @@ logger = logging.getLogger(__name__)
 
 import numpy as np
 from math import fabs
+from concurrent.futures import ThreadPoolExecutor
 from psana.detector.NDArrUtils import info_ndarr, print_ndarr
 
+CM_ALGOS = ('median', 'hist', 'mean')
+CM_HIST_MAXBINS = 1<<16 # larger range of values falls back to median
+CM_CLIP_NSIGMA = 3
+CM_CLIP_NITER = 2
+
+
+def masked_median(lanes, lmask=None):
+    """Returns (median, npix) of good (lmask>0) values along the last axis of 2-d lanes,
+       median is the same as np.ma.median (mean of two middle values for even npix),
+       evaluated by partial selection (np.partition) with masked values moved to the end.
+    """
+    nlanes, n = lanes.shape
+    if lmask is None:
+        npix = np.full(nlanes, n, dtype=np.int64)
+        s = lanes.copy()
+    else:
+        good = lmask > 0
+        npix = np.count_nonzero(good, axis=1)
+        big = np.inf if lanes.dtype.kind == 'f' else np.iinfo(lanes.dtype).max
+        s = np.where(good, lanes, lanes.dtype.type(big))
+    lo = np.maximum((npix - 1) // 2, 0)
+    hi = np.minimum(npix // 2, n - 1)
+    if n > 0:
+        s.partition(np.unique(np.concatenate((lo, hi))), axis=1)
+    else:
+        return np.zeros(nlanes, dtype=lanes.dtype), npix
+    a = np.take_along_axis(s, lo[:,None], axis=1)[:,0]
+    b = np.take_along_axis(s, hi[:,None], axis=1)[:,0]
+    return np.where(npix % 2 == 1, a, (a + b) / 2), npix
+
+
+def _hist_median(lanes, lmask=None):
+    """Median of good values rounded to integers, from per-lane histograms (exact for integer-valued data)."""
+    nlanes, n = lanes.shape
+    good = np.ones(lanes.shape, dtype=bool) if lmask is None else lmask > 0
+    npix = np.count_nonzero(good, axis=1)
+    if not npix.any(): return np.zeros(nlanes), npix
+    vals = np.rint(lanes).astype(np.int64)
+    vmin, vmax = vals[good].min(), vals[good].max()
+    nbins = int(vmax - vmin + 1)
+    if nbins > CM_HIST_MAXBINS:
+        logger.debug('_hist_median: range of values %d is too large, use median' % nbins)
+        return masked_median(lanes, lmask)
+    inds = (vals - vmin) + np.arange(nlanes, dtype=np.int64)[:,None] * nbins
+    counts = np.bincount(inds[good], minlength=nlanes*nbins).reshape(nlanes, nbins)
+    cum = np.cumsum(counts, axis=1)
+    lo = np.maximum((npix - 1) // 2, 0)
+    hi = npix // 2
+    a = np.argmax(cum > lo[:,None], axis=1) + vmin
+    b = np.argmax(cum > hi[:,None], axis=1) + vmin
+    return np.where(npix % 2 == 1, a, (a + b) / 2), npix
+
+
+def _clipped_mean(lanes, lmask=None, nsigma=CM_CLIP_NSIGMA, niter=CM_CLIP_NITER):
+    """Mean of good values with outliers beyond nsigma standard deviations removed in niter iterations."""
+    good = np.ones(lanes.shape, dtype=bool) if lmask is None else lmask > 0
+    for it in range(niter + 1):
+        npix = np.count_nonzero(good, axis=1)
+        n = np.maximum(npix, 1)
+        mean = np.sum(lanes, axis=1, where=good, dtype=np.float64) / n
+        if it == niter: break
+        dev = lanes - mean[:,None]
+        std = np.sqrt(np.sum(dev*dev, axis=1, where=good, dtype=np.float64) / n)
+        good = good & (np.fabs(dev) <= nsigma * std[:,None])
+    return mean.astype(lanes.dtype) if lanes.dtype.kind == 'f' else mean, npix
+
+
+def common_mode_lanes(lanes, lmask=None, cormax=None, npix_min=10, algo='median', npix_strict=True):
+    """Returns common mode per lane (row of 2-d lanes) evaluated for good (lmask>0) values,
+       0 for lanes with number of good values <= npix_min (npix_strict) or < npix_min,
+       or with absolute common mode >= cormax (if not None).
+    """
+    if   algo == 'median': cmode, npix = masked_median(lanes, lmask)
+    elif algo == 'hist':   cmode, npix = _hist_median(lanes, lmask)
+    elif algo == 'mean':   cmode, npix = _clipped_mean(lanes, lmask)
+    else: raise ValueError('common mode algorithm "%s" is not in %s' % (algo, str(CM_ALGOS)))
+    ok = (npix > npix_min) if npix_strict else ((npix >= npix_min) & (npix > 0))
+    if cormax is not None:
+        ok &= np.fabs(cmode) < cormax
+    return np.where(ok, cmode, 0).astype(cmode.dtype)
+
+
+def _subtract(data, cmode, mask):
+    """In-place data -= cmode (broadcasted) for good pixels in mask."""
+    if mask is None: np.subtract(data, cmode, out=data, casting='unsafe')
+    else:            np.subtract(data, cmode, out=data, where=mask>0, casting='unsafe')
+
+
+def _halves(rows, nbanks_rows):
+    step = int(rows/nbanks_rows)
+    return [(i*step, rows if i==nbanks_rows-1 else (i+1)*step) for i in range(nbanks_rows)]
+
+
+def _common_mode_stack(a, m, mode, cormax, npix_min, nbanks_rows_cols, algo):
+    """Common mode correction of contiguous stack a (<nsegs>, <rows>, <cols>) with mask m of the same shape."""
+    nsegs, rows, cols = a.shape
+    nbr, nbc = nbanks_rows_cols
+    bcols = cols // nbc
+    a4 = a.reshape(nsegs, rows, nbc, bcols)
+    m4 = m.reshape(nsegs, rows, nbc, bcols)
+
+    if mode & 4: # in banks: (rows/nbr, cols/nbc) pixels
+        for r0, r1 in _halves(rows, nbr):
+            b, mb = a4[:,r0:r1], m4[:,r0:r1]
+            cmode = common_mode_lanes(b.transpose(0,2,1,3).reshape(nsegs*nbc, -1),\
+                                      mb.transpose(0,2,1,3).reshape(nsegs*nbc, -1),\
+                                      cormax=cormax, npix_min=npix_min, algo=algo, npix_strict=False)
+            _subtract(b, cmode.reshape(nsegs, 1, nbc, 1), mb)
+
+    if mode & 1: # in rows per bank: cols/nbc pixels
+        cmode = common_mode_lanes(a4.reshape(-1, bcols), m4.reshape(-1, bcols),\
+                                  cormax=cormax, npix_min=npix_min, algo=algo)
+        _subtract(a4, cmode.reshape(nsegs, rows, nbc, 1), m4)
+
+    if mode & 2: # in cols per bank: rows/nbr pixels
+        for r0, r1 in _halves(rows, nbr):
+            b, mb = a[:,r0:r1], m[:,r0:r1]
+            cmode = common_mode_lanes(b.transpose(0,2,1).reshape(nsegs*cols, -1),\
+                                      mb.transpose(0,2,1).reshape(nsegs*cols, -1),\
+                                      cormax=cormax, npix_min=npix_min, algo=algo)
+            _subtract(b, cmode.reshape(nsegs, 1, cols), mb)
+
+
+def common_mode_segments(arrf, mask, mode, cormax=None, npix_min=10, nbanks_rows_cols=(2,8), algo='median', nthreads=1):
+    """Vectorized common mode correction of arrf (float) shaped as (<nsegs>, <rows>, <cols>) or (..., <rows>, <cols>).
+       The same as loop over segments in common_mode_apply, but for all segments at once:
+       mode bitword 4/1/2 - correction in banks / in rows per bank / in columns per bank,
+       for (nbr, nbc) = nbanks_rows_cols banks of (rows/nbr, cols/nbc) pixels.
+       Pixels with mask>0 are used and corrected (mask=None - all pixels).
+       nthreads>1 - segments are split between threads (numpy releases GIL in sorting).
+    """
+    if mode <= 0: return arrf
+    shape = arrf.shape
+    a = np.ascontiguousarray(arrf).reshape((-1,) + shape[-2:])
+    m = np.ones(a.shape, dtype=np.uint8) if mask is None else\
+        np.ascontiguousarray(np.broadcast_to(mask, shape)).reshape(a.shape)
+    nsegs = a.shape[0]
+    nthreads = max(1, min(nthreads, nsegs))
+    if nthreads == 1:
+        _common_mode_stack(a, m, mode, cormax, npix_min, nbanks_rows_cols, algo)
+    else:
+        bounds = np.linspace(0, nsegs, nthreads+1).astype(int)
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            list(executor.map(lambda i: _common_mode_stack(a[bounds[i]:bounds[i+1]], m[bounds[i]:bounds[i+1]],\
+                              mode, cormax, npix_min, nbanks_rows_cols, algo), range(nthreads)))
+    if not np.shares_memory(a, arrf):
+        arrf[...] = a.reshape(shape)
+    return arrf
+
 
-def common_mode_rows(arr, mask=None, cormax=None, npix_min=10):
+def common_mode_rows(arr, mask=None, cormax=None, npix_min=10, algo='median'):
     """Defines and applys common mode correction to 2-d arr for rows.
        I/O parameters:
        - arr (float) - i/o 2-d array of intensities
        - mask (int or None) - the same shape 2-d array of bad/good = 0/1 pixels
        - cormax (float or None) - maximal allowed correction in ADU
        - npix_min (int) - minimal number of good pixels in row to evaluate and apply correction
+       - algo (str) - common mode algorithm, one of CM_ALGOS
     """
-    rows, cols = arr.shape
-    if mask is None:
-        cmode = np.median(arr,axis=1) # column of median values
-    else:
-        marr = np.ma.array(arr, mask=mask<1) # use boolean inverted mask (True for masked pixels)
-        cmode = np.ma.median(marr,axis=1) # column of median values for masked array
-        npix = mask.sum(axis=1) # count good pixels in each row
-        #print('npix', npix[:100])
-        cmode = np.select((npix>npix_min,), (cmode,), default=0)
-
-    if cormax is not None:
-        cmode = np.select((np.fabs(cmode) < cormax,), (cmode,), default=0)
-
-    #logger.debug(info_ndarr(cmode, 'cmode'))
-    _,m2 = np.meshgrid(np.zeros(cols, dtype=np.int16), cmode) # stack cmode 1-d column to 2-d matrix
-    if mask is None:
-        arr -= m2
-    else:
-        bmask = mask>0
-        arr[bmask] -= m2[bmask]
+    cmode = common_mode_lanes(arr, mask, cormax=cormax, npix_min=(-1 if mask is None else npix_min), algo=algo)
+    _subtract(arr, cmode[:,None], mask)
 
 
-def common_mode_cols(arr, mask=None, cormax=None, npix_min=10):
+def common_mode_cols(arr, mask=None, cormax=None, npix_min=10, algo='median'):
     """Defines and applys common mode correction to 2-d arr for cols.
        I/O parameters:
        - arr (float) - i/o 2-d array of intensities
        - mask (int or None) - the same shape 2-d array of bad/good = 0/1 pixels
        - cormax (float or None) - maximal allowed correction in ADU
        - npix_min (int) - minimal number of good pixels in column to evaluate and apply correction
+       - algo (str) - common mode algorithm, one of CM_ALGOS
     """
-    rows, cols = arr.shape
-    if mask is None:
-        cmode = np.median(arr,axis=0)
-    else:
-        marr = np.ma.array(arr, mask=mask<1) # use boolean inverted mask (True for masked pixels)
-        cmode = np.ma.median(marr,axis=0) # row of median values for masked array
-        npix = mask.sum(axis=0) # count good pixels in each column
-        cmode = np.select((npix>npix_min,), (cmode,), default=0)
+    cmode = common_mode_lanes(arr.T, None if mask is None else mask.T, cormax=cormax,\
+                              npix_min=(-1 if mask is None else npix_min), algo=algo)
+    _subtract(arr, cmode[None,:], mask)
 
-    if cormax is not None:
-        cmode = np.select((np.fabs(cmode) < cormax,), (cmode,), default=0)
 
-    #logger.debug(info_ndarr(cmode, 'cmode'))
-    m1,_ = np.meshgrid(cmode, np.zeros(rows, dtype=np.int16)) # stack cmode 1-d row to 2-d matrix
-    if mask is None:
-        arr -= m1
-    else:
-        bmask = mask>0
-        arr[bmask] -= m1[bmask]
-
-
-def common_mode_2d(arr, mask=None, cormax=None, npix_min=10):
+def common_mode_2d(arr, mask=None, cormax=None, npix_min=10, algo='median'):
     """Defines and applys common mode correction to entire 2-d arr using the same shape mask.
     """
     if mask is None:
-        cmode = np.median(arr)
-        if cormax is None or fabs(cmode) < cormax:
-            arr -= cmode
+        cmode = common_mode_lanes(arr.reshape(1,-1), None, cormax=cormax, npix_min=-1, algo=algo)
     else:
-        arr1 = np.ones_like(arr, dtype=np.int16)
-        bmask = mask>0
-        npix = arr1[bmask].sum()
-        if npix < npix_min: return
-        cmode = np.median(arr[bmask])
-        if cormax is None or fabs(cmode) < cormax:
-            arr[bmask] -= cmode
+        cmode = common_mode_lanes(arr.reshape(1,-1), mask.reshape(1,-1), cormax=cormax, npix_min=npix_min,\
+                                  algo=algo, npix_strict=False)
+    _subtract(arr, cmode[0], mask)
 
 
 def common_mode_rows_hsplit_nbanks(data, mask=None, nbanks=4, cormax=None, npix_min=10):
@@ -141,7 +264,7 @@ def common_mode_2d_hsplit_nbanks(data, mask=None, nbanks=4, cormax=None, npix_mi
     data[:] = np.hstack(bdata)[:]
 
 
-def common_mode_apply(arrf, mask, cmpars=(0,7,100,10), nbanks_rows_cols=(2,8)):
+def common_mode_apply(arrf, mask, cmpars=(0,7,100,10), nbanks_rows_cols=(2,8), algo='median', nthreads=1):
     """Applies common mode correction to arrf (=raw-peds), shape=(<number-of-segments>, 704, 768).
     Example of epix100: shape=(1, 704, 768), nbanks_rows_cols=(2,8).
     If multiple correction is selected it is applied in particular order - in banks, in rows per bank, in columns per bank.
@@ -157,27 +280,16 @@ def common_mode_apply(arrf, mask, cmpars=(0,7,100,10), nbanks_rows_cols=(2,8)):
           [2] - (float) absolute maximal allowed correction. Correction is not applied if exceeds this value.
           [3] - (uint) minimal number of (anmasked) pixels to evaluate correction.
        nbanks_rows_cols (tuple of uint) = (2,8) for epix100
+       algo (str) - common mode algorithm, one of CM_ALGOS
+       nthreads (int) - number of threads sharing segments
     """
 
     if cmpars is None: return
     alg, mode, cormax = int(cmpars[0]), int(cmpars[1]), cmpars[2]
     npixmin = cmpars[3] if len(cmpars)>3 else 10
 
-    nbr, nbc = nbanks_rows_cols
-    hrows = int(arrf.shape[1]/nbr) # 704/2=352
-
-    if mode>0:
-      for s in range(arrf.shape[0]):
-
-        if mode & 4: # in banks: (704/2,768/8)=(352,96) pixels
-          common_mode_2d_hsplit_nbanks(arrf[s,:hrows,:], mask=mask[s,:hrows,:], nbanks=nbc, cormax=cormax, npix_min=npixmin)
-          common_mode_2d_hsplit_nbanks(arrf[s,hrows:,:], mask=mask[s,hrows:,:], nbanks=nbc, cormax=cormax, npix_min=npixmin)
-
-        if mode & 1: # in rows per bank: 768/8 = 96 pixels # ?ms
-          common_mode_rows_hsplit_nbanks(arrf[s,], mask=mask[s,], nbanks=nbc, cormax=cormax, npix_min=npixmin)
-
-        if mode & 2: # in cols per bank: 704/2 = 352 pixels # ?ms
-          common_mode_cols(arrf[s,:hrows,:], mask=mask[s,:hrows,:], cormax=cormax, npix_min=npixmin)
-          common_mode_cols(arrf[s,hrows:,:], mask=mask[s,hrows:,:], cormax=cormax, npix_min=npixmin)
+    # in banks: (704/2,768/8)=(352,96) pixels, in rows per bank: 768/8 = 96 pixels, in cols per bank: 704/2 = 352 pixels
+    common_mode_segments(arrf, mask, mode, cormax=cormax, npix_min=npixmin, nbanks_rows_cols=nbanks_rows_cols,\
+                         algo=algo, nthreads=nthreads)
 
 # EOF
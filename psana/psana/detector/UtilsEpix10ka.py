@@ -30,6 +30,8 @@ Usage::
     calib = calib_epix10ka_any(det_raw, evt, cmpars=None, **kwa)
     calib = calib_epix10ka_any(det_raw, evt, cmpars=(7,2,100,10),\
                             mbits=0o7, mask=None, edge_rows=10, edge_cols=10, center_rows=5, center_cols=5)
+    calib = calib_epix10ka_batch(det_raw, evts, out=None, cmpars=None, **kwa) # shape:(<nevts>, <nsegs>, 352, 384)
+    calib = calib_epix10ka_ext(det_raw, raw, store, out=None) # compiled kernel, used in both above if available
 
 This software was developed for the LCLS project.
 If you use all or part of it, please give an appropriate acknowledgment.
@@ -47,8 +49,12 @@ logger = logging.getLogger(__name__)
 
 from psana.detector.NDArrUtils import info_ndarr, divide_protected
 from psana.detector.UtilsMask import merge_masks, DTYPE_MASK
-from psana.detector.UtilsCommonMode import common_mode_cols,\
-  common_mode_rows_hsplit_nbanks, common_mode_2d_hsplit_nbanks
+from psana.detector.UtilsCommonMode import common_mode_segments
+
+try:
+    import calibalgos_ext # compiled kernels from psana/pycalgos/CalibAlgos.cc
+except ImportError:
+    calibalgos_ext = None
 
 GAIN_MODES    = ['FH','FM','FL','AHL-H','AML-M','AHL-L','AML-L']
 GAIN_MODES_IN = ['FH','FM','FL','AHL-H','AML-M']
@@ -128,6 +134,23 @@ class Storage:
                     +info_ndarr(self.mask, '\n  mask')\
                     +'\n  common-mode correction parameters cmpars: %s' % str(self.cmpars))
 
+        self.cbits_config = None  # for batches, cached in calib_epix10ka_batch
+        self.peds_ext = None
+        self.gfac_ext = None
+        self.cbits_u8 = None # for calib_epix10ka_ext
+        self.mask_u8 = None
+
+
+    def constants_for_grinds(self):
+        """Returns cached float32 (peds, gfac) shaped as (8, <nsegs>, 352, 384), where
+           constants for gain range index 7 are the defaults for pixels not matching any gain map.
+        """
+        if self.peds_ext is None and self.peds is not None:
+            self.peds_ext = np.concatenate((self.peds, np.zeros((1,) + self.peds.shape[1:])), axis=0).astype(np.float32)
+        if self.gfac_ext is None and self.gfac is not None:
+            self.gfac_ext = np.concatenate((self.gfac, np.ones((1,) + self.gfac.shape[1:])), axis=0).astype(np.float32)
+        return self.peds_ext, self.gfac_ext
+
 
 def config_object_det(det, detname=None):
     """Returns [dict]={<seg-index>:<cob>} of configuration objects for detector with optional name.
@@ -557,6 +580,59 @@ def print_gmaps_info(gmaps):
       (info_gain_mode_arrays(gmaps), info_pixel_gain_mode_statistics(gmaps)))
 
 
+def calib_epix10ka_ext(det_raw, raw, store, out=None):
+    """
+    The same as calib_epix10ka_any with compiled kernels from calibalgos_ext:
+    gain bits decode, pedestal subtraction, gain factor and mask in one pass over raw data
+    and median common mode correction w/o masked arrays.
+
+    Parameters
+    ----------
+    - det_raw (psana.Detector.raw) - Detector.raw object
+    - raw (np.ndarray, dtype=np.uint16) - raw data shaped as (<nsegs>, 352, 384) or (<nevts>, <nsegs>, 352, 384)
+    - store (Storage) - cached parameters
+    - out (np.ndarray, dtype=np.float32) - optional pre-allocated output array shaped as raw
+
+    Returns
+    -------
+      - calibrated data, np.float32 array shaped as raw or None
+    """
+    if store.cbits_u8 is None:
+        if store.cbits_config is None:
+            store.cbits_config = det_raw._cbits_config_detector()
+        if store.cbits_config is None:
+            logger.debug('cbits is None')
+            return None
+        store.cbits_u8 = np.ascontiguousarray(store.cbits_config, dtype=np.uint8)
+        store.mask_u8 = None if store.mask is None else np.ascontiguousarray(store.mask, dtype=np.uint8)
+    peds, gfac = store.constants_for_grinds()
+    if gfac is None:
+        logger.warning('gain factor is None - substitute with 1')
+
+    raw = np.ascontiguousarray(raw, dtype=np.uint16)
+    if out is None:
+        out = np.empty(raw.shape, dtype=np.float32)
+    elif out.shape != raw.shape:
+        raise ValueError('out.shape %s is not equal to the raw shape %s' % (str(out.shape), str(raw.shape)))
+
+    cmpars = store.cmpars
+    mode = 0 if cmpars is None else int(cmpars[1])
+    kwargs = dict(data_bit_mask=det_raw._data_bit_mask, data_gain_bit=det_raw._data_gain_bit,\
+                  gain_bit_shift=det_raw._gain_bit_shift)
+    if mode > 0:
+        grinds = np.empty(raw.shape, dtype=np.uint8)
+        cmmask = np.empty(raw.shape, dtype=np.uint8)
+        calibalgos_ext.calib_epix_multigain(raw, store.cbits_u8, peds, None, store.mask_u8, out, grinds, cmmask,\
+                                            cm_hm_only=int(cmpars[0])==7, **kwargs)
+        calibalgos_ext.common_mode_epix_multigain(out, cmmask, mode, cormax=cmpars[2],\
+                                                  npix_min=int(cmpars[3]) if len(cmpars)>3 else 10)
+        if gfac is not None: # mask is already applied by calib_epix_multigain
+            calibalgos_ext.apply_gain_factor(out, grinds, gfac, None)
+    else:
+        calibalgos_ext.calib_epix_multigain(raw, store.cbits_u8, peds, gfac, store.mask_u8, out, **kwargs)
+    return out
+
+
 def calib_epix10ka_any(det_raw, evt, cmpars=None, **kwa): #cmpars=(7,2,100)):
     """
     Algorithm
@@ -593,6 +669,11 @@ def calib_epix10ka_any(det_raw, evt, cmpars=None, **kwa): #cmpars=(7,2,100)):
         logger.debug('raw is None')
         return None
 
+    if calibalgos_ext is not None and nda_raw is None and raw.dtype == np.uint16:
+        store = Storage(det_raw, cmpars, **kwa) if det_raw._store_ is None else det_raw._store_
+        store.counter += 1
+        return calib_epix10ka_ext(det_raw, raw, store)
+
     gmaps = gain_maps_epix10ka_any(det_raw, evt) #tuple: 7 x shape:(4, 352, 384)
     if gmaps is None:
         logger.debug('gmaps is None')
@@ -621,8 +702,83 @@ def calib_epix10ka_any(det_raw, evt, cmpars=None, **kwa): #cmpars=(7,2,100)):
     return arrf * factor if mask is None else arrf * factor * mask # gain correction
 
 
-def common_mode_epix_multigain_apply(arrf, gmaps, store):
-    """Apply common mode correction to arrf."""
+def gain_range_index_for_gmaps(gmaps, out=None, default=7):
+    """Returns uint8 array of gain range indices like np.select(gmaps, (0,...,6), default) w/o int64 temporaries."""
+    if out is None: out = np.empty(gmaps[0].shape, dtype=np.uint8)
+    out.fill(default)
+    for i in range(len(gmaps)-1, -1, -1): # the first matching gain map wins as in np.select
+        np.putmask(out, gmaps[i], i)
+    return out
+
+
+def calib_epix10ka_batch(det_raw, evts, out=None, cmpars=None, **kwa):
+    """
+    The same as calib_epix10ka_any for a batch of events.
+
+    Raw data of all events are copied to the re-used buffer (<nevts>, <nsegs>, 352, 384),
+    gain range indices, pedestals and gain factors are evaluated for the entire batch
+    by single numpy operations, as well as common mode correction (if turned on).
+
+    Parameters
+    ----------
+    - det_raw (psana.Detector.raw) - Detector.raw object
+    - evts (list of psana.Event) - batch of events
+    - out (np.ndarray) - optional pre-allocated output array (<nevts>, <nsegs>, 352, 384) of float type
+    - cmpars, **kwa - the same as in calib_epix10ka_any
+
+    Returns
+    -------
+      - calibrated epix10ka data shaped as (<nevts>, <nsegs>, 352, 384) or None
+    """
+    evts = list(evts)
+    raw = det_raw._raw_batch(evts, bufname='raw')
+    if raw is None:
+        logger.debug('raw is None')
+        return None
+
+    store = Storage(det_raw, cmpars, **kwa) if det_raw._store_ is None else det_raw._store_
+    if calibalgos_ext is not None and raw.dtype == np.uint16 and\
+       (out is None or (out.dtype == np.float32 and out.flags.c_contiguous)):
+        return calib_epix10ka_ext(det_raw, raw, store, out=out)
+
+    if store.cbits_config is None:
+        store.cbits_config = det_raw._cbits_config_detector()
+    cbits = cbits_config_and_data_detector_alg(raw, store.cbits_config, det_raw._data_gain_bit, det_raw._gain_bit_shift)
+    gmaps = gain_maps_epix10ka_any_alg(cbits)
+    if gmaps is None:
+        logger.debug('gmaps is None')
+        return None
+
+    grinds = gain_range_index_for_gmaps(gmaps, out=det_raw._batch_buffer('grinds', raw.shape, np.uint8))
+    peds, gfac = store.constants_for_grinds()
+    cons = det_raw._batch_buffer('cons', raw.shape, np.float32)
+
+    if out is None:
+        out = np.empty(raw.shape, dtype=np.float32)
+    elif out.shape != raw.shape:
+        raise ValueError('out.shape %s is not equal to the batch shape %s' % (str(out.shape), str(raw.shape)))
+
+    np.bitwise_and(raw, det_raw._data_bit_mask, out=raw)
+    out[:] = raw
+    if peds is not None:
+        out -= np.choose(grinds, peds, out=cons)
+
+    if store.cmpars is not None:
+        common_mode_epix_multigain_apply(out, gmaps, store)
+
+    if gfac is None:
+        logger.warning('gain factor is None - substitute with 1')
+    else:
+        out *= np.choose(grinds, gfac, out=cons)
+    if store.mask is not None:
+        out *= store.mask
+    return out
+
+
+def common_mode_epix_multigain_apply(arrf, gmaps, store, algo='median', nthreads=1):
+    """Apply common mode correction to arrf shaped as (<nsegs>, 352, 384) or (<nevts>, <nsegs>, 352, 384)
+       for all segments at once (see UtilsCommonMode.common_mode_segments).
+    """
     cmpars, mask = store.cmpars, store.mask
     logger.debug('in common_mode_epix_multigain_apply for cmpars=%s' % str(cmpars))
     alg, mode, cormax = int(cmpars[0]), int(cmpars[1]), cmpars[2]
@@ -633,28 +789,16 @@ def common_mode_epix_multigain_apply(arrf, gmaps, store):
       gr0, gr1, gr2, gr3, gr4, gr5, gr6 = gmaps
       grhm = np.select((gr0,  gr1,  gr3,  gr4), (arr1, arr1, arr1, arr1), default=0) if alg==7 else arr1
       gmask = np.bitwise_and(grhm, mask) if mask is not None else grhm
-      #logger.debug(info_ndarr(arr1, '\n  arr1'))
-      #logger.debug(info_ndarr(grhm, 'XXXX grhm'))
-      #logger.debug(info_ndarr(gmask, 'XXXX gmask'))
-      #logger.debug('common-mode mask massaging (sec) = %.6f' % (time()-t2_sec_cm)) # 5msec
       logger.debug(info_ndarr(gmask, 'gmask')\
-                   + '\n  per panel statistics of cm-corrected pixels: %s' % str(np.sum(gmask, axis=(1,2), dtype=np.uint32)))
+                   + '\n  per panel statistics of cm-corrected pixels: %s' % str(np.sum(gmask, axis=(-2,-1), dtype=np.uint32)))
 
       #sh = (nsegs, 288, 384) # epixhr
       #sh = (nsegs, 352, 384) # epix10ka
-      hrows = int(arrf.shape[1]/2) # 176 for epix10ka or 144 for epixhr # int(352/2)
-      for s in range(arrf.shape[0]):
-
-        if mode & 4: # in banks: (352/2,384/8)=(176,48) pixels
-          common_mode_2d_hsplit_nbanks(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], nbanks=8, cormax=cormax, npix_min=npixmin)
-          common_mode_2d_hsplit_nbanks(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], nbanks=8, cormax=cormax, npix_min=npixmin)
-
-        if mode & 1: # in rows per bank: 384/8 = 48 pixels # 190ms
-          common_mode_rows_hsplit_nbanks(arrf[s,], mask=gmask[s,], nbanks=8, cormax=cormax, npix_min=npixmin)
-
-        if mode & 2: # in cols per bank: 352/2 = 176 pixels # 150ms
-          common_mode_cols(arrf[s,:hrows,:], mask=gmask[s,:hrows,:], cormax=cormax, npix_min=npixmin)
-          common_mode_cols(arrf[s,hrows:,:], mask=gmask[s,hrows:,:], cormax=cormax, npix_min=npixmin)
+      # mode & 4 - in banks: (352/2,384/8)=(176,48) pixels
+      # mode & 1 - in rows per bank: 384/8 = 48 pixels # 190ms
+      # mode & 2 - in cols per bank: 352/2 = 176 pixels # 150ms
+      common_mode_segments(arrf, gmask, mode, cormax=cormax, npix_min=npixmin, nbanks_rows_cols=(2,8),\
+                           algo=algo, nthreads=nthreads)
 
       #logger.debug('TIME common-mode correction = %.6f sec for cmpars=%s' % (time()-t0_sec_cm, str(cmpars)))
 
@@ -12,6 +12,8 @@ Usage::
   a = o._segment_numbers  # alias of o._sorted_segment_ids, where ids is misleading
   a = o._det_calibconst()
 
+  # arrays of constants for daq segments are cached and shared: they are read-only,
+  # use a.copy() to get an array that can be modified in place
   a = o._pedestals(all_segs=False)
   a = o._gain(all_segs=False)
   a = o._rms(all_segs=False)
@@ -50,6 +52,9 @@ Usage::
   a = o.calib(evt, **kwa)
   a = o.image(self, evt, nda=None, value_for_missing_segments=None, **kwa)
 
+  a = o.raw_batch(evts, out=None)   # shape: (<nevts>, <nsegs>, <rows>, <cols>)
+  a = o.calib_batch(evts, out=None, **kwa)
+
 2020-11-06 created by Mikhail Dubrovin
 """
 
@@ -87,6 +92,8 @@ class AreaDetector(DetectorImpl):
         self._store_ = None  # detector dependent storage of cached parameters for method calib
         self._geo = None
         self._segment_numbers = self._sorted_segment_ids  # [0, 1, 2,... 17, 18, 19]
+        self._batch_bufs_ = {} # arrays re-used by batch methods
+        self._daq_segs_cons_ = {} # {(ctype, dtype): (constants for all segments, read-only constants for daq segments)}
 
 
     def raw(self, evt) -> Array3d:
@@ -109,6 +116,65 @@ class AreaDetector(DetectorImpl):
         return np.stack([segs[k].raw for k in self._segment_numbers])
 
 
+    def _batch_buffer(self, name, shape, dtype):
+        """Returns cached array for batch methods, re-allocated only if it is too small for shape or of different dtype."""
+        buf = self._batch_bufs_.get(name, None)
+        if buf is None or buf.dtype != dtype or buf.shape[1:] != tuple(shape[1:]) or buf.shape[0] < shape[0]:
+            logger.debug('AreaDetector._batch_buffer - allocate %s shape: %s dtype: %s' % (name, str(shape), str(dtype)))
+            buf = np.empty(shape, dtype=dtype)
+            self._batch_bufs_[name] = buf
+        return buf[:shape[0]]
+
+
+    def _raw_batch(self, evts, out=None, bufname=None):
+        """Fills out (or cached buffer bufname, or new array) with raw data of evts shaped as (<nevts>,) + raw shape.
+           Segment data are copied directly unless method raw is re-implemented in the derived class.
+           Events without data are filled with 0.
+        """
+        by_segs = type(self).raw is AreaDetector.raw
+        segnums = self._segment_numbers
+        if by_segs:
+            lst_data = [None if evt is None else self._segments(evt) for evt in evts]
+        else:
+            lst_data = [self.raw(evt) for evt in evts]
+        data0 = next((data for data in lst_data if data is not None), None)
+        if is_none(data0, 'no data in batch of %d events' % len(evts)): return None
+        raw0 = data0[segnums[0]].raw if by_segs else data0
+        shape = (len(evts), len(segnums)) + raw0.shape if by_segs else (len(evts),) + raw0.shape
+        if out is None:
+            out = self._batch_buffer(bufname, shape, raw0.dtype) if bufname is not None else\
+                  np.empty(shape, dtype=raw0.dtype)
+        elif out.shape != shape:
+            raise ValueError('out.shape %s is not equal to the batch shape %s' % (str(out.shape), str(shape)))
+        for i, data in enumerate(lst_data):
+            if data is None:
+                out[i] = 0
+            elif by_segs:
+                for j, k in enumerate(segnums):
+                    out[i,j] = data[k].raw
+            else:
+                out[i] = data
+        return out
+
+
+    def raw_batch(self, evts, out=None) -> np.ndarray:
+        """
+        Returns 4-d numpy array of segment data for a batch of events
+        (events without data are filled with 0).
+
+        Parameters
+        ----------
+        evts: list of psana event objects
+        out: np.array, optional
+            pre-allocated array shaped as (<nevts>,) + shape of raw to fill.
+
+        Returns
+        -------
+        raw data: np.array, ndim=4, shape: (<nevts>, <nsegs>, <rows>, <cols>)
+        """
+        return self._raw_batch(list(evts), out=out)
+
+
     def _maskalgos(self, **kwa):
         if self._maskalgos_ is None:
             logger.debug('AreaDetector._maskalgos - make MaskAlgos')
@@ -136,15 +202,44 @@ class AreaDetector(DetectorImpl):
                np.take(arr, self._segment_numbers, axis=-3)
 
 
+    def _daq_segs_slice(self):
+        """Returns slice of daq segments if they are contiguous, otherwise None."""
+        segnums = self._segment_numbers
+        if len(segnums) and list(segnums) == list(range(segnums[0], segnums[0] + len(segnums))):
+            return slice(segnums[0], segnums[0] + len(segnums))
+        return None
+
+
+    def _cons_for_daq_segments(self, ctype, arr, **kwa):
+        """Returns cached read-only constants of ctype for daq segments.
+           Sub-array is evaluated once per array of constants - as a view if daq segments are contiguous,
+           otherwise as a copy by np.take.
+        """
+        if kwa.get('all_segs', False) or arr.ndim < 3:
+            return self._arr_for_daq_segments(arr, **kwa)
+        key = (ctype, kwa.get('dtype', None))
+        arr_all, arr_daq = self._daq_segs_cons_.get(key, (None, None))
+        if arr_all is not arr:
+            logger.debug('AreaDetector._cons_for_daq_segments - cache constants for %s' % ctype)
+            sl = self._daq_segs_slice()
+            arr_daq = arr[..., sl, :, :] if sl is not None else self._arr_for_daq_segments(arr, **kwa)
+            arr_daq.setflags(write=False)
+            self._daq_segs_cons_[key] = (arr, arr_daq)
+        return arr_daq
+
+
     def _det_calibconst(self, metname, **kwa):
-        """Returns constants of ctype metname for daq segments of for entire detector is all_segs=True."""
+        """Returns constants of ctype metname for daq segments of for entire detector is all_segs=True.
+           Arrays for daq segments are cached and shared by all callers, they are read-only
+           (unlike the copies returned before caching) - use .copy() to modify them in place.
+        """
         logger.debug('AreaDetector._det_calibconst')
         o = self._calibconstants(**kwa)
         if is_none(o, 'self._calibconstants is None', logger_method=logger.debug):
             return None
         cc_for_ctype = getattr(o, metname)(**kwa)
         return cc_for_ctype if not isinstance(cc_for_ctype, np.ndarray) else\
-               self._arr_for_daq_segments(cc_for_ctype, **kwa)
+               self._cons_for_daq_segments(metname, cc_for_ctype, **kwa)
 
 
     def _pedestals(self, **kwa):   return self._det_calibconst('pedestals', **kwa)
@@ -253,6 +348,51 @@ class AreaDetector(DetectorImpl):
         return arr*gfac if gfac != 1 else arr
 
 
+    def calib_batch(self, evts, out=None, **kwa) -> np.ndarray:
+        """Returns calibrated data for a batch of events: calib = (raw - peds) * gfac
+           as 4-d array (<nevts>,) + shape of raw, dtype=np.float32 (or dtype of out).
+           Constants are retrieved once per batch and applied by a single operation for all events,
+           out (if specified) and internal raw buffer are re-used.
+           Should be overridden along with calib for more complicated cases.
+        """
+        evts = list(evts)
+        if type(self).calib is not AreaDetector.calib:
+            return self._calib_batch_per_event(evts, out=out, **kwa)
+
+        raw = self._raw_batch(evts, bufname='raw')
+        if is_none(raw, 'det.raw._raw_batch(evts) is None'): return None
+        if out is None:
+            out = np.empty(raw.shape, dtype=np.float32)
+        elif out.shape != raw.shape:
+            raise ValueError('out.shape %s is not equal to the batch shape %s' % (str(out.shape), str(raw.shape)))
+
+        peds = self._pedestals()
+        if is_none(peds, 'det.raw._pedestals() is None - return det.raw.raw_batch(evts)'):
+            out[:] = raw
+            return out
+
+        np.subtract(raw, peds, out=out, casting='unsafe')
+        gfac = self._gain_factor()
+        if isinstance(gfac, np.ndarray) or gfac != 1:
+            np.multiply(out, gfac, out=out, casting='unsafe')
+        return out
+
+
+    def _calib_batch_per_event(self, evts, out=None, **kwa):
+        """Fills out with self.calib(evt, **kwa) for each event - fallback for detectors with re-implemented calib."""
+        lst_nda = [self.calib(evt, **kwa) for evt in evts]
+        nda0 = next((nda for nda in lst_nda if nda is not None), None)
+        if is_none(nda0, 'no calibrated data in batch of %d events' % len(evts)): return None
+        shape = (len(evts),) + nda0.shape
+        if out is None:
+            out = np.empty(shape, dtype=np.float32)
+        elif out.shape != shape:
+            raise ValueError('out.shape %s is not equal to the batch shape %s' % (str(out.shape), str(shape)))
+        for i, nda in enumerate(lst_nda):
+            out[i] = 0 if nda is None else nda
+        return out
+
+
     def _substitute_value_for_missing_segments(self, nda_daq, value) -> Array3d:
         nsegs_tot = self._number_of_segments_total()
         nsegs_daq = self._number_of_segments_daq()
@@ -27,6 +27,7 @@ Usage::
   v = o.pixel_coords(**kwa)
   v = o.pixel_coord_indexes(**kwa)
   v = o.cached_pixel_coord_indexes(segnums, **kwa)
+  v = o.image_plan()
   v = o.pix_rc()
   v = o.pix_xyz()
   v = o.interpol_pars()
@@ -38,14 +39,15 @@ import logging
 logger = logging.getLogger(__name__)
 import sys
 import numpy as np
+from time import time
 
 from psana.detector.NDArrUtils import info_ndarr, divide_protected, reshape_to_3d  # print_ndarr,shape_as_2d, shape_as_3d, reshape_to_2d
 from psana.pscalib.geometry.GeometryAccess import GeometryAccess  # img_from_pixel_arrays
 #from psana.pscalib.geometry.SegGeometryStore import sgs
 
 from psana.detector.UtilsAreaDetector import dict_from_arr3d, arr3d_from_dict,\
-        img_from_pixel_arrays, statistics_of_pixel_arrays, img_multipixel_max, img_multipixel_mean,\
-        img_interpolated, init_interpolation_parameters, statistics_of_holes, fill_holes
+        img_interpolated, init_interpolation_parameters, image_plan_key, cached_image_plan,\
+        rows_cols_from_image_plan, img_entries_from_image_plan, img_from_image_plan
 
 #import psana.pscalib.calib.CalibConstants as ccc
 from psana.detector.UtilsMask import DTYPE_MASK, DTYPE_STATUS
@@ -86,6 +88,8 @@ class CalibConstants:
         self._pix_rc = None, None
         self._pix_xyz = None, None, None
         self._interpol_pars = None
+        self._image_plan = None
+        self._img_entries = None
 
 
     def calibconst(self):
@@ -233,60 +237,48 @@ class CalibConstants:
 
 
     def cached_pixel_coord_indexes(self, segnums=None, **kwa):
+        """Evaluates image plan for mapmode<4 or interpolation parameters for mapmode=4.
+           Image plans are cached in memory and on disk (if LCLS_CALIB_CACHE_DIR is set)
+           for geometry, segment numbers, and geometry kwargs, so they are re-used for all runs and detectors with the same geometry.
+        """
         logger.debug('CalibConstants.cached_pixel_coord_indexes')
 
-        resp = self.pixel_coord_indexes(**kwa)
-        if resp is None: return None
-
         # PRESERVE PIXEL INDEXES FOR USED SEGMENTS ONLY
         if segnums is None:
             segnums = self.segment_numbers_total()
 
         logger.info(info_ndarr(segnums, 'preserve pixel indices for segments '))
 
-        logger.info(info_ndarr(resp[0], 'self.pixel_coord_indexes '))
-
-        #nsegs = resp[0].shape[-3]
-        #sys.exit('TEST EXIT nsegs=%d' % nsegs)
-        #segnums = 0
-
-        rows, cols = self._pix_rc = [reshape_to_3d(a)[segnums,:,:] for a in resp]
-        #self._pix_rc = [dict_from_arr3d(reshape_to_3d(v)) for v in resp]
-
-        s = 'evaluate_pixel_coord_indexes:'
-        for i,a in enumerate(self._pix_rc): s += info_ndarr(a, '\n  %s '%('rows','cols')[i], last=3)
-        logger.info(s)
-
         mapmode = kwa.get('mapmode',2)
-        fillholes = kwa.get('fillholes',True)
 
         if mapmode <4:
-          self.img_entries, self.dmulti_pix_to_img_idx, self.dmulti_imgidx_numentries=\
-            statistics_of_pixel_arrays(rows, cols)
+            geo = self.geo()
+            if is_none(geo, 'geo is None'): return None
 
-        if mapmode==4:
+            def rows_cols():
+                resp = self.pixel_coord_indexes(**kwa)
+                if resp is None: return None, None
+                logger.info(info_ndarr(resp[0], 'self.pixel_coord_indexes '))
+                return [reshape_to_3d(a)[segnums,:,:] for a in resp]
+
+            t0_sec = time()
+            self._image_plan = cached_image_plan(image_plan_key(geo, segnums, **kwa), rows_cols)
+            if self._image_plan is None: return None
+            self._pix_rc = rows_cols_from_image_plan(self._image_plan)
+            logger.info('image plan time (sec) = %.6f' % (time()-t0_sec))
+
+        else:
+            resp = self.pixel_coord_indexes(**kwa)
+            if resp is None: return None
+            rows, cols = self._pix_rc = [reshape_to_3d(a)[segnums,:,:] for a in resp]
             rsp = self._pixel_coords(**kwa)
             if rsp is None: return None
             x,y,z = self._pix_xyz = [reshape_to_3d(a)[segnums,:,:] for a in rsp]
             self._interpol_pars = init_interpolation_parameters(rows, cols, x, y)
 
-        if mapmode <4 and fillholes:
-            self.img_pix_ascend_ind, self.img_holes, self.hole_rows, self.hole_cols, self.hole_inds1d =\
-               statistics_of_holes(rows, cols, **kwa)
-
-        # TBD parameters for image interpolation
-        if False:
-            t0_sec = time()
-            self.imgind_to_seg_row_col = image_of_pixel_seg_row_col(img_pix_ascend_ind, arr_shape)
-            logger.debug('statistics_of_holes.imgind_to_seg_row_col time (sec) = %.6f' % (time()-t0_sec)) # 47ms
-            logger.debug(info_ndarr(self.imgind_to_seg_row_col, ' imgind_to_seg_row_col '))
-
-            if False:
-                s = ' imgind_to_seg_row_col '
-                # (n,352,384)
-                first = (352+5)*384 + 380
-                for i in range(first,first+10): s += '\n    s:%02d r:%03d c:%03d' % tuple(imgind_to_seg_row_col[i])
-                logger.debug(s)
+        s = 'evaluate_pixel_coord_indexes:'
+        for i,a in enumerate(self._pix_rc): s += info_ndarr(a, '\n  %s '%('rows','cols')[i], last=3)
+        logger.info(s)
 
 
     def image(self, nda, segnums=None, **kwa):
@@ -317,32 +309,35 @@ class CalibConstants:
         """
         logger.debug('in CalibConstants.image')
 
-        if any(v is None for v in self._pix_rc):
-            self.cached_pixel_coord_indexes(segnums, **kwa)
-            if any(v is None for v in self._pix_rc): return None
-
         vbase     = kwa.get('vbase',0)
         mapmode   = kwa.get('mapmode',2)
+
+        if any(v is None for v in self._pix_rc) or (mapmode<4 and self._image_plan is None):
+            self.cached_pixel_coord_indexes(segnums, **kwa)
+            if any(v is None for v in self._pix_rc): return None
         fillholes = kwa.get('fillholes',True)
 
-        if mapmode==0: return self.img_entries
+        if mapmode==0: return self.img_entries()
 
         if is_none(nda, 'CalibConstants.image calib returns None'): return None
 
         logger.debug(info_ndarr(nda, 'nda ', last=3))
-        rows, cols = self._pix_rc
-        logger.debug(info_ndarr(rows, 'rows ', last=3))
-        logger.debug(info_ndarr(cols, 'cols ', last=3))
 
-        img = img_from_pixel_arrays(rows, cols, weight=nda, vbase=vbase) # mapmode==1
-        if   mapmode==2: img_multipixel_max(img, nda, self.dmulti_pix_to_img_idx)
-        elif mapmode==3: img_multipixel_mean(img, nda, self.dmulti_pix_to_img_idx, self.dmulti_imgidx_numentries)
+        return img_from_image_plan(self._image_plan, nda, mapmode, fillholes, vbase) if mapmode<4 else\
+               img_interpolated(nda, self._cached_interpol_pars()) if mapmode==4 else\
+               self.img_entries()
 
-        if mapmode<4 and fillholes: fill_holes(img, self.hole_rows, self.hole_cols)
 
-        return img if mapmode<4 else\
-               img_interpolated(nda, self._cached_interpol_pars()) if mapmode==4 else\
-               self.img_entries
+    def image_plan(self):
+        """Returns dict of image plan arrays, see UtilsAreaDetector.image_plan."""
+        return self._image_plan
+
+
+    def img_entries(self):
+        """Returns image of number of data pixel entries in image bins."""
+        if self._img_entries is None and self._image_plan is not None:
+            self._img_entries = img_entries_from_image_plan(self._image_plan)
+        return self._img_entries
 
 
     def pix_rc(self): return self._pix_rc
@@ -351,10 +346,4 @@ class CalibConstants:
 
     def interpol_pars(self): return self._interpol_pars
 
-# also used in CalibConstants.image
-#self.dmulti_pix_to_img_idx
-#self.dmulti_imgidx_numentries
-#self.img_holes
-#self.hole_rows, self.hole_cols
-
 # EOF
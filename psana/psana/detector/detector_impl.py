@@ -42,6 +42,7 @@ class DetectorImpl():
         self._configs           = configinfo.configs
         self._calibconst        = calibconst
         self._sorted_segment_ids= configinfo.sorted_segment_ids
+        self._dgram_inds        = configinfo.dgram_inds
         self._uniqueid          = configinfo.uniqueid
         self._dettype           = configinfo.dettype
         self._env_store         = env_store
@@ -65,17 +66,11 @@ class DetectorImpl():
         Look in the event to find all the dgrams for our detector/drp_class
         e.g. (xppcspad,raw) or (xppcspad,fex)
         """
-        key = (self._det_name,self._drp_class_name)
-        if key in evt._det_segments:
-            # check that all promised segments have been received
-            evt_segments = list(evt._det_segments[key].keys())
-            evt_segments.sort()
-            if evt_segments != self._sorted_segment_ids:
-                return None
-            else:
-                return evt._det_segments[key]
-        else:
+        segs = evt._get_det_segments(self._det_name, self._drp_class_name, self._dgram_inds)
+        # check that all promised segments have been received
+        if segs is None or sorted(segs) != self._sorted_segment_ids:
             return None
+        return segs
 
     def _info(self,evt):
         # check for missing data
@@ -1,3 +1,4 @@
+import numpy as np
 from psana.detector.detector_impl import DetectorImpl
 from psana.event import Event
 from psana.psexp.step import Step
@@ -13,7 +14,7 @@ class EnvImpl(DetectorImpl):
             err_msg = f"Function call is not available for this detector."
             raise MissingEnvStore(err_msg)
 
-        if isinstance(events, list):
+        if isinstance(events, (list, np.ndarray)): # list of events or array of timestamps
             return self._env_store.values(events, self._var_name)
         elif isinstance(events, Event):
             env_values = self._env_store.values([events], self._var_name)
@@ -21,7 +22,7 @@ class EnvImpl(DetectorImpl):
         elif isinstance(events, Step):
             env_values = self._env_store.values([events.evt], self._var_name)
             return env_values[0]
-        err_msg = f"Calling detector only accept Event or Step. Invalid type: {type(events)} given."
+        err_msg = f"Calling detector only accept Event, Step, list of events or array of timestamps. Invalid type: {type(events)} given."
         raise InvalidInputEnvStore(err_msg)
 
     @property
@@ -9,6 +9,7 @@ Usage::
 
   o = epix_base(*args, **kwargs) # inherits from AreaDetector
   a = o.calib(evt)
+  a = o.calib_batch(evts, out=None, cmpars=None, **kwa)
   m = o._mask_from_status(gain_range_inds=(0,1,2,3,4), **kwa)
   m = o._mask_edges(self, edge_rows=1, edge_cols=1, center_rows=0, center_cols=0, dtype=DTYPE_MASK, **kwa)
 
@@ -21,7 +22,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from psana.detector.areadetector import sgs, AreaDetector, np, ut, DTYPE_MASK, DTYPE_STATUS
-from psana.detector.UtilsEpix10ka import np, calib_epix10ka_any, map_gain_range_index,\
+from psana.detector.UtilsEpix10ka import np, calib_epix10ka_any, calib_epix10ka_batch, map_gain_range_index,\
   cbits_config_epix10ka, cbits_config_epixhr2x2, cbits_config_epixhr1x4,\
   cbits_config_and_data_detector, M14, M15, B14, B15
 import psana.detector.UtilsMask as um #import merge_status
@@ -48,6 +49,12 @@ class epix_base(AreaDetector):
         #return self.raw(evt)
 
 
+    def calib_batch(self, evts, out=None, **kwa):
+        """Returns calibrated data array (<nevts>, <nsegs>, <rows>, <cols>) for a batch of events."""
+        logger.debug('epix_base.calib_batch - the same for epix10ka and epixhr2x2')
+        return calib_epix10ka_batch(self, evts, out=out, **kwa)
+
+
     def _gain_range_index(self, evt, **kwa):
         """Returns array (shaped as raw) per pixel gain range index or None."""
         logger.debug('epix_base._gain_range_index - the same for epix10ka and epixhr2x2')
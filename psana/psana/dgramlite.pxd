@@ -1,7 +1,9 @@
-from libc.stdint cimport uint32_t
+from libc.stdint cimport uint16_t, uint32_t
 
 cdef struct Xtc:
-    int junks[2]
+    uint32_t src
+    uint16_t damage
+    uint16_t contains
     uint32_t extent
 
 cdef struct Sequence:
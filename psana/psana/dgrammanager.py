@@ -1,5 +1,6 @@
 import sys, os
 import time
+import mmap
 import getopt
 import pprint
 
@@ -46,9 +47,16 @@ class DgramManager(object):
 
     def __init__(self, xtc_files, configs=[], fds=[],
             tag=None, run=None, max_retries=0,
-            config_consumers=[]):
+            config_consumers=[], use_mmap=None, shmem_zero_copy=None):
         """ Opens xtc_files and stores configs.
         If file descriptors (fds) is given, reuse the given file descriptors.
+        If use_mmap is set (default from PS_BD_MMAP env. variable), bigdata 
+        events are built directly on read-only memory maps of the xtc files
+        (see get_mmap).
+        If shmem_zero_copy is set (default from PS_SHMEM_ZERO_COPY env. variable),
+        shmem L1Accept dgrams point directly into the shmem buffer, which is
+        only given back to the server when the event and all arrays taken
+        from it are released (use Event.copy() to keep data longer).
         """
         self.xtc_files = []
         self.shmem_cli = None
@@ -69,6 +77,10 @@ class DgramManager(object):
         self.config_consumers = config_consumers
         self.tag = tag
 
+        if shmem_zero_copy is None:
+            shmem_zero_copy = int(os.environ.get('PS_SHMEM_ZERO_COPY', 0))
+        self.shmem_zero_copy = shmem_zero_copy
+
         if isinstance(xtc_files, (str)):
             self.xtc_files = np.array([xtc_files], dtype='U%s'%FN_L)
         elif isinstance(xtc_files, (list, np.ndarray)):
@@ -106,6 +118,14 @@ class DgramManager(object):
         self.n_files = len(self.xtc_files)
         self.set_chunk_ids()
 
+        if use_mmap is None:
+            use_mmap = int(os.environ.get('PS_BD_MMAP', 0))
+        self.use_mmap = use_mmap
+        self.mmaps = [None] * self.n_files
+
+        # EventManager with bigdata reads in flight on self.fds (PS_BD_READAHEAD)
+        self.bd_readahead = None
+
     def _connect_shmem_cli(self, tag):
         # ShmemClients open a connection in connect() and close it in
         # the destructor. By creating a new client every time, we ensure
@@ -216,6 +236,9 @@ class DgramManager(object):
         - configs specific to that detector
         - sorted_segment_ids
           used by Detector cls for checking if an event has correct no. of segments
+        - dgram_inds
+          indices of configs (event dgrams) with this detector, used by Detector cls
+          as a lookup plan for its segments in events (see Event._get_det_segments)
         - detid_dict
           has segment_id as a key
         - dettype
@@ -227,7 +250,8 @@ class DgramManager(object):
             for (det_name, _), _ in det_class.items():
                 # we lose a "one-to-one" correspondence with event dgrams.  we may have
                 # to put in None placeholders at some point? - mona and cpo
-                det_configs = [cfg for cfg in self.configs if hasattr(cfg.software, det_name)]
+                dgram_inds = [i for i, cfg in enumerate(self.configs) if hasattr(cfg.software, det_name)]
+                det_configs = [self.configs[i] for i in dgram_inds]
                 sorted_segment_ids = []
                 # a dictionary of the ids (a.k.a. serial-number) of each segment
                 detid_dict = {}
@@ -249,6 +273,7 @@ class DgramManager(object):
                 configinfo_dict[det_name] = type("ConfigInfo", (), {\
                         "configs": det_configs, \
                         "sorted_segment_ids": sorted_segment_ids, \
+                        "dgram_inds": dgram_inds, \
                         "detid_dict": detid_dict, \
                         "dettype": dettype, \
                         "uniqueid": uniqueid})
@@ -281,7 +306,36 @@ class DgramManager(object):
     def set_chunk_id(self, ind, new_chunk_id):
         self.chunk_ids[ind] = new_chunk_id
 
+    def get_mmap(self, ind, min_size=0):
+        """ Returns read-only mmap of the xtc file at this index.
+
+        The file is (re)mapped when it's not mapped yet or the current map is
+        smaller than min_size (file has grown). Returns None when mmap mode
+        is off, for .inprogress files that are still being written, or when
+        the file is smaller than min_size (caller should use pread).
+        """
+        if not self.use_mmap: return None
+        if str(self.xtc_files[ind]).endswith('.inprogress'): return None
+
+        mm = self.mmaps[ind]
+        if mm is None or len(mm) < min_size:
+            file_size = os.fstat(self.fds[ind]).st_size
+            if file_size == 0 or file_size < min_size: return None
+            # Dgrams built on the old map keep it alive until they're gone
+            mm = mmap.mmap(self.fds[ind], file_size, access=mmap.ACCESS_READ)
+            self.mmaps[ind] = mm
+        return mm
+
+    def reset_mmap(self, ind):
+        """ Drops the current map (e.g. when switching to a new chunk file)."""
+        if self.use_mmap:
+            self.mmaps[ind] = None
+
     def close(self):
+        if self.bd_readahead is not None:
+            self.bd_readahead.close_prefetch()
+        for ind in range(len(self.mmaps)):
+            self.reset_mmap(ind)
         if not self.given_fds:
             for fd in self.fds:
                 os.close(fd)
@@ -316,8 +370,11 @@ class DgramManager(object):
             return evt
 
         if self.shmem_cli:
-            view = self.shmem_cli.get(self.shmem_kwargs)
-            if view:
+            if self.shmem_zero_copy:
+                view = self._get_shmem_view_zero_copy()
+            else:
+                view = self.shmem_cli.get(self.shmem_kwargs)
+            if view and not self.shmem_zero_copy:
                 # Release shmem buffer after copying Transition data
                 # cpo: copy L1Accepts too because some shmem
                 # applications like AMI's pickN can hold references
@@ -328,6 +385,7 @@ class DgramManager(object):
                 barray = bytes(view[:_dgSize(view)])
                 self.shmem_cli.freeByIndex(self.shmem_kwargs['index'], self.shmem_kwargs['size'])
                 view = memoryview(barray)
+            if view:
                 # use the most recent configure datagram
                 config = self.configs[len(self.configs)-1]
                 d = dgram.Dgram(config=config,view=view)
@@ -366,10 +424,31 @@ class DgramManager(object):
             self._set_configs(dgrams)
             return self.__next__()
 
-        evt = Event(dgrams, run=self.get_run())
+        evt = Event(dgrams, run=self.get_run(), configs=self.configs)
         self._timestamps += [evt.timestamp]
         return evt
 
+    def _get_shmem_view_zero_copy(self):
+        """ Returns a view of the next shmem dgram or None if no buffer is
+        available. L1Accepts are not copied: the view points directly into
+        the shmem buffer, which is freed when the last dgram, event or array
+        referencing it is released. Transitions are still copied and their
+        buffer freed right away, so that configs and step data never pin
+        shmem buffers.
+
+        Note: every event kept alive holds one shmem buffer. Consumers that
+        keep references to many events (e.g. AMI's pickN) can exhaust the
+        server buffers and deadlock; they should keep Event.copy() instead.
+        """
+        sbuf = self.shmem_cli.get_buffer()
+        if sbuf is None:
+            return None
+        view = memoryview(sbuf)
+        view = view[:_dgSize(view)]
+        if _service(view) != TransitionId.L1Accept:
+            view = memoryview(bytes(view))
+        return view
+
     def jumps(self, dgram_i, offset, size):
         if offset == 0 and size == 0:
             d = None
@@ -3,6 +3,7 @@
 
 from psana import dgram
 from psana.psexp import PacketFooter, TransitionId
+from psana.psexp.tracer import traced, span
 import numpy as np
 import datetime
 
@@ -20,10 +21,20 @@ class DrpClassContainer(object):
 class Event():
     """
     Event holds list of dgrams
+
+    In on-demand bigdata mode (PS_BD_ON_DEMAND=1, see EventManager), dgrams of
+    bigdata streams are smd dgrams (placeholders) until the bigdata dgram is
+    loaded by bd_loaders[i] on the first access to a detector of that stream.
+
+    In shmem zero-copy mode (PS_SHMEM_ZERO_COPY=1, see DgramManager), dgrams
+    point directly into shmem buffers that are held until the event and all
+    arrays taken from it are released. Use copy() to keep data longer.
     """
-    def __init__(self, dgrams, run=None):
+    def __init__(self, dgrams, run=None, bd_loaders=None, configs=None):
         self._dgrams = dgrams
+        self._configs = configs
         self._size = len(dgrams)
+        self._bd_loaders = bd_loaders if bd_loaders else {}
         self._complete()
         self._position = 0
         self._run = run
@@ -39,15 +50,29 @@ class Event():
     def next(self):
         if self._position >= len(self._dgrams):
             raise StopIteration
+        self._load_bigdata(self._position)
         d = self._dgrams[self._position]
         self._position += 1
         return d
 
     def _replace(self, pos, d):
         assert pos < self._size
+        self._bd_loaders.pop(pos, None)
         self._dgrams[pos] = d
+        self._complete()
+
+    def _load_bigdata(self, i):
+        """ Replaces placeholder dgram i with its bigdata dgram (on-demand mode)."""
+        if i in self._bd_loaders:
+            with span('evt.load_bigdata'):
+                self._dgrams[i] = self._bd_loaders.pop(i)()
+
+    def _load_all_bigdata(self):
+        for i in list(self._bd_loaders):
+            self._load_bigdata(i)
 
     def _to_bytes(self):
+        self._load_all_bigdata()
         event_bytes = bytearray()
         pf = PacketFooter(self._size)
         for i, d in enumerate(self._dgrams):
@@ -59,6 +84,19 @@ class Event():
 
         return event_bytes
 
+    def copy(self):
+        """
+        Returns a new event with its own copy of the dgram data, e.g. to keep
+        an event built on shmem buffers (zero-copy mode) without holding them.
+        Events created without configs already own their data and are returned as is.
+        """
+        if self._configs is None:
+            return self
+        self._load_all_bigdata()
+        dgrams = [dgram.Dgram(config=config, view=memoryview(bytes(d))) if d else None
+                  for d, config in zip(self._dgrams, self._configs)]
+        return Event(dgrams, run=self._run, configs=self._configs)
+
     @property
     def _seconds(self):
         _high = (self.timestamp >> 32) & 0xffffffff
@@ -82,10 +120,14 @@ class Event():
     def run(self):
         return self._run
 
+    @traced('evt.det_segments')
     def _assign_det_segments(self):
         """
+        Builds the full segment table {(det_name, drp_class_name): {segment: drp_class}}
+        for all detectors in the event (see _det_segments).
         """
-        self._det_segments = {}
+        self._load_all_bigdata()
+        self._det_segments_table = {}
         for evt_dgram in self._dgrams:
             
             if evt_dgram: # dgram can be None (missing) in an event
@@ -100,9 +142,9 @@ class Event():
                         for drp_class_name, drp_class in det.__dict__.items():
                             class_identifier = (det_name,drp_class_name)
                         
-                            if class_identifier not in self._det_segments.keys():
-                                self._det_segments[class_identifier] = {}
-                            segs = self._det_segments[class_identifier]
+                            if class_identifier not in self._det_segments_table.keys():
+                                self._det_segments_table[class_identifier] = {}
+                            segs = self._det_segments_table[class_identifier]
 
                             if det_name not in ['runinfo','smdinfo','chunkinfo'] :
                                 assert segment not in segs, f'Found duplicate segment: {segment} for {class_identifier}'
@@ -110,10 +152,57 @@ class Event():
                             
         return
 
+    @property
+    def _det_segments(self):
+        """
+        Full segment table of the event, built on first access.
+        Detectors use _get_det_segments, which only looks up their own (det_name, drp_class_name).
+        """
+        if self._det_segments_table is None:
+            self._assign_det_segments()
+        return self._det_segments_table
+
+    def _get_det_segments(self, det_name, drp_class_name, dgram_inds=None):
+        """
+        Returns {segment: drp_class} for (det_name, drp_class_name) or None
+        if the event has no data for it. The lookup is done on first access and
+        cached in the event. dgram_inds is the lookup plan built once per Configure
+        (ConfigInfo.dgram_inds in DgramManager): indices of the event dgrams
+        (streams) that have this detector, otherwise all dgrams are searched.
+        """
+        key = (det_name, drp_class_name)
+        if key in self._det_segments_cache:
+            return self._det_segments_cache[key]
+
+        if self._det_segments_table is not None:
+            segs = self._det_segments_table.get(key)
+        else:
+            if dgram_inds is None or (dgram_inds and dgram_inds[-1] >= self._size):
+                dgram_inds = range(self._size)
+            segs = None
+            for i in dgram_inds:
+                self._load_bigdata(i)
+                evt_dgram = self._dgrams[i]
+                if not evt_dgram: continue # dgram can be None (missing) in an event
+                segment_dict = evt_dgram.__dict__.get(det_name)
+                if segment_dict is None: continue
+                for segment, det in segment_dict.items():
+                    det_dict = det.__dict__
+                    if drp_class_name not in det_dict: continue
+                    if segs is None: segs = {}
+                    if det_name not in ['runinfo','smdinfo','chunkinfo'] :
+                        assert segment not in segs, f'Found duplicate segment: {segment} for {key}'
+                    segs[segment] = det_dict[drp_class_name]
+
+        self._det_segments_cache[key] = segs
+        return segs
+
     # this routine is called when all the dgrams have been inserted into
-    # the event (e.g. by the eventbuilder calling _replace())
+    # the event (e.g. by the eventbuilder calling _replace()).
+    # segment tables are built lazily (see _get_det_segments).
     def _complete(self):
-        self._assign_det_segments()
+        self._det_segments_table = None
+        self._det_segments_cache = {}
 
     @property
     def _has_offset(self):
@@ -366,11 +366,12 @@ cdef class EventBuilder:
         #print(f'svr:{proxy_evt.service} total (micro-sec): {(t4-t0)*1e6:.2f} init:{(t1-t0)*1e6:.2f} loop1:{(t2-t1)*1e6:.2f} set:{(t3-t2)*1e6:.2f} loop2:{(t4-t3)*1e6:.2f} fin:{(t5-t4)*1e6:.2f}')
         return proxy_evt
 
-    def build(self, as_proxy_events=False):
+    def build(self, as_proxy_events=False, int batch_size=0):
         """ Build proxy events according to batch size.
         
         Input: 
         as_proxy_events: set this to skip creating event and step batches
+        batch_size: no. of events in this batch (dsparms.batch_size if 0)
 
         Output:
         proxy_events: a list of proxy events (as_proxy_events=True)
@@ -386,12 +387,14 @@ cdef class EventBuilder:
         cdef unsigned got       = 0
         cdef unsigned got_step  = 0
         cdef unsigned cn_intg_events = 0
+        if batch_size <= 0:
+            batch_size = dsparms.batch_size
 
         # Keeping all built proxy event
         proxy_events = []
         non_L1_indices = []
 
-        while cn_intg_events < dsparms.batch_size and self.has_more():
+        while cn_intg_events < batch_size and self.has_more():
             proxy_evt = self.build_proxy_event()
             if proxy_evt is not None:
                 # Either counting no. of events normally or counting only
@@ -46,3 +46,4 @@ cdef class ParallelReader:
     cdef void _init_buffers(self, Buffer* bufs)
     cdef void _free_buffers(self, Buffer* bufs)
     cdef void just_read(self)
+    cdef void reset_buffers(self)
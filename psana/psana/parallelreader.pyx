@@ -66,6 +66,22 @@ cdef class ParallelReader:
                 free(buf.result_stat)
             free(bufs)
 
+    cdef void reset_buffers(self):
+        """ Drops all buffered data (used after the files were moved to new offsets)."""
+        cdef Py_ssize_t i, j
+        cdef Buffer* buf
+        for i in range(self.nfiles):
+            for j in range(2):
+                buf = &(self.bufs[i]) if j == 0 else &(self.step_bufs[i])
+                buf.got             = 0
+                buf.ready_offset    = 0
+                buf.n_ready_events  = 0
+                buf.seen_offset     = 0
+                buf.n_seen_events   = 0
+                buf.timestamp       = 0
+                buf.found_endrun    = 0
+                buf.endrun_ts       = 0
+
     @cython.boundscheck(False)
     cdef void just_read(self):
         """
@@ -0,0 +1,177 @@
+"""
+Local on-disk cache for calibration constants fetched by MDBWebUtils.
+
+GridFS payloads are immutable for a given id_data, so they are stored
+(content-addressed by url/dbname/id_data) and served from disk on the
+next request. Results of document queries (find_docs) can change when
+new constants are deployed, so they are cached only for a short time
+(LCLS_CALIB_CACHE_TTL seconds, default 0 - not cached).
+
+The cache is off unless LCLS_CALIB_CACHE_DIR is set. When the total size
+of the cache exceeds LCLS_CALIB_CACHE_MAXBYTES, the least recently used
+files are removed. The size is estimated from the writes of this process
+and re-evaluated from the cache directory only when the estimate exceeds
+the limit (and on the first write).
+
+Usage ::
+
+    import psana.pscalib.calib.MDBWebCache as wc
+
+    cache = wc.calib_cache() # None if the cache is off
+    if cache is not None:
+        s = cache.get_data(url, dbname, id_data)
+        cache.put_data(url, dbname, id_data, s)
+        docs = cache.get_docs(url, dbname, colname, query_string)
+        cache.put_docs(url, dbname, colname, query_string, docs)
+        s = cache.get_blob(kind, key)
+        cache.put_blob(kind, key, s)
+"""
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from time import time
+
+CACHE_DIR      = 'LCLS_CALIB_CACHE_DIR'
+CACHE_MAXBYTES = 'LCLS_CALIB_CACHE_MAXBYTES'
+CACHE_TTL      = 'LCLS_CALIB_CACHE_TTL'
+
+DEFAULT_MAXBYTES = 0x80000000 # 2GB
+DEFAULT_TTL      = 0
+
+
+class CalibCache:
+    """Size-limited LRU cache of GridFS payloads and (short-lived) document queries."""
+
+    def __init__(self, cachedir, maxbytes=DEFAULT_MAXBYTES, ttl_sec=DEFAULT_TTL):
+        self.cachedir = cachedir
+        self.maxbytes = maxbytes
+        self.ttl_sec  = ttl_sec
+        self.hits     = 0
+        self.misses   = 0
+        self.nbytes   = None # estimated total size of the cache, None - not evaluated yet
+        self._lock    = threading.Lock()
+        os.makedirs(cachedir, exist_ok=True)
+
+    def _path(self, kind, *keys):
+        key = hashlib.sha1('|'.join([str(k) for k in keys]).encode()).hexdigest()
+        return os.path.join(self.cachedir, kind, key[:2], key)
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                s = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        # mtime is used as the last-access time for LRU eviction
+        try: os.utime(path)
+        except OSError: pass
+        self.hits += 1
+        return s
+
+    def _write(self, path, s):
+        tmp = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path)+'.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(s)
+            try: size_old = os.path.getsize(path)
+            except OSError: size_old = 0
+            os.replace(tmp, path)
+        except OSError as err:
+            logger.debug('calib cache: cannot write %s: %s' % (path, err))
+            if tmp is not None:
+                try: os.remove(tmp)
+                except OSError: pass
+            return
+        with self._lock:
+            if self.nbytes is not None:
+                self.nbytes += len(s) - size_old
+        if self.nbytes is None or self.nbytes > self.maxbytes:
+            self.evict()
+
+    def get_data(self, url, dbname, id_data):
+        """Returns cached GridFS payload (bytes) or None."""
+        return self._read(self._path('data', url, dbname, id_data))
+
+    def put_data(self, url, dbname, id_data, s):
+        self._write(self._path('data', url, dbname, id_data), s)
+
+    def get_blob(self, kind, key):
+        """Returns cached payload (bytes) of any other kind of objects derived from constants, e.g. image plans, or None."""
+        return self._read(self._path(kind, key))
+
+    def put_blob(self, kind, key, s):
+        self._write(self._path(kind, key), s)
+
+    def get_docs(self, url, dbname, colname, query_string):
+        """Returns cached list of documents for query if it is not older than ttl_sec or None."""
+        if self.ttl_sec <= 0: return None
+        path = self._path('docs', url, dbname, colname, query_string)
+        try:
+            if time() - os.path.getmtime(path) > self.ttl_sec:
+                self.misses += 1
+                return None
+        except OSError:
+            self.misses += 1
+            return None
+        s = self._read(path)
+        return None if s is None else json.loads(s)
+
+    def put_docs(self, url, dbname, colname, query_string, docs):
+        if self.ttl_sec <= 0: return
+        self._write(self._path('docs', url, dbname, colname, query_string), json.dumps(docs).encode())
+
+    def evict(self):
+        """Removes least recently used files until the cache size is below maxbytes."""
+        files = []
+        total = 0
+        for root, _, fnames in os.walk(self.cachedir):
+            for fname in fnames:
+                path = os.path.join(root, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total > self.maxbytes:
+            files.sort()
+            for _, size, path in files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                logger.debug('calib cache: evicted %s' % path)
+                if total <= self.maxbytes: break
+        with self._lock:
+            self.nbytes = total
+
+
+_cache = None
+
+
+def calib_cache():
+    """Returns CalibCache configured with LCLS_CALIB_CACHE_* environment variables or None when it is off."""
+    global _cache
+    cachedir = os.environ.get(CACHE_DIR, '')
+    if not cachedir: return None
+    maxbytes = int(os.environ.get(CACHE_MAXBYTES, DEFAULT_MAXBYTES))
+    ttl_sec  = float(os.environ.get(CACHE_TTL, DEFAULT_TTL))
+    if _cache is None or (_cache.cachedir, _cache.maxbytes, _cache.ttl_sec) != (cachedir, maxbytes, ttl_sec):
+        try:
+            _cache = CalibCache(cachedir, maxbytes, ttl_sec)
+        except OSError as err:
+            logger.warning('calib cache is off, cannot use %s: %s' % (cachedir, err))
+            return None
+    return _cache
+
+# EOF
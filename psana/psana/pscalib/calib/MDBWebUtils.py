@@ -20,6 +20,7 @@ Usage ::
     data,doc = wu.calib_constants(det, exp=None, ctype='pedestals', run=None, time_sec=None, vers=None, url=cc.URL)
     d = wu.calib_constants_all_types(det, exp=None, run=None, time_sec=None, vers=None, url=cc.URL, dbsuffix='')
     d = {ctype:(data,doc),}
+    lst = wu.get_data_for_docs([(dbname, doc),...], url=cc.URL) # concurrent get_data_for_doc
 
     id = wu.add_data_from_file(dbname, fname, sfx=None, url=cc.URL_KRB, krbheaders=cc.KRBHEADERS)
     id = wu.add_data(dbname, data, url=cc.URL_KRB, krbheaders=cc.KRBHEADERS)
@@ -47,16 +48,20 @@ Usage ::
 import logging
 logger = logging.getLogger(__name__)
 
+import os
 import sys
 import numpy as np
 import io
+from concurrent.futures import ThreadPoolExecutor
 
 import psana.pscalib.calib.CalibConstants as cc
-from requests import get, post, delete #put
+from requests import get, post, delete, Session #put
+from requests.adapters import HTTPAdapter
 
 from time import time
 from numpy import fromstring
 import psana.pscalib.calib.MDBUtils as mu
+import psana.pscalib.calib.MDBWebCache as wc
 import psana.pyalgos.generic.Utils as gu
 from subprocess import call
 
@@ -80,9 +85,23 @@ def query_id_pro(query):
     return query
 
 
+NTHREADS = int(os.environ.get('LCLS_CALIB_NTHREADS', 8)) # no. of concurrent requests in calib_constants_all_types
+_session = None
+
+def session():
+    """Returns shared requests.Session which keeps connections to the server alive between requests."""
+    global _session
+    if _session is None:
+        _session = Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(NTHREADS, 1))
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
 def request(url, query=None):
     #t0_sec = time()
-    r = get(url, query, timeout=180)
+    r = session().get(url, params=query, timeout=180)
     #dt = time()-t0_sec # ~30msec
     #logger.debug('CONSUMED TIME by request %.3f sec\n  for url=%s  query=%s' % (dt, url, str(query)))
     if r.ok: return r
@@ -116,15 +135,21 @@ def find_docs(dbname, colname, query={}, url=cc.URL):
     uri = '%s/%s/%s'%(url,dbname,colname)
     query_string=str(query).replace("'",'"')
     logger.debug('find_docs uri: %s query: %s' % (uri, query_string))
+    cache = wc.calib_cache()
+    if cache is not None:
+        docs = cache.get_docs(url, dbname, colname, query_string)
+        if docs is not None: return docs
     r = request(uri, {"query_string": query_string})
     if r is None: return None
     try:
-        return r.json()
+        docs = r.json()
     except:
         msg = 'WARNING: find_docs responce: %s' % str(r)\
             + '\n     conversion to json failed, return None for query: %s' % str(query)
         logger.debug(msg)
         return None
+    if cache is not None: cache.put_docs(url, dbname, colname, query_string, docs)
+    return docs
 
 
 def find_doc(dbname, colname, query={}, url=cc.URL): #query={'ctype':'pedestals'}
@@ -174,12 +199,19 @@ def get_doc_for_docid(dbname, colname, docid, url=cc.URL):
 
 # curl -s "https://pswww.slac.stanford.edu/calib_ws/cdb_cxic0415/gridfs/5b6893d91ead141643fe3f6a"
 def get_data_for_id(dbname, dataid, url=cc.URL):
-    """Returns raw data from GridFS, at this level there is no info for parsing."""
+    """Returns raw data from GridFS, at this level there is no info for parsing.
+       Data are served from the local cache (see MDBWebCache) when available.
+    """
+    cache = wc.calib_cache()
+    if cache is not None:
+        s = cache.get_data(url, dbname, dataid)
+        if s is not None: return s
     r = request('%s/%s/gridfs/%s'%(url,dbname,dataid))
     if r is None: return None
     logger.debug('get_data_for_docid:'\
                 +'\n  r.status_code: %s\n  r.headers: %s\n  r.encoding: %s\n  r.content: %s...\n' %
                  (str(r.status_code),  str(r.headers),  str(r.encoding),  str(r.content[:50])))
+    if cache is not None: cache.put_data(url, dbname, dataid, r.content)
     return r.content
 
 
@@ -199,13 +231,20 @@ def get_data_for_doc(dbname, doc, url=cc.URL):
         logger.debug("get_data_for_doc: key 'id_data' is missing in selected document...")
         return None
 
-    r2 = request('%s/%s/gridfs/%s'%(url,dbname,idd))
-    if r2 is None: return None
-    s = r2.content
+    s = get_data_for_id(dbname, idd, url)
+    if s is None: return None
 
     return mu.object_from_data_string(s, doc)
 
 
+def get_data_for_docs(dbname_docs, url=cc.URL):
+    """Returns list of data from GridFS for list of (dbname, doc) fetched concurrently."""
+    if len(dbname_docs) < 2 or NTHREADS < 2:
+        return [get_data_for_doc(dbname, doc, url) for dbname, doc in dbname_docs]
+    with ThreadPoolExecutor(max_workers=min(NTHREADS, len(dbname_docs))) as executor:
+        return list(executor.map(lambda dbname_doc: get_data_for_doc(dbname_doc[0], dbname_doc[1], url), dbname_docs))
+
+
 def dbnames_collection_query(det, exp=None, ctype='pedestals', run=None, time_sec=None, vers=None, dtype=None, dbsuffix=''):
     """wrapper for MDBUtils.dbnames_collection_query,
        - which should receive short detector name, othervice uses direct interface to DB
@@ -240,58 +279,76 @@ def calib_constants(det, exp=None, ctype='pedestals', run=None, time_sec=None, v
     return (get_data_for_doc(dbname, doc, url), doc)
 
 
-def calib_constants_of_missing_types(resp, det, time_sec=None, vers=None, url=cc.URL):
-    """ try to add constants of missing types in resp using detector db."""
+def latest_docs_for_ctypes(docs, query):
+    """Returns dict {ctype:doc} of the latest document for each ctype found in docs."""
+    ctypes = set([d.get('ctype',None) for d in docs])
+    ctypes.discard(None)
+    ldocs = {}
+    for ct in ctypes:
+        docs_for_type = [d for d in docs if d.get('ctype',None)==ct]
+        doc = select_latest_doc(docs_for_type, query)
+        if doc is None: continue
+        ldocs[ct] = doc
+    return ldocs
+
+
+def _missing_types_dbname_collection_query(det, time_sec=None, vers=None):
     exp=None
     run=9999
     ctype=None
     db_det, db_exp, colname, query = dbnames_collection_query(det, exp, ctype, run, time_sec, vers, dtype=None)
-    dbname = db_det
+    return db_det, colname, query
+
+
+def calib_constants_of_missing_types(resp, det, time_sec=None, vers=None, url=cc.URL):
+    """ try to add constants of missing types in resp using detector db."""
+    dbname, colname, query = _missing_types_dbname_collection_query(det, time_sec, vers)
     docs = find_docs(dbname, colname, query, url)
     #logger.debug('find_docs: number of docs found: %d' % len(docs))
     if docs is None: return None
 
-    ctypes = set([d.get('ctype',None) for d in docs])
-    ctypes.discard(None)
-    logger.debug('calib_constants_missing_types - found ctypes: %s' % str(ctypes))
-
-    ctypes_resp = resp.keys()
-    _ctypes = [ct for ct in ctypes if not(ct in ctypes_resp)]
+    ldocs = latest_docs_for_ctypes(docs, query)
+    logger.debug('calib_constants_missing_types - found ctypes: %s' % str(ldocs.keys()))
 
-    logger.debug('calib_constants_missing_types - found additional ctypes: %s' % str(_ctypes))
+    _ldocs = [doc for ct, doc in ldocs.items() if not(ct in resp)]
+    logger.debug('calib_constants_missing_types - found additional ctypes: %s' % str([d['ctype'] for d in _ldocs]))
 
-    for ct in _ctypes:
-        docs_for_type = [d for d in docs if d.get('ctype',None)==ct]
-        doc = select_latest_doc(docs_for_type, query)
-        if doc is None: continue
-        resp[ct] = (get_data_for_doc(dbname, doc, url), doc)
+    datas = get_data_for_docs([(dbname, doc) for doc in _ldocs], url)
+    for doc, data in zip(_ldocs, datas):
+        resp[doc['ctype']] = (data, doc)
 
     return resp
 
 
 def calib_constants_all_types(det, exp=None, run=None, time_sec=None, vers=None, url=cc.URL, dbsuffix=''):
-    """Returns constants for all ctype-s."""
+    """Returns constants for all ctype-s.
+       Document queries to the experiment and detector db-s and then all selected
+       GridFS payloads are fetched concurrently (see LCLS_CALIB_NTHREADS).
+    """
     ctype=None
     db_det, db_exp, colname, query = dbnames_collection_query(det, exp, ctype, run, time_sec, vers, dtype=None, dbsuffix=dbsuffix)
     dbname = db_det if dbsuffix or (exp is None) else db_exp
-    docs = find_docs(dbname, colname, query, url)
+    mt_dbname, mt_colname, mt_query = _missing_types_dbname_collection_query(det, time_sec, vers)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        f_docs = executor.submit(find_docs, dbname, colname, query, url)
+        f_mt_docs = executor.submit(find_docs, mt_dbname, mt_colname, mt_query, url)
+        docs, mt_docs = f_docs.result(), f_mt_docs.result()
     #logger.debug('find_docs: number of docs found: %d' % len(docs))
     if docs is None: return None
 
-    ctypes = set([d.get('ctype',None) for d in docs])
-    ctypes.discard(None)
-    logger.debug('calib_constants_all_types - found ctypes: %s' % str(ctypes))
+    ldocs = latest_docs_for_ctypes(docs, query)
+    logger.debug('calib_constants_all_types - found ctypes: %s' % str(ldocs.keys()))
+    if mt_docs is None: return None
 
-    resp = {}
-    for ct in ctypes:
-        docs_for_type = [d for d in docs if d.get('ctype',None)==ct]
-        doc = select_latest_doc(docs_for_type, query)
-        if doc is None: continue
-        resp[ct] = (get_data_for_doc(dbname, doc, url), doc)
+    # constants of missing types from detector db
+    mt_ldocs = latest_docs_for_ctypes(mt_docs, mt_query)
+    dbname_docs = [(dbname, doc) for doc in ldocs.values()]\
+                + [(mt_dbname, doc) for ct, doc in mt_ldocs.items() if not(ct in ldocs)]
+    logger.debug('calib_constants_all_types - found additional ctypes: %s' % str([ct for ct in mt_ldocs if not(ct in ldocs)]))
 
-    resp = calib_constants_of_missing_types(resp, det, time_sec, vers, url)
-
-    return resp
+    datas = get_data_for_docs(dbname_docs, url)
+    return {doc['ctype']:(data, doc) for (_, doc), data in zip(dbname_docs, datas)}
 
 
 def add_data_from_file(dbname, fname, sfx=None, url=cc.URL_KRB, krbheaders=cc.KRBHEADERS):
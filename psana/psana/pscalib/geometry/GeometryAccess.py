@@ -35,6 +35,9 @@ Usage::
     # returns (smallest) pixel size [um]
     pixel_size = geometry.get_pixel_scale_size(oname=None, oindex=0)
 
+    # returns str of parameters of all geometry objects, e.g. for cache keys
+    s = geometry.str_geo_pars()
+
     # returns dictionary of comments associated with geometry (file)
     dict_of_comments = geometry.get_dict_of_comments()
 
@@ -115,7 +118,9 @@ import os
 import numpy as np
 from math import floor, fabs
 
-from psana.pscalib.geometry.GeometryObject import GeometryObject
+from functools import reduce
+
+from psana.pscalib.geometry.GeometryObject import GeometryObject, transform_geo_coord_arrays_batch
 
 import logging
 logger = logging.getLogger(__name__)
@@ -176,6 +181,9 @@ class GeometryAccess:
         self.p_um_old   = None
         self.cframe_old = None
         self.fract_old  = None
+        self.XY_src_old = None
+        self.seg_coords_cache = {} # {(oname, oindex, do_tilt): (segment matrices, xyz)}
+        self.coords_cache     = {} # {(oname, oindex, do_tilt, cframe): (xyz or segment matrices, X, Y, Z)}
 
 
     def is_valid(self):
@@ -268,6 +276,18 @@ class GeometryAccess:
         logger.debug(txt)
 
 
+    def str_geo_pars(self):
+        """Returns str of parameters of all geometry objects in full precision,
+           e.g. to use as a key of derived objects cached for this geometry.
+        """
+        if not self.valid: return None
+        return '\n'.join(['%s %s %s %s %r %r %r %r %r %r %r %r %r'%\
+                          (geo.pname, geo.pindex, geo.oname, geo.oindex, geo.x0, geo.y0, geo.z0,\
+                           geo.rot_z, geo.rot_y, geo.rot_x, geo.tilt_z, geo.tilt_y, geo.tilt_x)\
+                          for geo in self.list_of_geos])\
+              + '\nuse_wide_pix_center %s' % self.use_wide_pix_center
+
+
     def _add_comment_to_dict(self, line):
         """Splits the line of comments for keyward and value and store it in the dictionary.
         """
@@ -419,27 +439,86 @@ class GeometryAccess:
 
     def get_pixel_coords(self, oname=None, oindex=0, do_tilt=True, cframe=0):
         """Returns three pixel X,Y,Z coordinate arrays for top or specified geometry object.
+           Results are cached for (oname, oindex, do_tilt, cframe) and re-evaluated for modified geometry only.
         """
         if not self.valid: return None
 
-        if  oindex  == self.oindex_old\
-        and oname   == self.oname_old\
-        and do_tilt == self.tilt_old\
-        and cframe  == self.cframe_old:
-            return self.X_old, self.Y_old, self.Z_old
-
         geo = self.get_top_geo() if oname is None else self.get_geo(oname, oindex)
         if logger.getEffectiveLevel() == logging.DEBUG:
             logger.debug('get_pixel_coords(...) for geo:')
             geo.print_geo_children();
 
-        x,y,z = geo.get_pixel_coords(do_tilt)
+        key = (oname, oindex, do_tilt, cframe)
+        cached = self.coords_cache.get(key, None)
+        xyz = self._pixel_coords_of_segments(geo, do_tilt)
+        if xyz is None: # not supported hierarchy, cached while segment matrices are unchanged
+            token = self._segment_matrices(geo.get_segment_chains(), do_tilt)
+            valid = cached is not None and isinstance(cached[0], np.ndarray) and cached[0].shape == token.shape\
+                    and np.array_equal(cached[0], token)
+        else:
+            token = xyz
+            valid = cached is not None and cached[0] is xyz
+        if valid:
+            self.X_old, self.Y_old, self.Z_old = cached[1:]
+            self.tilt_old = do_tilt
+            self.cframe_old = cframe
+            return self.X_old, self.Y_old, self.Z_old
+
+        x,y,z = geo.get_pixel_coords(do_tilt) if xyz is None else xyz
         self.X_old, self.Y_old, self.Z_old = self.coords_psana_to_lab_frame(x,y,z) if cframe>0 else (x,y,z)
+        self.coords_cache[key] = (token, self.X_old, self.Y_old, self.Z_old)
         self.tilt_old = do_tilt
         self.cframe_old = cframe
         return self.X_old, self.Y_old, self.Z_old
 
 
+    def _segment_matrices(self, chains, do_tilt=True):
+        """Returns array of 4x4 affine matrices of segment to top frame transformations for chains of get_segment_chains."""
+        return np.array([reduce(np.matmul, [g.transform_matrix(do_tilt) for g in c[::-1]]) for c in chains])
+
+
+    def _pixel_coords_of_segments(self, geo, do_tilt=True):
+        """Returns pixel X,Y,Z arrays for geo evaluated by transformations batched over all segments at each level
+           of hierarchy, with results identical to recursive GeometryObject.get_pixel_coords.
+           Segments are identified by 4x4 affine matrices composed over their chains of parents,
+           coordinates of segments with unchanged matrices are re-used from cache.
+           Returns None for hierarchies with CSPAD2X2:V1 (pixel shuffling), different depth, or non-uniform segment shapes.
+        """
+        chains = geo.get_segment_chains()
+        if not chains\
+        or len(set(len(c) for c in chains)) > 1\
+        or any(g.oname == 'CSPAD2X2:V1' for g in self.list_of_geos): return None
+        mats = self._segment_matrices(chains, do_tilt)
+        key = (geo.oname, geo.oindex, do_tilt)
+        cached = self.seg_coords_cache.get(key, None)
+        changed = np.arange(len(chains))
+        if cached is not None and cached[0].shape == mats.shape:
+            changed = np.flatnonzero(np.any(mats != cached[0], axis=(1,2)))
+            if changed.size == 0: return cached[2]
+
+        algos = [c[0].algo for c in chains]
+        templates = {id(a):np.asarray(a.pixel_coord_array(), dtype=np.float64) for a in algos}
+        shapes = set(t.shape for t in templates.values())
+        if len(shapes) > 1: return None
+        seg_shape = shapes.pop()[1:]
+
+        xyz = cached[1].copy() if changed.size < len(chains) else\
+              np.empty((3, len(chains)) + tuple(seg_shape), dtype=np.float64) # arrays returned earlier are not modified
+
+        logger.debug('evaluate pixel coordinates for %d of %d segments' % (changed.size, len(chains)))
+        for ida, t in templates.items():
+            inds = [i for i in changed if id(algos[i]) == ida]
+            if not inds: continue
+            X, Y, Z = [np.broadcast_to(a, (len(inds),) + tuple(seg_shape)) for a in t]
+            for level in range(len(chains[0])):
+                X, Y, Z = transform_geo_coord_arrays_batch([chains[i][level] for i in inds], X, Y, Z, do_tilt)
+            xyz[0, inds], xyz[1, inds], xyz[2, inds] = X, Y, Z
+
+        xyz_geo = xyz.reshape((3,) + tuple(geo.get_geo_shape()))
+        self.seg_coords_cache[key] = (mats, xyz, xyz_geo)
+        return xyz_geo
+
+
     def get_pixel_xy_at_z(self, zplane=None, oname=None, oindex=0, do_tilt=True, cframe=0):
         """Returns pixel coordinate arrays XatZ, YatZ, for specified zplane and geometry object.
 
@@ -615,17 +694,16 @@ class GeometryAccess:
         """
         if not self.valid: return None, None
 
-        if  oindex  == self.oindex_old\
-        and oname   == self.oname_old\
-        and do_tilt == self.tilt_old\
-        and cframe  == self.cframe_old\
+        X, Y, Z = self.get_pixel_coords(oname, oindex, do_tilt, cframe)
+
+        if  X is self.XY_src_old\
         and pix_scale_size_um is None\
         and xy0_off_pix is None\
         and self.rows_old is not None:
             return self.rows_old, self.cols_old
 
-        X, Y, Z = self.get_pixel_coords(oname, oindex, do_tilt, cframe)
         self.rows_old, self.cols_old = self.xy_to_rc_arrays(X, Y, pix_scale_size_um, xy0_off_pix, cframe)
+        self.XY_src_old = X if pix_scale_size_um is None and xy0_off_pix is None else None
         return self.rows_old, self.cols_old
 
 
@@ -635,6 +713,7 @@ class GeometryAccess:
         if not self.valid: return None, None
         X, Y = self.get_pixel_xy_at_z(zplane, oname, oindex, do_tilt, cframe)
         self.rows_old, self.cols_old = self.xy_to_rc_arrays(X, Y, pix_scale_size_um, xy0_off_pix, cframe)
+        self.XY_src_old = None
         return self.rows_old, self.cols_old
 
 
@@ -48,10 +48,14 @@ Usage::
     geo.add_child(child)
     Xt, Yt, Zt = geo.transform_geo_coord_arrays(X, Y, Z, do_tilt=True)
     Xt, Yt     = geo.transform_2d_geo_coord_arrays(X, Y, do_tilt=True)
+    m          = geo.transform_matrix(do_tilt=True)
+    chains     = geo.get_segment_chains() # list of [segment-geo, its parent, ..., geo]
+    shape      = geo.get_geo_shape()
 
     # global methods:
     Xrot, Yrot = rotation_cs(X, Y, C, S)
     Xrot, Yrot = rotation(X, Y, angle_deg)
+    Xt, Yt, Zt = transform_geo_coord_arrays_batch(geos, X, Y, Z, do_tilt=True)
 
     # global methods only for CSPAD2x2 array conversion between (2,185,388) and (185,388,2):
     arrTwo2x1 = data2x2ToTwo2x1(asData2x2)
@@ -90,6 +94,32 @@ def rotation(X, Y, angle_deg):
     return rotation_cs(X, Y, C, S)
 
 
+def transform_geo_coord_arrays_batch(geos, X, Y, Z, do_tilt=True):
+    """The same as GeometryObject.transform_geo_coord_arrays for a list of geometry objects
+       and X, Y, Z arrays shaped as (len(geos), ...) with the same element-wise operations, i.e. identical results.
+    """
+    shape = (len(geos),) + (1,) * (X.ndim - 1)
+    def pars(f): return np.array([f(g) for g in geos], dtype=np.float64).reshape(shape)
+    def cs(f):
+        rads = [radians(f(g)) for g in geos]
+        return np.array([cos(r) for r in rads]).reshape(shape), np.array([sin(r) for r in rads]).reshape(shape)
+
+    Cz, Sz = cs(lambda g: g.rot_z + g.tilt_z if do_tilt else g.rot_z)
+    Cy, Sy = cs(lambda g: g.rot_y + g.tilt_y if do_tilt else g.rot_y)
+    Cx, Sx = cs(lambda g: g.rot_x + g.tilt_x if do_tilt else g.rot_x)
+
+    def rot(X, Y, C, S): # rotation by zero angles is skipped: X*1-Y*0 == X
+        return (X, Y) if (C == 1).all() and (S == 0).all() else rotation_cs(X, Y, C, S)
+    def shift(X, X0):
+        return X if (X0 == 0).all() else X + X0
+
+    X1, Y1 = rot(X,  Y,  Cz, Sz)
+    Z2, X2 = rot(Z,  X1, Cy, Sy)
+    Y3, Z3 = rot(Y1, Z2, Cx, Sx)
+
+    return shift(X2, pars(lambda g: g.x0)), shift(Y3, pars(lambda g: g.y0)), shift(Z3, pars(lambda g: g.z0))
+
+
 class GeometryObject:
 
     def __init__(self, pname=None, pindex=None,\
@@ -241,6 +271,45 @@ class GeometryObject:
         return Xt, Yt, Zt
 
 
+    def transform_matrix(self, do_tilt=True):
+        """ Returns 4x4 affine matrix of transformation to the parent frame, the same as transform_geo_coord_arrays.
+        """
+        angle_z = self.rot_z + self.tilt_z if do_tilt else self.rot_z
+        angle_y = self.rot_y + self.tilt_y if do_tilt else self.rot_y
+        angle_x = self.rot_x + self.tilt_x if do_tilt else self.rot_x
+
+        cz, sz = cos(radians(angle_z)), sin(radians(angle_z))
+        cy, sy = cos(radians(angle_y)), sin(radians(angle_y))
+        cx, sx = cos(radians(angle_x)), sin(radians(angle_x))
+
+        rz = np.array(((cz, -sz, 0), (sz, cz, 0), (0, 0, 1)))
+        ry = np.array(((cy, 0, sy), (0, 1, 0), (-sy, 0, cy)))
+        rx = np.array(((1, 0, 0), (0, cx, -sx), (0, sx, cx)))
+
+        m = np.eye(4)
+        m[:3,:3] = rx @ ry @ rz
+        m[:3,3] = self.x0, self.y0, self.z0
+        return m
+
+
+    def get_segment_chains(self):
+        """ Returns list of chains [segment, its parent, ..., self] for all segments of self object
+            in the order of pixel arrays of get_pixel_coords.
+        """
+        if self.algo is not None: return [[self,]]
+        chains = []
+        for child in self.list_of_children:
+            chains += [c + [self,] for c in child.get_segment_chains()]
+        return chains
+
+
+    def get_geo_shape(self):
+        """ Returns shape of pixel arrays of get_pixel_coords (w/o det_shape conversion).
+        """
+        if self.algo is not None: return self.algo.pixel_coord_array()[0].shape
+        return (len(self.list_of_children),) + tuple(self.list_of_children[0].get_geo_shape())
+
+
     def get_pixel_coords(self, do_tilt=True):
         """ Returns three numpy arrays with pixel X, Y, Z coordinates for self geometry object.
         """
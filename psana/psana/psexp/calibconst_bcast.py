@@ -0,0 +1,213 @@
+""" Distributes calibration constants from rank 0 to all psana ranks.
+
+The constants ({det_name: {ctype: (data, doc)}}) are split into a small
+skeleton (docs and non-array data, sent with pickled bcast) and the numpy
+payloads, which are sent as raw buffers with Bcast into pre-allocated
+arrays. Modes (PS_CALIB_BCAST):
+
+    pickle  pickled bcast of the whole dictionary (old behavior)
+    raw     raw-buffer Bcast, every rank keeps its own copy (default)
+    shmem   raw-buffer Bcast among one leader rank per node into a
+            node-local shared memory window (MPI.Win.Allocate_shared);
+            other ranks on the node use read-only views of that window.
+
+In all modes, nothing is re-sent when the document ids of the constants
+are the same as in the previous run. In shmem mode, a window is the base
+object of its arrays and is freed (collectively, at the next bcast) only
+when no rank of the node holds any of its arrays anymore, so constants of
+a previous run stay valid as long as they are referenced.
+"""
+import os
+import weakref
+import numpy as np
+
+from psana.psexp.tools import mode
+if mode == 'mpi':
+    from mpi4py import MPI
+
+import logging
+logger = logging.getLogger(__name__)
+
+PS_CALIB_BCAST = os.environ.get('PS_CALIB_BCAST', 'raw')
+
+# Largest message sent by a single Bcast (MPI counts are int)
+MAX_BCAST_NBYTES = 0x40000000
+ALIGN_NBYTES = 64
+
+
+class _ArrayRef(object):
+    """ Placeholder of a numpy payload in the skeleton."""
+    def __init__(self, i_array, shape, dtype):
+        self.i_array = i_array
+        self.shape = shape
+        self.dtype = dtype
+
+
+def get_doc_ids(calibconst):
+    """ Returns {det_name: {ctype: doc _id}} used for detecting changes between runs."""
+    if calibconst is None:
+        return None
+    doc_ids = {}
+    for det_name, det_calibconst in calibconst.items():
+        if not det_calibconst:
+            doc_ids[det_name] = None
+            continue
+        doc_ids[det_name] = {ctype: (doc.get('_id', None) if isinstance(doc, dict) else None) \
+                for ctype, (_, doc) in det_calibconst.items()}
+    return doc_ids
+
+
+def _is_comparable(doc_ids):
+    """ Constants can only be compared when all documents have ids."""
+    if doc_ids is None:
+        return False
+    return all([None not in det_doc_ids.values() for det_doc_ids in doc_ids.values() if det_doc_ids])
+
+
+def _split(calibconst):
+    """ Replaces numpy payloads with _ArrayRef and returns (skeleton, arrays)."""
+    arrays = []
+    if calibconst is None:
+        return None, arrays
+    skeleton = {}
+    for det_name, det_calibconst in calibconst.items():
+        if not det_calibconst:
+            skeleton[det_name] = det_calibconst
+            continue
+        skeleton[det_name] = {}
+        for ctype, (data, doc) in det_calibconst.items():
+            if isinstance(data, np.ndarray) and not data.dtype.hasobject:
+                data = np.ascontiguousarray(data)
+                skeleton[det_name][ctype] = (_ArrayRef(len(arrays), data.shape, data.dtype.str), doc)
+                arrays.append(data)
+            else:
+                skeleton[det_name][ctype] = (data, doc)
+    return skeleton, arrays
+
+
+def _join(skeleton, arrays):
+    if skeleton is None:
+        return None
+    calibconst = {}
+    for det_name, det_skeleton in skeleton.items():
+        if not det_skeleton:
+            calibconst[det_name] = det_skeleton
+            continue
+        calibconst[det_name] = {ctype: (arrays[data.i_array] if isinstance(data, _ArrayRef) else data, doc) \
+                for ctype, (data, doc) in det_skeleton.items()}
+    return calibconst
+
+
+class _SharedBuffer(object):
+    """ Memory of a shared window exposed as the base object of its arrays."""
+    def __init__(self, win, nbytes):
+        buf, _ = win.Shared_query(0)
+        self.buf = buf
+        address = np.frombuffer(buf, dtype=np.uint8).__array_interface__['data'][0]
+        self.__array_interface__ = {'shape': (max(nbytes, 1),), 'typestr': '|u1', 'data': (address, False), 'version': 3}
+
+
+def _bcast_bytes(comm, buf):
+    """ Bcasts uint8 buffer from rank 0 in pieces of at most MAX_BCAST_NBYTES."""
+    for st in range(0, buf.shape[0], MAX_BCAST_NBYTES):
+        piece = buf[st:st+MAX_BCAST_NBYTES]
+        comm.Bcast([piece, piece.shape[0], MPI.BYTE], root=0)
+
+
+def _get_offsets(refs):
+    """ Returns aligned byte offsets of the arrays in one contiguous buffer and total size."""
+    offsets = []
+    nbytes = 0
+    for ref in refs:
+        offsets.append(nbytes)
+        size = int(np.prod(ref.shape, dtype=np.int64)) * np.dtype(ref.dtype).itemsize
+        nbytes += (size + ALIGN_NBYTES - 1) // ALIGN_NBYTES * ALIGN_NBYTES
+    return offsets, nbytes
+
+
+def _iter_refs(skeleton):
+    if skeleton is None:
+        return []
+    refs = [data for det_skeleton in skeleton.values() if det_skeleton \
+            for data, _ in det_skeleton.values() if isinstance(data, _ArrayRef)]
+    return sorted(refs, key=lambda ref: ref.i_array)
+
+
+class CalibConstBcast(object):
+    """ Sends calibration constants of each run from rank 0 of comm to all ranks."""
+
+    def __init__(self, comm, bcast_mode=PS_CALIB_BCAST):
+        self.comm = comm
+        self.bcast_mode = bcast_mode
+        self.doc_ids = None
+        self.calibconst = None
+        self.windows = []   # (shared window, weakref to its _SharedBuffer) (shmem mode)
+        self.node_comm = None
+        self.leader_comm = None
+        if self.bcast_mode == 'shmem':
+            self.node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED, key=comm.Get_rank())
+            color = 0 if self.node_comm.Get_rank() == 0 else MPI.UNDEFINED
+            self.leader_comm = comm.Split(color, key=comm.Get_rank())
+
+    def bcast(self, calibconst):
+        """ Returns calibconst of rank 0 on all ranks (input is ignored on other ranks)."""
+        if self.bcast_mode == 'pickle':
+            return self.comm.bcast(calibconst, root=0)
+
+        rank = self.comm.Get_rank()
+        doc_ids = self.comm.bcast(get_doc_ids(calibconst) if rank == 0 else None, root=0)
+        if self.bcast_mode == 'shmem':
+            self._free_windows()
+        if self.calibconst is not None and _is_comparable(doc_ids) and doc_ids == self.doc_ids:
+            logger.debug('calibconst_bcast: same constants as previous run, skipped')
+            return self.calibconst
+
+        skeleton, arrays = _split(calibconst) if rank == 0 else (None, [])
+        skeleton = self.comm.bcast(skeleton, root=0)
+        refs = _iter_refs(skeleton)
+        if self.bcast_mode == 'shmem':
+            arrays = self._bcast_shmem(refs, arrays)
+        else:
+            arrays = self._bcast_raw(refs, arrays)
+
+        self.doc_ids = doc_ids
+        self.calibconst = _join(skeleton, arrays)
+        return self.calibconst
+
+    def _free_windows(self):
+        """ Frees shared windows whose arrays are not referenced on any rank of the node
+            (collective call for node_comm)."""
+        in_use = [ref() is not None for _, ref in self.windows]
+        in_use = [any(flags) for flags in zip(*self.node_comm.allgather(in_use))]
+        for (win, _), used in zip(self.windows, in_use):
+            if not used:
+                win.Free()
+        self.windows = [window for window, used in zip(self.windows, in_use) if used]
+
+    def _bcast_raw(self, refs, arrays):
+        if self.comm.Get_rank() != 0:
+            arrays = [np.empty(ref.shape, dtype=ref.dtype) for ref in refs]
+        for arr in arrays:
+            _bcast_bytes(self.comm, arr.reshape(-1).view(np.uint8))
+        return arrays
+
+    def _bcast_shmem(self, refs, arrays):
+        offsets, nbytes = _get_offsets(refs)
+        node_rank = self.node_comm.Get_rank()
+        win = MPI.Win.Allocate_shared(max(nbytes, 1) if node_rank == 0 else 0, 1, comm=self.node_comm)
+        shared_buf = _SharedBuffer(win, nbytes)
+        self.windows.append((win, weakref.ref(shared_buf)))
+        buf = np.asarray(shared_buf)
+
+        shared = [np.ndarray(buffer=buf, dtype=ref.dtype, shape=ref.shape, offset=offset) \
+                for ref, offset in zip(refs, offsets)]
+        if self.comm.Get_rank() == 0:
+            for src, dst in zip(arrays, shared):
+                dst[...] = src
+        if node_rank == 0:
+            _bcast_bytes(self.leader_comm, buf[:nbytes])
+        self.node_comm.Barrier()
+
+        for arr in shared:
+            arr.setflags(write=False)
+        return shared
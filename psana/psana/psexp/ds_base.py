@@ -11,6 +11,7 @@ import time
 from psana.dgrammanager import DgramManager
 
 from psana.psexp import PrometheusManager, SmdReaderManager
+from psana.psexp.file_follower import get_follower
 import threading
 from psana import dgram
 
@@ -250,6 +251,10 @@ class DataSourceBase(abc.ABC):
                 true_xtc_file = inprogress_file
 
         # Retry if live mode is set
+        exists = lambda: os.path.isfile(xtc_file) or os.path.isfile(inprogress_file)
+        if self.current_retry_no < self.dsparms.max_retries:
+            follower = get_follower()
+            follower.watch(xtc_file)
         while self.current_retry_no < self.dsparms.max_retries:
             file_found = os.path.isfile(xtc_file)
             if file_found == False:
@@ -260,7 +265,8 @@ class DataSourceBase(abc.ABC):
                 break
             self.current_retry_no += 1
             print(f'Waiting for {xtc_file} ...(#retry:{self.current_retry_no})')
-            time.sleep(1)
+            # Wakes up as soon as the file is created (see FileFollower)
+            follower.wait_until(exists, 1, names=[xtc_file])
         return file_found, true_xtc_file
 
     def _get_file_info_from_db(self, runnum):
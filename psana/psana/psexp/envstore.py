@@ -4,6 +4,56 @@ from collections import defaultdict
 import os
 from psana.detector.detector_impl import DetectorImpl
 
+
+class GrowableArray(object):
+    """ Append-friendly typed numpy array (capacity doubles when full)."""
+
+    def __init__(self, dtype, capacity=64):
+        self._buf = np.empty(capacity, dtype=dtype)
+        self.n_items = 0
+
+    def append(self, val):
+        if self.n_items == self._buf.shape[0]:
+            new_buf = np.empty(2 * self._buf.shape[0], dtype=self._buf.dtype)
+            new_buf[:self.n_items] = self._buf[:self.n_items]
+            self._buf = new_buf
+        self._buf[self.n_items] = val
+        self.n_items += 1
+
+    @property
+    def array(self):
+        return self._buf[:self.n_items]
+
+
+class EnvColumn(object):
+    """ Values of one env variable for the env dgrams of an EnvManager.
+
+    last_pos[p] is the position of the latest dgram at or before p that
+    has the variable (-1 if none) and values[last_pos[p]] is its value.
+    The column is extended with the dgrams added since the last lookup.
+    """
+
+    def __init__(self, env_name, alg, segment_id, var_name):
+        self.env_name   = env_name
+        self.alg        = alg
+        self.segment_id = segment_id
+        self.var_name   = var_name
+        self.values     = []
+        self.last_pos   = GrowableArray(np.int64)
+
+    def update(self, dgrams):
+        for p in range(self.last_pos.n_items, len(dgrams)):
+            last_pos = self.last_pos.array[p-1] if p > 0 else -1
+            val = None
+            if hasattr(dgrams[p], self.env_name):
+                envs = getattr(dgrams[p], self.env_name)
+                if self.segment_id in envs and hasattr(envs[self.segment_id], self.alg):
+                    val = getattr(getattr(envs[self.segment_id], self.alg), self.var_name, None)
+                    last_pos = p
+            self.values.append(val)
+            self.last_pos.append(last_pos)
+
+
 class EnvManager(object):
     """ Store list of Env dgrams, timestamps, and variables 
     for a single smd file. EnvStore own the objects created
@@ -15,14 +65,15 @@ class EnvManager(object):
         self.config     = config
         self.env_name   = env_name
         self.dgrams     = []
-        self._timestamps= [] # save as a list of d.timestamp
+        self._timestamps= GrowableArray(np.uint64) # timestamps of the dgrams
         self.n_items    = 0
+        self._columns   = {}
 
         self._init_env_variables()
 
     @property
     def timestamps(self):
-        return np.asarray(self._timestamps, dtype=np.uint64)
+        return self._timestamps.array
 
     def _init_env_variables(self):
         """ From the given config, build a list of variables from
@@ -69,6 +120,21 @@ class EnvManager(object):
         self.dgrams.append(d)
         self._timestamps.append(d.timestamp())
         self.n_items += 1
+
+    def get_column(self, var_name):
+        """ Returns up-to-date EnvColumn of the variable or None if this
+        config does not have it."""
+        if var_name not in self._columns:
+            env_var_loc = self.locate_variable(var_name)
+            if env_var_loc is None:
+                self._columns[var_name] = None
+            else:
+                alg, segment_id = env_var_loc
+                self._columns[var_name] = EnvColumn(self.env_name, alg, segment_id, var_name)
+        column = self._columns[var_name]
+        if column is not None:
+            column.update(self.dgrams)
+        return column
     
     def is_empty(self):
         return self.env_variables
@@ -158,43 +224,44 @@ class EnvStore(object):
 
     
     def values(self, events, env_variable):
-        """ Returns values of the env_variable for the given events.
+        """ Returns values of the env_variable for the given events (or
+        numpy array of timestamps).
 
         First search for env file that has this variable (return algorithm e.g.
         fast/slow) then for that env file, locate position of env dgram that
         has ts_env <= ts_evt. If the dgram at found position has the algorithm
         then returns the value, otherwise keeps searching backward until 
-        PS_N_env_SEARCH_STEPS is reached."""
+        PS_N_env_SEARCH_STEPS is reached. All events are resolved with one
+        searchsorted per env file on the precomputed column of the variable."""
         
         PS_N_STEP_SEARCH_STEPS = int(os.environ.get("PS_N_STEP_SEARCH_STEPS", "10"))
-        env_values = []
-
-        for evt in events:
-            event_timestamp = np.array([evt.timestamp], dtype=np.uint64)
-
-            # For epics and scan detectors, locate variable and return its value
-            for i, env_man in enumerate(self.env_managers):
-                val = None
-                env_var_loc = env_man.locate_variable(env_variable) # check if this xtc has the variable
-                if env_var_loc:
-                    alg, segment_id = env_var_loc
-                    found_pos = np.searchsorted(env_man.timestamps, event_timestamp)[0]
-                    
-                    if found_pos == env_man.n_items: # this event is the last step or the events after
-                        found_pos -= 1
-                    
-                    for p in range(found_pos, found_pos - PS_N_STEP_SEARCH_STEPS, -1):
-                        if p < 0:
-                            break
-                        env_d = env_man.dgrams[p]
-                        if hasattr(env_man.dgrams[p], self.env_name):
-                            envs = getattr(env_man.dgrams[p], self.env_name)[segment_id]
-                            if hasattr(envs, alg):
-                                val = getattr(getattr(envs, alg), env_variable)
-                                break
-                    
-                    if val is not None: break # found the value from this env manager
-            env_values.append(val)
+
+        if isinstance(events, np.ndarray):
+            event_timestamps = events.astype(np.uint64, copy=False)
+        else:
+            event_timestamps = np.array([evt.timestamp for evt in events], dtype=np.uint64)
+        env_values = [None] * event_timestamps.shape[0]
+        not_found = np.ones(event_timestamps.shape[0], dtype=np.bool_)
+
+        # For epics and scan detectors, locate variable and return its value
+        for i, env_man in enumerate(self.env_managers):
+            column = env_man.get_column(env_variable) # check if this xtc has the variable
+            if column is None or env_man.n_items == 0:
+                continue
+
+            found_pos = np.searchsorted(env_man.timestamps, event_timestamps)
+            # this event is the last step or the events after
+            found_pos[found_pos == env_man.n_items] -= 1
+
+            last_pos = column.last_pos.array[found_pos]
+            valid = not_found & (last_pos >= 0) & (found_pos - last_pos < PS_N_STEP_SEARCH_STEPS)
+            for i_evt in np.flatnonzero(valid):
+                val = column.values[last_pos[i_evt]]
+                if val is not None:
+                    env_values[i_evt] = val
+                    not_found[i_evt] = False # found the value from this env manager
+
+            if not np.any(not_found): break
 
         return env_values
 
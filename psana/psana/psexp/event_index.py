@@ -0,0 +1,366 @@
+""" Persistent per-run event index.
+
+The index is a small columnar (.npz) file stored next to the smd files
+(xtc_dir/smalldata/<exp>-r<run>.smd.idx.npz) with one row per timestamp
+found in any of the smd files of the run:
+
+    timestamps      (n_rows,)             uint64
+    services        (n_rows,)             uint8
+    smd_offsets     (n_rows, n_streams)   int64   (-1 if missing in the stream)
+    smd_sizes       (n_rows, n_streams)   uint32
+    bd_offsets      (n_rows, n_streams)   int64   (-1 if no bigdata)
+    bd_sizes        (n_rows, n_streams)   uint32
+    chunk_ids       (n_rows, n_streams)   int16   (bigdata chunk file of the row)
+
+With it, an event can be read directly from the files (see
+IndexedEventReader) instead of streaming all the smd data through
+SmdReader and EventBuilder. The index is built once with the
+build_event_index app (or lazily on first use).
+"""
+import os
+import glob
+import numpy as np
+from psana import dgram
+from psana.event import Event
+from . import TransitionId
+
+import logging
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+INDEX_SUFFIX  = '.smd.idx.npz'
+
+
+def get_stream_key(filename):
+    """ Returns name of the stream w/o chunk id and extensions.
+
+    E.g. xpptut15-r0001-s000-c000.smd.xtc2.inprogress -> xpptut15-r0001-s000
+    """
+    basename = os.path.basename(filename)
+    basename = basename.split('.smd.xtc2')[0].split('.xtc2')[0]
+    st = basename.rfind('-c')
+    if st > 0:
+        basename = basename[:st]
+    return basename
+
+
+def _get_chunk_id(filename):
+    basename = os.path.basename(filename).split('.smd.xtc2')[0].split('.xtc2')[0]
+    st = basename.rfind('-c')
+    if st > 0 and basename[st+2:].isdigit():
+        return int(basename[st+2:])
+    return 0
+
+
+def get_index_filename(xtc_files):
+    """ Returns index filename of the run that these bigdata files belong to."""
+    stream_key = get_stream_key(xtc_files[0])
+    run_prefix = stream_key[:stream_key.rfind('-s')] if '-s' in stream_key else stream_key
+    return os.path.join(os.path.dirname(xtc_files[0]), 'smalldata', run_prefix + INDEX_SUFFIX)
+
+
+def get_run_smd_files(xtc_files):
+    """ Returns all smd files (all streams) of the run."""
+    index_filename = get_index_filename(xtc_files)
+    run_prefix = os.path.basename(index_filename)[:-len(INDEX_SUFFIX)]
+    smd_dir = os.path.dirname(index_filename)
+    smd_files = sorted(glob.glob(os.path.join(smd_dir, f'{run_prefix}-s*.smd.xtc2')) + \
+            glob.glob(os.path.join(smd_dir, f'{run_prefix}-s*.smd.xtc2.inprogress')))
+
+    # Only keep the first chunk of each stream (chunks of a stream are
+    # found via chunkinfo in the Enable transition).
+    first_chunks = {}
+    for smd_file in smd_files:
+        key = get_stream_key(smd_file)
+        if key not in first_chunks or _get_chunk_id(smd_file) < _get_chunk_id(first_chunks[key]):
+            first_chunks[key] = smd_file
+    return [first_chunks[key] for key in sorted(first_chunks)]
+
+
+def _scan_smd_file(smd_file):
+    """ Reads all dgrams of an smd file and returns columns of this stream."""
+    cols = {'timestamps': [], 'services': [], 'smd_offsets': [], 'smd_sizes': [],
+            'bd_offsets': [], 'bd_sizes': [], 'chunk_ids': []}
+    chunk_id = _get_chunk_id(smd_file)
+    chunk_filenames = {chunk_id: os.path.basename(smd_file).split('.smd')[0] + '.xtc2'}
+
+    fd = os.open(smd_file, os.O_RDONLY)
+    try:
+        config = dgram.Dgram(file_descriptor=fd, max_retries=0)
+        offset = config._size
+        while True:
+            try:
+                d = dgram.Dgram(config=config, max_retries=0)
+            except StopIteration:
+                break
+
+            service = d.service()
+            bd_offset, bd_size = -1, 0
+            if service == TransitionId.L1Accept and hasattr(d, 'smdinfo'):
+                bd_offset = d.smdinfo[0].offsetAlg.intOffset
+                bd_size = d.smdinfo[0].offsetAlg.intDgramSize
+            elif service == TransitionId.Enable and hasattr(d, 'chunkinfo'):
+                for seg_id in d.chunkinfo:
+                    chunkinfo = d.chunkinfo[seg_id].chunkinfo
+                    if chunkinfo.chunkid > chunk_id:
+                        chunk_id = chunkinfo.chunkid
+                        chunk_filenames[chunk_id] = chunkinfo.filename
+                    break
+
+            cols['timestamps'].append(d.timestamp())
+            cols['services'].append(service)
+            cols['smd_offsets'].append(offset)
+            cols['smd_sizes'].append(d._size)
+            cols['bd_offsets'].append(bd_offset)
+            cols['bd_sizes'].append(bd_size)
+            cols['chunk_ids'].append(chunk_id)
+            offset += d._size
+    finally:
+        os.close(fd)
+
+    return cols, chunk_filenames
+
+
+class EventIndex(object):
+    """ Columns of the event index (see module docstring)."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.stream_keys = [str(key) for key in columns['stream_keys']]
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    @property
+    def n_rows(self):
+        return self.columns['timestamps'].shape[0]
+
+    def get_stream_columns(self, files):
+        """ Returns column no. of the given (smd or bigdata) files in this index
+        or None when one or more of the streams are not indexed."""
+        cols = []
+        for filename in files:
+            key = get_stream_key(filename)
+            if key not in self.stream_keys:
+                return None
+            cols.append(self.stream_keys.index(key))
+        return np.asarray(cols, dtype=np.int64)
+
+    def get_chunk_filename(self, col, chunk_id):
+        return str(self.columns['chunk_filenames'][col, chunk_id])
+
+    def get_run_rows(self, run_timestamp):
+        """ Returns first and last+1 rows of the run that begins at run_timestamp
+        (from BeginRun to its EndRun or to the end of the index)."""
+        timestamps = self.columns['timestamps']
+        services = self.columns['services']
+        st = np.searchsorted(timestamps, np.uint64(run_timestamp))
+        endruns = np.where(services[st:] == TransitionId.EndRun)[0]
+        en = st + endruns[0] + 1 if endruns.size else timestamps.shape[0]
+        return st, en
+
+    def get_run_end_offsets(self, run_timestamp, smd_files):
+        """ Returns offsets right after the EndRun of the run in the given smd
+        files or None if the EndRun (or one of the streams) is not indexed."""
+        cols = self.get_stream_columns(smd_files)
+        if cols is None:
+            return None
+        st, en = self.get_run_rows(run_timestamp)
+        row = en - 1
+        if en <= st or self.columns['services'][row] != TransitionId.EndRun:
+            return None
+        offsets = self.columns['smd_offsets'][row, cols]
+        if np.any(offsets < 0):
+            return None
+        return offsets + self.columns['smd_sizes'][row, cols]
+
+    def is_stale(self, smd_files):
+        """ Checks if the indexed smd files have changed size since the index was built."""
+        for smd_file, file_size in zip(smd_files, self.columns['smd_file_sizes']):
+            if not os.path.exists(smd_file) or os.path.getsize(smd_file) != file_size:
+                return True
+        return False
+
+    def save(self, filename):
+        # Write to a temporary file first so that readers never see a partial index
+        tmp_filename = filename + f'.tmp{os.getpid()}'
+        with open(tmp_filename, 'wb') as f:
+            np.savez(f, **self.columns)
+        os.replace(tmp_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            columns = {key: data[key] for key in data.files}
+        if int(columns.get('version', 0)) != INDEX_VERSION:
+            raise ValueError(f'Unsupported event index version in {filename}')
+        return cls(columns)
+
+    @classmethod
+    def build(cls, smd_files):
+        """ Builds the index by reading through all the given smd files."""
+        stream_cols = []
+        all_chunk_filenames = []
+        for smd_file in smd_files:
+            cols, chunk_filenames = _scan_smd_file(smd_file)
+            stream_cols.append({key: np.asarray(val, dtype=np.uint64 if key == 'timestamps' else np.int64) \
+                    for key, val in cols.items()})
+            all_chunk_filenames.append(chunk_filenames)
+            logger.debug(f'event_index: scanned {smd_file} ({len(cols["timestamps"])} dgrams)')
+
+        n_streams = len(smd_files)
+        timestamps = np.unique(np.concatenate([cols['timestamps'] for cols in stream_cols]
+            + [np.zeros(0, dtype=np.uint64)]))
+        n_rows = timestamps.shape[0]
+
+        columns = {
+            'version':          np.int64(INDEX_VERSION),
+            'timestamps':       timestamps,
+            'services':         np.zeros(n_rows, dtype=np.uint8),
+            'smd_offsets':      np.full((n_rows, n_streams), -1, dtype=np.int64),
+            'smd_sizes':        np.zeros((n_rows, n_streams), dtype=np.uint32),
+            'bd_offsets':       np.full((n_rows, n_streams), -1, dtype=np.int64),
+            'bd_sizes':         np.zeros((n_rows, n_streams), dtype=np.uint32),
+            'chunk_ids':        np.zeros((n_rows, n_streams), dtype=np.int16),
+            'stream_keys':      np.asarray([get_stream_key(smd_file) for smd_file in smd_files], dtype=str),
+            'smd_filenames':    np.asarray([os.path.basename(smd_file).replace('.inprogress', '') for smd_file in smd_files], dtype=str),
+            'smd_file_sizes':   np.asarray([os.path.getsize(smd_file) for smd_file in smd_files], dtype=np.int64),
+        }
+
+        max_chunk_id = max([max(chunk_filenames) for chunk_filenames in all_chunk_filenames] + [0])
+        chunk_filenames = np.full((n_streams, max_chunk_id + 1), '', dtype=object)
+        for i_smd, cols in enumerate(stream_cols):
+            rows = np.searchsorted(timestamps, cols['timestamps'])
+            columns['services'][rows] = cols['services']
+            for key in ('smd_offsets', 'smd_sizes', 'bd_offsets', 'bd_sizes', 'chunk_ids'):
+                columns[key][rows, i_smd] = cols[key]
+            for chunk_id, chunk_filename in all_chunk_filenames[i_smd].items():
+                chunk_filenames[i_smd, chunk_id] = chunk_filename
+        columns['chunk_filenames'] = chunk_filenames.astype(str)
+
+        return cls(columns)
+
+
+def get_event_index(xtc_files, build=True, save=True):
+    """ Returns event index of the run that these bigdata files belong to.
+
+    The saved index is used when it exists and is up to date. Otherwise,
+    the index is built (when build=True) and saved next to the smd files
+    when possible (runs still being written are not saved).
+    """
+    index_filename = get_index_filename(xtc_files)
+    smd_files = get_run_smd_files(xtc_files)
+    if os.path.exists(index_filename):
+        try:
+            index = EventIndex.load(index_filename)
+            if not index.is_stale(smd_files) and index.get_stream_columns(xtc_files) is not None:
+                return index
+            logger.debug(f'event_index: {index_filename} is out of date')
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f'event_index: cannot load {index_filename} ({e})')
+
+    if not build or not smd_files:
+        return None
+
+    index = EventIndex.build(smd_files)
+    in_progress = any([smd_file.endswith('.inprogress') for smd_file in smd_files])
+    if save and not in_progress:
+        try:
+            index.save(index_filename)
+        except OSError as e:
+            logger.debug(f'event_index: cannot save {index_filename} ({e})')
+    return index
+
+
+class IndexedEventReader(object):
+    """ Reads events of a run directly from the files using the event index."""
+
+    def __init__(self, run, xtc_files, index=None):
+        self.run        = run
+        self.index      = get_event_index(xtc_files) if index is None else index
+        if self.index is None:
+            raise FileNotFoundError(f'No event index found for {xtc_files[0]}')
+        self.cols       = self.index.get_stream_columns(xtc_files)
+        self.xtc_dir    = os.path.dirname(xtc_files[0])
+        self.smd_dir    = os.path.join(self.xtc_dir, 'smalldata')
+        self.fds        = {}
+
+        # Rows that belong to this run: from BeginRun to the next EndRun
+        timestamps = self.index.timestamps
+        services = self.index.services
+        st, en = self.index.get_run_rows(run.timestamp)
+        rows = np.arange(st, en, dtype=np.int64)
+        # Rows with no dgram in any of the selected streams are skipped
+        rows = rows[np.any(self.index.smd_offsets[st:en][:, self.cols] >= 0, axis=1)]
+
+        is_l1 = services[rows] == TransitionId.L1Accept
+        self.l1_rows = rows[is_l1]
+        self.l1_timestamps = timestamps[self.l1_rows]
+
+        # Events are read out of order so EnvStore gets all the transitions
+        # (except BeginRun, which was already added) of this run up front.
+        for row in rows[~is_l1]:
+            if services[row] in (TransitionId.SlowUpdate, TransitionId.BeginStep):
+                run.esm.update_by_event(self._read_event(row))
+
+    @property
+    def n_events(self):
+        return self.l1_rows.shape[0]
+
+    def _get_fd(self, filename):
+        if filename not in self.fds:
+            if not os.path.exists(filename) and os.path.exists(filename + '.inprogress'):
+                filename += '.inprogress'
+            self.fds[filename] = os.open(filename, os.O_RDONLY)
+        return self.fds[filename]
+
+    def _read_event(self, row):
+        index = self.index
+        is_l1 = index.services[row] == TransitionId.L1Accept
+        dgrams = [None] * len(self.cols)
+        for i, col in enumerate(self.cols):
+            smd_offset = index.smd_offsets[row, col]
+            if smd_offset < 0:
+                continue
+            bd_offset = index.bd_offsets[row, col]
+            if is_l1 and bd_offset >= 0:
+                chunk_id = index.chunk_ids[row, col]
+                filename = os.path.join(self.xtc_dir, index.get_chunk_filename(col, chunk_id))
+                offset, size = bd_offset, index.bd_sizes[row, col]
+            else:
+                # Transitions (and streams w/o bigdata) are read from smd
+                filename = os.path.join(self.smd_dir, str(index.smd_filenames[col]))
+                offset, size = smd_offset, index.smd_sizes[row, col]
+            dgrams[i] = dgram.Dgram(file_descriptor=self._get_fd(filename),
+                    config=self.run.configs[i], offset=int(offset), size=int(size))
+        return Event(dgrams, run=self.run)
+
+    def event_at(self, i):
+        """ Returns the i-th L1Accept event of the run."""
+        if i < 0:
+            i += self.n_events
+        if i < 0 or i >= self.n_events:
+            raise IndexError(f'Event {i} out of range (no. of events: {self.n_events})')
+        return self._read_event(self.l1_rows[i])
+
+    def events(self, timestamps, rank=0, size=1):
+        """ Yields L1Accept events of the given timestamps (in time order).
+
+        Timestamps not found in the run are skipped. With size > 1, only
+        every size-th event starting from rank is yielded.
+        """
+        timestamps = np.unique(np.asarray(timestamps, dtype=np.uint64))
+        found = np.searchsorted(self.l1_timestamps, timestamps)
+        valid = found < self.n_events
+        valid[valid] = self.l1_timestamps[found[valid]] == timestamps[valid]
+        found = found[valid]
+        for i in found[rank::size]:
+            yield self._read_event(self.l1_rows[i])
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
@@ -1,16 +1,52 @@
 from psana       import dgram
 from psana.event import Event
 from psana.psexp import PacketFooter, TransitionId, PrometheusManager
+from psana.psexp.file_follower import get_follower
+from psana.psexp.tracer import traced
 import numpy as np
 import os
 import time
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 import logging
 logger = logging.getLogger(__name__)
 
+try:
+    from psana.smdindexer import index_smd_batch
+except ImportError:
+    index_smd_batch = None
+
+USE_SMD_INDEXER = int(os.environ.get('PS_SMD_INDEXER', 1))
+
 s_bd_just_read = PrometheusManager.get_metric('psana_bd_just_read')
 s_bd_gen_smd_batch = PrometheusManager.get_metric('psana_bd_gen_smd_batch')
 s_bd_gen_evt = PrometheusManager.get_metric('psana_bd_gen_evt')
+c_bd_prefetch = PrometheusManager.get_metric('psana_bd_prefetch')
+c_bd_on_demand = PrometheusManager.get_metric('psana_bd_on_demand')
+
+# Bigdata read-ahead: no. of chunks (per stream) to prefetch and the max. no. 
+# of bytes that can be held by prefetched chunks (all streams).
+BD_READAHEAD            = int(os.environ.get('PS_BD_READAHEAD', 0))
+BD_READAHEAD_MAXBYTES   = int(os.environ.get('PS_BD_READAHEAD_MAXBYTES', 0x20000000))
+BD_READAHEAD_THREADS    = int(os.environ.get('PS_BD_READAHEAD_THREADS', 4))
+
+# On-demand bigdata: bigdata dgrams of L1Accepts are only read when a detector
+# of that stream is accessed in the event (read-ahead is not used in this mode).
+BD_ON_DEMAND            = int(os.environ.get('PS_BD_ON_DEMAND', 0))
+
+_readahead_executor = None
+_readahead_lock = threading.Lock()
+
+def get_readahead_executor():
+    """ Returns thread pool shared by all EventManagers (created once)."""
+    global _readahead_executor
+    with _readahead_lock:
+        if _readahead_executor is None:
+            _readahead_executor = ThreadPoolExecutor(max_workers=BD_READAHEAD_THREADS, 
+                    thread_name_prefix='psana_bd_readahead')
+    return _readahead_executor
 
 class ExitId:
     NoError = 0
@@ -25,6 +61,9 @@ class EventManager(object):
         - w/o filter fn, fetch one big chunk of bigdata and
           replace smalldata view with the read out bigdata.
           Yield one bigdata event.
+    3) In on-demand mode (PS_BD_ON_DEMAND=1), yield L1Accept events with 
+       smd dgrams as placeholders for bigdata dgrams, which are read when 
+       a detector of the stream is first accessed (see Event._load_bigdata).
     """
     def __init__(self, view, smd_configs, dm, esm, 
             filter_fn=0, prometheus_counter=None, 
@@ -51,6 +90,7 @@ class EventManager(object):
         # Each chunk must fit in BD_CHUNKSIZE and we only fill bd buffers
         # when bd_offset reaches the size of buffer.
         self.BD_CHUNKSIZE = int(os.environ.get('PS_BD_CHUNKSIZE', 0x1000000))
+        self.on_demand = BD_ON_DEMAND
         self._get_offset_and_size()
         if self.dm.n_files > 0:
             self._init_bd_chunks()
@@ -63,13 +103,16 @@ class EventManager(object):
             self.prometheus_counter.labels(unit,'None').inc(value)
 
     @s_bd_gen_evt.time()
+    @traced('bd.gen_evt')
     def __next__(self):
         # Check in case there are some failures (I/O) happened on a core.
         # For MPI Mode, this allows clean exit.
         if self.exit_id > 0:
+            self.close_prefetch()
             raise StopIteration
 
         if self.i_evt == self.n_events: 
+            self.close_prefetch()
             raise StopIteration
         
         evt = self._get_next_evt()
@@ -98,18 +141,32 @@ class EventManager(object):
 
         current_bd_offsets[i_smd] = self.bd_offset_array[i_evt, i_smd] + self.bd_size_array[i_evt, i_smd]
         
+    def _check_new_chunk_id(self, d, i_evt, i_smd):
+        """ Flags new chunk id found in chunkinfo of this (Enable) dgram."""
+        # We only support chunking on bigdata
+        if self.dm.n_files == 0 or not hasattr(d, 'chunkinfo'): return
+
+        _chunk_ids = [getattr(d.chunkinfo[seg_id].chunkinfo, 'chunkid') for seg_id in d.chunkinfo]
+        _chunk_filenames = [getattr(d.chunkinfo[seg_id].chunkinfo, 'filename') for seg_id in d.chunkinfo]
+        # Only flag new chunk when there's chunkinfo and that chunkid is new
+        if _chunk_ids: 
+            # There must be only one unique chunkid name 
+            new_chunk_id = _chunk_ids[0]
+            new_filename = _chunk_filenames[0]
+            current_chunk_id = self.dm.get_chunk_id(i_smd)
+            if new_chunk_id > current_chunk_id:
+                self.new_chunk_id_array[i_evt, i_smd] = new_chunk_id
+                self.chunkinfo[(i_smd, new_chunk_id)] = new_filename 
+
     @s_bd_gen_smd_batch.time()
     def _get_offset_and_size(self):
         """
-        Use fast step-through to read off offset and size from smd_view.
-        Format of smd_view 
-        [
-          [[d_bytes][d_bytes]....[evt_footer]] <-- 1 event 
-          [[d_bytes][d_bytes]....[evt_footer]]
-          [chunk_footer]]
+        Read off offset and size of all dgrams in smd_view. 
+
+        Uses the compiled batch indexer (psana.smdindexer) when available 
+        and falls back to the python step-through otherwise (set 
+        PS_SMD_INDEXER=0 to always use the python path).
         """
-        offset = 0
-        i_smd = 0
         smd_chunk_pf = PacketFooter(view=self.smd_view)
         dtype = np.int64
         # Row - events, col = smd files
@@ -120,6 +177,56 @@ class EventManager(object):
         self.new_chunk_id_array = np.zeros((smd_chunk_pf.n_packets, self.n_smd_files), dtype=dtype)
         self.cutoff_flag_array  = np.ones((smd_chunk_pf.n_packets, self.n_smd_files), dtype=dtype)
         self.services           = np.zeros(smd_chunk_pf.n_packets, dtype=dtype)
+        
+        is_indexed = False
+        if index_smd_batch is not None and USE_SMD_INDEXER:
+            try:
+                index_smd_batch(self.smd_view, self.n_smd_files, self.use_smds, 
+                        self.dm.n_files > 0, self.BD_CHUNKSIZE,
+                        self.bd_offset_array, self.bd_size_array, 
+                        self.smd_offset_array, self.smd_size_array,
+                        self.cutoff_flag_array, self.services)
+                is_indexed = True
+            except ValueError as e:
+                logger.debug(f'smd batch indexer failed ({e}) - use python path')
+                self.bd_offset_array[:] = 0
+                self.bd_size_array[:] = 0
+                self.smd_offset_array[:] = 0
+                self.smd_size_array[:] = 0
+                self.cutoff_flag_array[:] = 1
+                self.services[:] = 0
+
+        if is_indexed:
+            # The indexer only reads dgram headers. Chunk info is only
+            # available in Enable dgrams, which need a full Dgram.
+            if self.dm.n_files > 0:
+                for i_evt in np.where(self.services == TransitionId.Enable)[0]:
+                    for i_smd in range(self.n_smd_files):
+                        if self.smd_size_array[i_evt, i_smd] == 0: continue
+                        d = dgram.Dgram(config=self.smd_configs[i_smd], view=self.smd_view, 
+                                offset=self.smd_offset_array[i_evt, i_smd])
+                        self._check_new_chunk_id(d, i_evt, i_smd)
+        else:
+            self._get_offset_and_size_py(smd_chunk_pf)
+
+        # Precalculate cutoff indices
+        self.cutoff_indices = []
+        self.chunk_indices  = np.zeros(self.n_smd_files, dtype=dtype)
+        for i_smd in range(self.n_smd_files):
+            self.cutoff_indices.append(np.where(self.cutoff_flag_array[:, i_smd] == 1)[0])
+
+    def _get_offset_and_size_py(self, smd_chunk_pf):
+        """
+        Use fast step-through to read off offset and size from smd_view.
+        Format of smd_view 
+        [
+          [[d_bytes][d_bytes]....[evt_footer]] <-- 1 event 
+          [[d_bytes][d_bytes]....[evt_footer]]
+          [chunk_footer]]
+        """
+        offset = 0
+        i_smd = 0
+        dtype = np.int64
         smd_aux_sizes           = np.zeros(self.n_smd_files, dtype=dtype)
         # For comparing if the next dgram should be in the same read
         current_bd_offsets      = np.zeros(self.n_smd_files, dtype=dtype) 
@@ -151,20 +258,8 @@ class EventManager(object):
                     if i_first_L1 == -1:
                         i_first_L1 = i_evt
                     self._get_bd_offset_and_size(d, current_bd_offsets, current_bd_chunk_sizes, i_evt, i_smd, i_first_L1)
-                elif d.service() == TransitionId.Enable and hasattr(d, 'chunkinfo'):
-                    # We only support chunking on bigdata
-                    if self.dm.n_files > 0: 
-                        _chunk_ids = [getattr(d.chunkinfo[seg_id].chunkinfo, 'chunkid') for seg_id in d.chunkinfo]
-                        _chunk_filenames = [getattr(d.chunkinfo[seg_id].chunkinfo, 'filename') for seg_id in d.chunkinfo]
-                        # Only flag new chunk when there's chunkinfo and that chunkid is new
-                        if _chunk_ids: 
-                            # There must be only one unique chunkid name 
-                            new_chunk_id = _chunk_ids[0]
-                            new_filename = _chunk_filenames[0]
-                            current_chunk_id = self.dm.get_chunk_id(i_smd)
-                            if new_chunk_id > current_chunk_id:
-                                self.new_chunk_id_array[i_evt, i_smd] = new_chunk_id
-                                self.chunkinfo[(i_smd, new_chunk_id)] = new_filename 
+                elif d.service() == TransitionId.Enable:
+                    self._check_new_chunk_id(d, i_evt, i_smd)
             
             offset += smd_aux_sizes[i_smd]            
             i_smd += 1
@@ -175,13 +270,10 @@ class EventManager(object):
         
         # end while offset
 
-        # Precalculate cutoff indices
-        self.cutoff_indices = []
-        self.chunk_indices  = np.zeros(self.n_smd_files, dtype=dtype)
-        for i_smd in range(self.n_smd_files):
-            self.cutoff_indices.append(np.where(self.cutoff_flag_array[:, i_smd] == 1)[0])
-
     def _open_new_bd_file(self, i_smd, new_chunk_id):
+        # Make sure no read-ahead is still using the current file
+        if self.readahead > 0:
+            self._cancel_prefetch(i_smd)
         os.close(self.dm.fds[i_smd])
         xtc_dir = os.path.dirname(self.dm.xtc_files[i_smd])
         new_filename = os.path.join(xtc_dir, self.chunkinfo[(i_smd, new_chunk_id)])
@@ -189,14 +281,26 @@ class EventManager(object):
         self.dm.fds[i_smd] = fd
         self.dm.xtc_files[i_smd] = new_filename
         self.dm.set_chunk_id(i_smd, new_chunk_id)
+        self.dm.reset_mmap(i_smd)
+        self.bd_mmaps[i_smd] = self.dm.get_mmap(i_smd)
+        if self.on_demand:
+            # Cached bytes belong to the previous chunk file
+            self.od_bufs[i_smd] = (0, bytearray())
+            self.od_last_evts[i_smd] = -2
+        if self.readahead > 0:
+            self.fd_epochs[i_smd] += 1
+            self._prefetch(i_smd, self.chunk_indices[i_smd])
 
     def _stat_and_read(self, fd, size, offset):
         # Circumventing zeroed read bytes problem by checking
         # the size of the file prior to reading.
-        stat_result = os.fstat(fd)
-        while stat_result.st_size < offset + size:
-            time.sleep(1)
-            stat_result = os.fstat(fd)
+        if os.fstat(fd).st_size < offset + size:
+            # Live mode: wait for the file to grow (see FileFollower)
+            follower = get_follower()
+            filename = follower.watch_fd(fd)
+            names = [filename] if filename else None
+            follower.wait_until(lambda: os.fstat(fd).st_size >= offset + size, 
+                    float('inf'), names=names)
         return os.pread(fd, size, offset)
 
     @s_bd_just_read.time()
@@ -230,7 +334,9 @@ class EventManager(object):
             
             print(f'Warning: bigdata read retry#{i_retry}/{self.max_retries} fd:{fd} {self.dm.fds_map[fd]} ask={size} offset={offset} got={got}') 
 
-            time.sleep(1)
+            follower = get_follower()
+            follower.watch(self.dm.fds_map[fd])
+            follower.wait_until(lambda: os.fstat(fd).st_size > offset, 1, names=[self.dm.fds_map[fd]])
         
         en = time.monotonic()
         sum_read_nbytes = memoryview(chunk).nbytes # for prometheus counter
@@ -245,7 +351,110 @@ class EventManager(object):
     def _init_bd_chunks(self):
         self.bd_bufs = [bytearray() for i in range(self.n_smd_files)]
         self.bd_buf_offsets = np.zeros(self.n_smd_files, dtype=np.int64)
+
+        # In mmap mode, bigdata dgrams are built directly on the memory maps
+        # of the xtc files (None for streams that use pread).
+        self.bd_mmaps = [self.dm.get_mmap(i_smd) if not self.use_smds[i_smd] else None 
+                for i_smd in range(self.n_smd_files)]
+
+        # On-demand mode: last read buffer per stream as (offset on disk, buffer)
+        # and the last event that had bigdata of this stream loaded.
+        if self.on_demand:
+            self.od_bufs = [(0, bytearray()) for i in range(self.n_smd_files)]
+            self.od_last_evts = np.full(self.n_smd_files, -2, dtype=np.int64)
+
+        # Read-ahead: prefetched chunks are kept per stream as
+        # {chunk index: (future, read size)}.
+        self.readahead = BD_READAHEAD if not self.on_demand else 0
+        if self.readahead > 0:
+            # Reads of the previous EventManager (e.g. the user stopped in the
+            # middle of its batch) must be done before this one closes or
+            # reuses the file descriptors.
+            if self.dm.bd_readahead is not None:
+                self.dm.bd_readahead.close_prefetch()
+            self.dm.bd_readahead = self
+            self.prefetches = [{} for i in range(self.n_smd_files)]
+            self.prefetch_nbytes = 0
+            # Chunks after a chunk-file switch (new_chunk_id) must not be
+            # prefetched from the current file. Epoch of an event is the 
+            # no. of file switches seen up to this event, fd_epochs is the
+            # no. of switches done so far.
+            self.file_epochs = np.cumsum(self.new_chunk_id_array != 0, axis=0)
+            self.fd_epochs = np.zeros(self.n_smd_files, dtype=np.int64)
+            for i_smd in range(self.n_smd_files):
+                if not self.use_smds[i_smd]:
+                    self._prefetch(i_smd, 0)
+
+    def _get_chunk_offset_and_size(self, i_smd, i_chunk):
+        """ Returns offset (on disk) and size of the given chunk index."""
+        cutoff_indices = self.cutoff_indices[i_smd]
+        i_evt_cutoff = cutoff_indices[i_chunk]
+        begin_chunk_offset = self.bd_offset_array[i_evt_cutoff, i_smd]
+
+        # Calculate read size:
+        # For last chunk, read size is the sum of all bd dgrams all the
+        # way to the end of the array. Otherwise, only sum to the next chunk.
+        if i_chunk == cutoff_indices.shape[0] - 1:
+            read_size = np.sum(self.bd_size_array[i_evt_cutoff:, i_smd])
+        else:
+            i_next_evt_cutoff = cutoff_indices[i_chunk + 1]
+            read_size = np.sum(self.bd_size_array[i_evt_cutoff:i_next_evt_cutoff, i_smd])
+        return begin_chunk_offset, read_size
+
+    def _prefetch(self, i_smd, i_first):
+        """ Submits reads for `readahead` chunks of this stream starting from i_first.
+
+        Only L1Accept chunks from the current chunk file are prefetched and
+        the total size of prefetched chunks is limited by 
+        PS_BD_READAHEAD_MAXBYTES.
+        """
+        if self.bd_mmaps[i_smd] is not None: return
+
+        cutoff_indices = self.cutoff_indices[i_smd]
+        for i_next in range(i_first, min(i_first + self.readahead, cutoff_indices.shape[0])):
+            if i_next in self.prefetches[i_smd]: continue
+            
+            i_evt_cutoff = cutoff_indices[i_next]
+            if self.file_epochs[i_evt_cutoff, i_smd] != self.fd_epochs[i_smd]: break
+            if self.services[i_evt_cutoff] != TransitionId.L1Accept: continue
+
+            offset, size = self._get_chunk_offset_and_size(i_smd, i_next)
+            if size == 0: continue
+            if self.prefetch_nbytes + size > BD_READAHEAD_MAXBYTES: break
+
+            future = get_readahead_executor().submit(self._read, self.dm.fds[i_smd], size, offset)
+            self.prefetches[i_smd][i_next] = (future, size)
+            self.prefetch_nbytes += size
+
+    def _pop_prefetch(self, i_smd, i_chunk):
+        """ Returns prefetched chunk (None if this chunk was not prefetched)."""
+        if i_chunk not in self.prefetches[i_smd]:
+            c_bd_prefetch.labels('misses', 'None').inc()
+            return None
+
+        future, size = self.prefetches[i_smd].pop(i_chunk)
+        self.prefetch_nbytes -= size
+        c_bd_prefetch.labels('hits', 'None').inc()
+        c_bd_prefetch.labels('MB', 'None').inc(size/1e6)
+        return future.result()
+
+    def _cancel_prefetch(self, i_smd):
+        """ Waits for (or cancels) all outstanding reads of this stream."""
+        for future, size in self.prefetches[i_smd].values():
+            if not future.cancel():
+                future.exception() # waits, errors of unused reads are ignored
+            self.prefetch_nbytes -= size
+        self.prefetches[i_smd] = {}
+
+    def close_prefetch(self):
+        """ Waits for (or cancels) outstanding reads of all streams (no-op w/o read-ahead)."""
+        if getattr(self, 'readahead', 0) == 0: return
+        for i_smd in range(self.n_smd_files):
+            self._cancel_prefetch(i_smd)
+        if self.dm.bd_readahead is self:
+            self.dm.bd_readahead = None
     
+    @traced('bd.fill_chunk')
     def _fill_bd_chunk(self, i_smd):
         """
         Fill self.bigdatas for this given stream id 
@@ -264,31 +473,95 @@ class EventManager(object):
         # Reset buffer offset with new filling
         self.bd_buf_offsets[i_smd] = 0
 
+        i_chunk = self.chunk_indices[i_smd]
+        chunk = None
+        if self.readahead > 0:
+            chunk = self._pop_prefetch(i_smd, i_chunk)
+
+        if chunk is None:
+            begin_chunk_offset, read_size = self._get_chunk_offset_and_size(i_smd, i_chunk)
+            chunk = self._read(self.dm.fds[i_smd], read_size, begin_chunk_offset)
+        self.bd_bufs[i_smd] = chunk
+
+        if self.readahead > 0:
+            self._prefetch(i_smd, i_chunk + 1)
+
+    def _get_bd_mmap_view(self, i_smd, offset, size):
+        """ Returns the memory map of this stream if the dgram fits in it. 
+
+        The file is remapped if it has grown. If the dgram is still not
+        available, it is read (with retries) into a new buffer.
+        """
+        mm = self.bd_mmaps[i_smd]
+        if offset + size > len(mm):
+            new_mm = self.dm.get_mmap(i_smd, min_size=offset+size)
+            if new_mm is None:
+                return self._read(self.dm.fds[i_smd], size, offset)
+            self.bd_mmaps[i_smd] = mm = new_mm
+        return mm
+
+    def _get_od_read_size(self, i_evt, i_smd):
+        """ Returns size of contiguous bigdata dgrams of this stream from
+        i_evt up to the next cutoff (end of the chunk)."""
         cutoff_indices = self.cutoff_indices[i_smd]
-        i_evt_cutoff = cutoff_indices[self.chunk_indices[i_smd]]
-        begin_chunk_offset = self.bd_offset_array[i_evt_cutoff, i_smd]
+        i_next = np.searchsorted(cutoff_indices, i_evt, side='right')
+        i_evt_end = cutoff_indices[i_next] if i_next < cutoff_indices.shape[0] else self.n_events
+        return np.sum(self.bd_size_array[i_evt:i_evt_end, i_smd])
 
-        # Calculate read size:
-        # For last chunk, read size is the sum of all bd dgrams all the
-        # way to the end of the array. Otherwise, only sum to the next chunk.
-        if self.chunk_indices[i_smd] == cutoff_indices.shape[0] - 1:
-            read_size = np.sum(self.bd_size_array[i_evt_cutoff:, i_smd])
+    def _get_bd_dgram(self, i_evt, i_smd, xtc_file):
+        """ Returns bigdata dgram of this event and stream (on-demand mode).
+
+        Only this dgram is read unless the previous event of this stream was 
+        also accessed, then dgrams up to the end of the chunk are read at once 
+        and the next events are built from this buffer.
+        """
+        offset = self.bd_offset_array[i_evt, i_smd]
+        size = self.bd_size_array[i_evt, i_smd]
+        if xtc_file != self.dm.xtc_files[i_smd]:
+            # The event was generated before switching to the next chunk file
+            fd = os.open(xtc_file, os.O_RDONLY)
+            try:
+                view = self._stat_and_read(fd, size, offset)
+            finally:
+                os.close(fd)
+            offset = 0
+        elif self.bd_mmaps[i_smd] is not None:
+            view = self._get_bd_mmap_view(i_smd, offset, size)
+            if view is not self.bd_mmaps[i_smd]:
+                offset = 0
         else:
-            i_next_evt_cutoff = cutoff_indices[self.chunk_indices[i_smd] + 1]
-            read_size = np.sum(self.bd_size_array[i_evt_cutoff:i_next_evt_cutoff, i_smd])
-        self.bd_bufs[i_smd] = self._read(self.dm.fds[i_smd], read_size, begin_chunk_offset)
+            buf_offset, view = self.od_bufs[i_smd]
+            if offset < buf_offset or offset + size > buf_offset + memoryview(view).nbytes:
+                read_size = size
+                if self.od_last_evts[i_smd] == i_evt - 1:
+                    read_size = self._get_od_read_size(i_evt, i_smd)
+                view = self._read(self.dm.fds[i_smd], read_size, offset)
+                buf_offset = offset
+                self.od_bufs[i_smd] = (buf_offset, view)
+                c_bd_on_demand.labels('reads', 'None').inc()
+                c_bd_on_demand.labels('MB', 'None').inc(read_size/1e6)
+            offset -= buf_offset
+        self.od_last_evts[i_smd] = i_evt
+        
+        if self.exit_id > 0: return None
+        c_bd_on_demand.labels('dgrams', 'None').inc()
+        return dgram.Dgram(config=self.dm.configs[i_smd], view=view, offset=offset)
 
     def _get_next_evt(self):
         """ Generate bd evt for different cases:
         1) No bigdata or Transition Event
             create dgrams from smd_view
         2) L1Accept event
-            create dgrams from bd_bufs
+            create dgrams from bd_bufs (or from the memory map of the
+            bigdata file in mmap mode)
         3) L1Accept with some smd files replaced by bigdata files
             create dgram from smd_view if use_smds[i_smd] is set
             otherwise create dgram from bd_bufs
+        4) L1Accept in on-demand mode
+            create dgram from smd_view and a loader for the bigdata dgram
         """
         dgrams = [None] * self.n_smd_files
+        bd_loaders = {}
         for i_smd in range(self.n_smd_files):
             if self.dm.n_files == 0 or                               \
                     self.services[self.i_evt] != TransitionId.L1Accept or   \
@@ -308,6 +581,23 @@ class EventManager(object):
                     if self.new_chunk_id_array[self.i_evt, i_smd] != 0:
                         self._open_new_bd_file(i_smd, 
                                 self.new_chunk_id_array[self.i_evt, i_smd])
+            elif self.on_demand:
+                view = self.smd_view
+                offset = self.smd_offset_array[self.i_evt, i_smd]
+                size = self.smd_size_array[self.i_evt, i_smd]
+                if size > 0:
+                    bd_loaders[i_smd] = functools.partial(self._get_bd_dgram, 
+                            self.i_evt, i_smd, self.dm.xtc_files[i_smd])
+            elif self.bd_mmaps[i_smd] is not None:
+                # Keep chunk index in sync with the pread path (a chunk is 
+                # filled at every cutoff).
+                if self.cutoff_flag_array[self.i_evt, i_smd]:
+                    self.chunk_indices[i_smd] += 1
+                offset = self.bd_offset_array[self.i_evt, i_smd]
+                size = self.bd_size_array[self.i_evt, i_smd] 
+                view = self._get_bd_mmap_view(i_smd, offset, size)
+                if view is not self.bd_mmaps[i_smd]:
+                    offset = 0
             else:
                 # Fill up bd buf if this dgram doesn't fit in the current view
                 if self.bd_buf_offsets[i_smd] + self.bd_size_array[self.i_evt, i_smd] \
@@ -327,7 +617,7 @@ class EventManager(object):
 
         self.i_evt += 1
         self._inc_prometheus_counter('evts')
-        evt = Event(dgrams=dgrams, run=self.dm.get_run()) 
+        evt = Event(dgrams=dgrams, run=self.dm.get_run(), bd_loaders=bd_loaders) 
         return evt
 
 
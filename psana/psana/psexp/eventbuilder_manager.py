@@ -1,6 +1,7 @@
 from psana.eventbuilder import EventBuilder
 from psana.psexp        import PacketFooter, PrometheusManager
 from .run import RunSmallData
+from .tracer import span
 
 class EventBuilderManager(object):
 
@@ -18,7 +19,12 @@ class EventBuilderManager(object):
                                            prometheus_counter=c_filter)
         self.run_smd        = RunSmallData(run, self.eb)            # only used by smalldata callback
 
-    def batches(self):
+    def batches(self, batch_size_fn=None):
+        """ Yields batch_dict and step_dict of the next batch.
+
+        batch_size_fn (optional) is called before building each batch (only
+        without smalldata callback) and returns its size (see AdaptiveBatchSizer).
+        """
         while True: 
             # This eiter calls user-defined smalldata callback, which loops
             # over smd events or skips (faster). To enable detector inteface 
@@ -26,7 +32,13 @@ class EventBuilderManager(object):
             # Note: use _smd_callback for checking if user set any callback
             # through DataSource.
             if self.dsparms.smd_callback == 0:
-                batch_dict, step_dict = self.eb.build()
+                if batch_size_fn is not None:
+                    if not self.eb.has_more(): break
+                    batch_size = batch_size_fn()
+                else:
+                    batch_size = 0
+                with span('eb.build'):
+                    batch_dict, step_dict = self.eb.build(batch_size=batch_size)
                 if self.eb.nevents==0 and self.eb.nsteps==0: break
             else:
                 # Collects list of proxy events to be converted to batches.
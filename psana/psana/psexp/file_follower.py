@@ -0,0 +1,198 @@
+"""
+Wakes up live-mode readers as soon as xtc2 files grow.
+
+Readers waiting for new data (SmdReader, EventManager) or for files to show
+up (DataSourceBase) used to sleep for a second between checks. FileFollower
+watches the directories of these files with Linux inotify (IN_MODIFY,
+IN_CLOSE_WRITE, IN_MOVED_TO for .inprogress renames, IN_CREATE) and wakes
+the waiters on events for the file they are waiting for.
+
+inotify only sees writes done by the local kernel, which is not the case for
+files written by other nodes on network filesystems (e.g. Lustre, NFS).
+Waiters therefore always re-check their condition every
+PS_R_POLL_INTERVAL seconds (default 1). When inotify is not available or
+disabled (PS_R_INOTIFY=0), this is plain polling.
+
+Usage:
+    follower = get_follower()
+    follower.watch(filename)
+    follower.wait_until(lambda: os.fstat(fd).st_size >= size, timeout=1,
+            names=[filename])
+"""
+
+import os
+import time
+import struct
+import threading
+import ctypes
+import ctypes.util
+
+import logging
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL   = float(os.environ.get('PS_R_POLL_INTERVAL', 1.0))
+USE_INOTIFY     = int(os.environ.get('PS_R_INOTIFY', 1))
+
+IN_MODIFY       = 0x00000002
+IN_CLOSE_WRITE  = 0x00000008
+IN_MOVED_TO     = 0x00000080
+IN_CREATE       = 0x00000100
+IN_Q_OVERFLOW   = 0x00004000
+IN_CLOEXEC      = 0o2000000
+WATCH_MASK      = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+_EVENT_HEADER   = struct.Struct('iIII') # wd, mask, cookie, len
+INPROGRESS_EXT  = '.inprogress'
+
+
+def file_key(filename):
+    """ Returns the key used for a file in event bookkeeping (.inprogress
+    and the final .xtc2 name are the same file for readers)."""
+    name = os.path.basename(filename)
+    if name.endswith(INPROGRESS_EXT):
+        name = name[:-len(INPROGRESS_EXT)]
+    return name
+
+
+def fd_filename(fd):
+    """ Returns the current name of the file opened as fd (Linux only) or None."""
+    try:
+        return os.readlink(f'/proc/self/fd/{fd}')
+    except OSError:
+        return None
+
+
+class FileFollower(object):
+    """ Blocks readers until watched files change (or poll_interval passes).
+
+    One inotify instance and one daemon thread (started on the first watch)
+    are shared by all readers in the process.
+    """
+    def __init__(self, poll_interval=POLL_INTERVAL, use_inotify=USE_INOTIFY):
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._gen = 0           # incremented on every batch of events
+        self._gens = {}         # file_key: generation of the last event for this file
+        self._dirs = {}         # watched directory: watch descriptor
+        self._fd = -1
+        self._thread = None
+        self._libc = None
+        if use_inotify:
+            self._init_inotify()
+
+    @property
+    def active(self):
+        return self._fd >= 0
+
+    def _init_inotify(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(IN_CLOEXEC)
+        except (OSError, AttributeError) as err:
+            logger.debug(f'inotify not available ({err}), polling every {self.poll_interval}s')
+            return
+        if fd < 0:
+            logger.debug(f'inotify_init1 failed (errno {ctypes.get_errno()}), polling every {self.poll_interval}s')
+            return
+        self._libc = libc
+        self._fd = fd
+
+    def watch(self, filename):
+        """ Watches the directory of filename (no-op if already watched)."""
+        dirname = os.path.dirname(os.path.abspath(filename))
+        if not self.active or dirname in self._dirs:
+            return
+        with self._cond:
+            if dirname in self._dirs:
+                return
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirname), WATCH_MASK)
+            if wd < 0:
+                logger.debug(f'inotify_add_watch failed for {dirname} (errno {ctypes.get_errno()})')
+                return
+            self._dirs[dirname] = wd
+            if self._thread is None:
+                self._thread = threading.Thread(name='psana_file_follower',
+                        target=self._read_events, daemon=True)
+                self._thread.start()
+
+    def watch_fd(self, fd):
+        filename = fd_filename(fd)
+        if filename:
+            self.watch(filename)
+        return filename
+
+    def _read_events(self):
+        while True:
+            try:
+                buf = os.read(self._fd, 0x10000)
+            except OSError as err:
+                logger.debug(f'inotify read failed ({err}), polling every {self.poll_interval}s')
+                break
+            if not buf: break
+            with self._cond:
+                self._gen += 1
+                offset = 0
+                while offset + _EVENT_HEADER.size <= len(buf):
+                    _, mask, _, name_len = _EVENT_HEADER.unpack_from(buf, offset)
+                    offset += _EVENT_HEADER.size
+                    name = buf[offset: offset+name_len].rstrip(b'\0')
+                    offset += name_len
+                    if mask & IN_Q_OVERFLOW:
+                        # events were dropped - wake everyone
+                        for key in self._gens:
+                            self._gens[key] = self._gen
+                    elif name:
+                        self._gens[file_key(os.fsdecode(name))] = self._gen
+                self._cond.notify_all()
+        # Fall back to polling (waiters use their timeouts)
+        with self._cond:
+            self._fd = -1
+            self._cond.notify_all()
+
+    def _changed(self, keys, gen):
+        if keys is None:
+            return self._gen != gen
+        return any(self._gens.get(key, 0) > gen for key in keys)
+
+    def wait(self, timeout, names=None):
+        """ Waits until one of the files in names (any watched file if None)
+        changes or timeout (seconds) passes. Returns True if woken by a change."""
+        keys = None if names is None else [file_key(name) for name in names]
+        gen = self._gen
+        if not self.active:
+            time.sleep(timeout)
+            return False
+        with self._cond:
+            return self._cond.wait_for(lambda: self._changed(keys, gen), timeout)
+
+    def wait_until(self, pred, timeout, names=None):
+        """ Returns True as soon as pred() is True or False after timeout
+        seconds. pred is checked when one of the files in names (any watched
+        file if None) changes and at least every poll_interval seconds."""
+        keys = None if names is None else [file_key(name) for name in names]
+        deadline = time.monotonic() + timeout
+        while True:
+            gen = self._gen
+            if pred():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            remaining = min(remaining, self.poll_interval)
+            if not self.active:
+                time.sleep(remaining)
+                continue
+            with self._cond:
+                self._cond.wait_for(lambda: not self.active or self._changed(keys, gen), remaining)
+
+
+_follower = None
+_follower_lock = threading.Lock()
+
+def get_follower():
+    """ Returns FileFollower shared by all readers (created once)."""
+    global _follower
+    with _follower_lock:
+        if _follower is None:
+            _follower = FileFollower()
+    return _follower
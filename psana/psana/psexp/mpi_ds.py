@@ -6,6 +6,8 @@ from psana import dgram
 from psana.event import Event
 from psana.dgrammanager import DgramManager
 from psana.smalldata import SmallData
+from psana.psexp.calibconst_bcast import CalibConstBcast
+from psana.psexp.event_index import EventIndex, IndexedEventReader, get_event_index
 import time
 
 import logging
@@ -39,7 +41,43 @@ class RunParallel(Run):
         elif nodetype == 'bd':
             self.bd_node = BigDataNode(ds, self)
 
-    def events(self):
+    def _get_event_index(self):
+        """ Smd0 loads (or builds and saves) the event index and broadcasts
+        it to the other psana cores."""
+        columns = None
+        if nodetype == 'smd0':
+            index = get_event_index(self._xtc_files)
+            if index is not None:
+                columns = index.columns
+        columns = self.comms.psana_comm.bcast(columns, root=0)
+        if columns is None:
+            raise FileNotFoundError(f'No event index found for {self._xtc_files[0]}')
+        return EventIndex(columns)
+
+    def _indexed_events(self, timestamps):
+        """ Bigdata cores read their share of the events using the event
+        index. Smd0 moves the smd files past the EndRun of this run so that
+        the next run is found without broadcasting the rest of this run.
+        EventBuilder cores have nothing to do."""
+        if nodetype == 'srv':
+            return
+        index = self._get_event_index()
+        if nodetype == 'smd0':
+            offsets = index.get_run_end_offsets(self.timestamp, self.ds.smd_files)
+            if offsets is not None:
+                self.ds.smdr_man.seek(offsets)
+        elif nodetype == 'bd':
+            if self._indexed_reader is None:
+                self._indexed_reader = IndexedEventReader(self, self._xtc_files, index=index)
+            bd_only_comm = self.comms.bd_only_comm()
+            yield from self._indexed_reader.events(timestamps,
+                    rank=bd_only_comm.Get_rank(), size=bd_only_comm.Get_size())
+
+    def events(self, timestamps=None):
+        if timestamps is not None:
+            yield from self._indexed_events(timestamps)
+            return
+
         evt_iter = self.start()
         for evt in evt_iter:
             if evt.service() != TransitionId.L1Accept:
@@ -128,6 +166,7 @@ class MPIDataSource(DataSourceBase):
         self.runnum_list = comm.bcast(self.runnum_list, root=0)
         self.xtc_path    = comm.bcast(self.xtc_path, root=0)
         self.runnum_list_index = 0
+        self.calibconst_bcast = CalibConstBcast(comm)
 
         self._start_prometheus_client(mpi_rank=rank)
         self._setup_run()
@@ -233,7 +272,7 @@ class MPIDataSource(DataSourceBase):
         else: 
             self.dsparms.calibconst = None
 
-        self.dsparms.calibconst = self.comms.psana_comm.bcast(self.dsparms.calibconst, root=0)
+        self.dsparms.calibconst = self.calibconst_bcast.bcast(self.dsparms.calibconst)
 
     def _start_run(self):
         if self._setup_beginruns():   # try to get next run from current files
@@ -1,10 +1,15 @@
 from sys import byteorder
 import numpy as np
 from psana.psexp import *
-from psana.dgram import Dgram
 import os
 
+try:
+    from psana.smdindexer import index_batch_packets
+except ImportError:
+    index_batch_packets = None
+
 from psana.psexp.tools import mode
+from psana.psexp.tracer import traced, span, set_label
 if mode == 'mpi':
     from mpi4py import MPI
 
@@ -17,6 +22,13 @@ s_smd0_wait_eb = PrometheusManager.get_metric('psana_smd0_wait_eb')
 s_eb_wait_smd0 = PrometheusManager.get_metric('psana_eb_wait_smd0')
 s_eb_wait_bd = PrometheusManager.get_metric('psana_eb_wait_bd')
 s_bd_wait_eb = PrometheusManager.get_metric('psana_bd_wait_eb')
+c_eb_repack = PrometheusManager.get_metric('psana_eb_repack')
+
+# Adaptive batch sizing: EventBuilder sizes each L1 batch for the bd rank
+# that asked for it, from the throughput measured for that rank (see
+# AdaptiveBatchSizer). Only used without destination and smalldata callbacks.
+EB_ADAPTIVE_BATCH       = int(os.environ.get('PS_EB_ADAPTIVE_BATCH', 0))
+EB_MIN_BATCH_SIZE       = int(os.environ.get('PS_EB_MIN_BATCH_SIZE', 1))
 
 # Setting up group communications
 # Ex. PS_EB_NODES=3 mpirun -n 13
@@ -162,6 +174,24 @@ class StepHistory(object):
                 for i_smd, dg_bytes in enumerate(pf.split_packets()):
                     self.bufs[i_smd].extend(dg_bytes)
                     self.send_history[idx][i_smd] += dg_bytes.nbytes
+
+    def extend_buffers_from_batch(self, batch, client_id):
+        """ Same as extend_buffers(as_event=True) for all the events in
+        the batch (uses the compiled footer indexer when available)."""
+        if index_batch_packets is None:
+            self.extend_buffers(PacketFooter(view=batch).split_packets(), client_id, as_event=True)
+            return
+
+        idx = client_id - 1 # rank 0 has no send history.
+        offsets, sizes = index_batch_packets(batch)
+        assert sizes.shape[0] == 0 or sizes.shape[1] == self.n_smds
+        mv = memoryview(batch)
+        for i_evt in range(sizes.shape[0]):
+            for i_smd in range(self.n_smds):
+                st = offsets[i_evt, i_smd]
+                self.bufs[i_smd].extend(mv[st: st+sizes[i_evt, i_smd]])
+        if sizes.shape[0]:
+            self.send_history[idx] += np.sum(sizes, axis=0)
     
 
     def update_history(self, views, client_id):
@@ -187,45 +217,99 @@ class StepHistory(object):
                     self.send_history[indexed_id][i] = current_buf_size
         return views
 
-def repack_for_bd(smd_batch, step_views, configs, client=-1):
+class SendBuffers(object):
+    """ Reusable per-destination send buffers (similar to SmdReader.send_bufs).
+
+    A buffer only grows (doubles) when a larger batch is requested. The
+    caller must make sure that the previous send from the buffer of this
+    destination has completed before asking for it again.
+    """
+    def __init__(self, init_size=0x100000):
+        self.init_size = init_size
+        self.bufs = {}
+
+    def get(self, dest, nbytes):
+        buf = self.bufs.get(dest)
+        if buf is None or buf.shape[0] < nbytes:
+            new_size = self.init_size if buf is None else buf.shape[0]
+            while new_size < nbytes:
+                new_size *= 2
+            buf = np.empty(new_size, dtype=np.uint8)
+            self.bufs[dest] = buf
+        return buf[:nbytes]
+
+def _dgram_size(view, offset):
+    # Dgram header (TransitionBase) + Xtc extent (see dgrammanager._dgSize)
+    return 12 + int(np.frombuffer(view, dtype=np.uint32, count=1, offset=offset + 20)[0])
+
+def repack_for_bd(smd_batch, step_views, configs, client=-1, send_bufs=None):
     """ EventBuilder Node uses this to prepend missing step views 
-    to the smd_batch. This output chunk contains list of pre-built events."""
-    if step_views:
-        batch_pf = PacketFooter(view=smd_batch)
-        
-        # Create bytearray containing a list of events from step_views 
-        steps = bytearray()
+    to the smd_batch. This output chunk contains list of pre-built events.
+
+    Step dgrams, the smd batch (w/o its footer), and the new footer are
+    copied once into a single pre-sized buffer (taken from send_bufs for
+    this client when given).
+    """
+    if step_views and memoryview(step_views[0]).nbytes > 0:
         n_smds = len(step_views)
-        offsets = np.zeros(n_smds, dtype=np.int) 
-        n_steps = 0
-        step_sizes = []
-        while offsets[0] < memoryview(step_views[0]).nbytes:
-            step_pf = PacketFooter(n_packets=n_smds)
-            step_size = 0
-            for i, (config, view) in enumerate(zip(configs, step_views)):
-                d = Dgram(config=config, view=view, offset=offsets[i])
-                steps.extend(d)
-                offsets[i] += d._size
-                step_size += d._size
-                step_pf.set_size(i, d._size)
-            
-            steps.extend(step_pf.footer)
-            step_sizes.append(step_size + memoryview(step_pf.footer).nbytes)
-            n_steps += 1
-        
-        # Create new batch with total_events = smd_batch_events + step_events 
-        new_batch_pf = PacketFooter(n_packets = batch_pf.n_packets + n_steps)
-        for i in range(n_steps):
-            new_batch_pf.set_size(i, step_sizes[i])
-        
-        for i in range(n_steps, new_batch_pf.n_packets):
-            new_batch_pf.set_size(i, batch_pf.get_size(i-n_steps))
-
-        new_batch = bytearray()
-        new_batch.extend(steps)
-        new_batch.extend(smd_batch[:memoryview(smd_batch).nbytes-memoryview(batch_pf.footer).nbytes])
-        new_batch.extend(new_batch_pf.footer)
-        return new_batch
+        smd_batch_nbytes = memoryview(smd_batch).nbytes
+        if smd_batch_nbytes:
+            batch_pf = PacketFooter(view=smd_batch)
+            batch_sizes = batch_pf.sizes
+            smd_body_nbytes = smd_batch_nbytes - memoryview(batch_pf.footer).nbytes
+        else:
+            batch_sizes = np.zeros(0, dtype=np.uint32)
+            smd_body_nbytes = 0
+
+        # Locate step dgrams (one step event = one dgram from each stream)
+        step_view_nbytes = [memoryview(view).nbytes for view in step_views]
+        dg_offsets = []
+        offsets = [0] * n_smds
+        while offsets[0] < step_view_nbytes[0]:
+            dg_offsets.append(list(offsets))
+            for i, view in enumerate(step_views):
+                offsets[i] += _dgram_size(view, offsets[i])
+        n_steps = len(dg_offsets)
+        dg_offsets.append(offsets)
+        dg_offsets = np.asarray(dg_offsets, dtype=np.int64)             # (n_steps + 1, n_smds)
+        dg_sizes = np.diff(dg_offsets, axis=0)                          # (n_steps, n_smds)
+        step_evt_footer_nbytes = PacketFooter.n_bytes * (n_smds + 1)
+        step_sizes = np.sum(dg_sizes, axis=1) + step_evt_footer_nbytes
+
+        n_packets = batch_sizes.shape[0] + n_steps
+        footer_nbytes = PacketFooter.n_bytes * (n_packets + 1)
+        total_nbytes = int(np.sum(step_sizes)) + smd_body_nbytes + footer_nbytes
+        if send_bufs is None:
+            new_batch = np.empty(total_nbytes, dtype=np.uint8)
+        else:
+            new_batch = send_bufs.get(client, total_nbytes)
+
+        # Step events, each followed by its event footer
+        offset = 0
+        step_bufs = [np.frombuffer(view, dtype=np.uint8) for view in step_views]
+        for i_step in range(n_steps):
+            for i in range(n_smds):
+                st = dg_offsets[i_step, i]
+                size = dg_sizes[i_step, i]
+                new_batch[offset: offset+size] = step_bufs[i][st: st+size]
+                offset += size
+            evt_footer = new_batch[offset: offset+step_evt_footer_nbytes].view(np.uint32)
+            evt_footer[:n_smds] = dg_sizes[i_step]
+            evt_footer[n_smds] = n_smds
+            offset += step_evt_footer_nbytes
+
+        # Smd events and new footer (step_events + smd_batch_events)
+        if smd_body_nbytes:
+            new_batch[offset: offset+smd_body_nbytes] = np.frombuffer(smd_batch, dtype=np.uint8, count=smd_body_nbytes)
+            offset += smd_body_nbytes
+        footer = new_batch[offset:].view(np.uint32)
+        footer[:n_steps] = step_sizes
+        footer[n_steps:n_packets] = batch_sizes
+        footer[n_packets] = n_packets
+
+        c_eb_repack.labels('evts', client).inc(n_packets)
+        c_eb_repack.labels('MB', client).inc(total_nbytes/1e6)
+        return memoryview(new_batch)
     else:
         return smd_batch
 
@@ -246,8 +330,10 @@ class Smd0(object):
         
         # Collecting Smd0 performance using prometheus
         self.c_sent = ds.dsparms.prom_man.get_metric('psana_smd0_sent')
+        set_label('smd0')
     
     @s_smd0_wait_eb.time()
+    @traced('smd0.wait_eb')
     def _request_rank(self, rankreq):
         st_req = time.monotonic()
         logger.debug(f'RANK{self.comms.world_rank} 1. SMD0GOTCHUNK {st_req}')
@@ -258,6 +344,11 @@ class Smd0(object):
         logger.debug(f'RANK{self.comms.world_rank} 2. SMD0GOTEB{rankreq[0]} {en_req}')
         logger.debug(f'WAITTIME: {en_req-st_req:.5f}s. smd0 for eb{rankreq[0]}') 
         
+    @staticmethod
+    def _n_pending_sends(requests):
+        """ Returns no. of sends to EventBuilders that are not completed yet."""
+        return len([req for req in requests if not req.Test()])
+
     def start(self):
         # Rank 0 waits on World comm for terminating signal
         t_rankreq = np.empty(1, dtype='i')
@@ -273,48 +364,57 @@ class Smd0(object):
         
         # Indentify viewing windows. SmdReaderManager has starting index and block size
         # that it needs to share later when data are packaged for sending to EventBuilders.
-        for i_chunk in self.smdr_man.chunks():
-            st = time.monotonic()
-            self._request_rank(rankreq)
+        try:
+            for i_chunk in self.smdr_man.chunks():
+                st = time.monotonic()
+                # Read ahead while waiting for (and sending to) EventBuilders.
+                # The read-ahead is bounded by PS_SMD0_PREFETCH chunks, only
+                # restarted when the previous one is done and skipped while
+                # sends to EventBuilders are backed up.
+                self.smdr_man.prefetch(n_pending_sends=self._n_pending_sends(requests))
+                self._request_rank(rankreq)
             
-            # Check missing steps for the current client
-            missing_step_views = self.step_hist.get_buffer(rankreq[0], smd0=True)
-            logger.debug(f'RANK{self.comms.world_rank} 2.1 SMD0GOTSTEPHIST {time.monotonic()}')
-
-            # Update step buffers (after getting the missing steps
-            step_views = [self.smdr_man.smdr.show(i, step_buf=True) for i in range(self.smdr_man.n_files)]
-            self.step_hist.extend_buffers(step_views, rankreq[0])
-            logger.debug(f'RANK{self.comms.world_rank} 2.2 SMD0STEPHISTUPDATED {time.monotonic()}')
-
-            # Prevent race condition by making a copy of data
-            repack_smds[rankreq[0]] = self.smdr_man.smdr.repack_parallel(missing_step_views, rankreq[0])
+                # Check missing steps for the current client
+                missing_step_views = self.step_hist.get_buffer(rankreq[0], smd0=True)
+                logger.debug(f'RANK{self.comms.world_rank} 2.1 SMD0GOTSTEPHIST {time.monotonic()}')
+
+                # Update step buffers (after getting the missing steps
+                step_views = [self.smdr_man.smdr.show(i, step_buf=True) for i in range(self.smdr_man.n_files)]
+                self.step_hist.extend_buffers(step_views, rankreq[0])
+                logger.debug(f'RANK{self.comms.world_rank} 2.2 SMD0STEPHISTUPDATED {time.monotonic()}')
+
+                # Prevent race condition by making a copy of data
+                with span('smd0.repack'):
+                    repack_smds[rankreq[0]] = self.smdr_man.smdr.repack_parallel(missing_step_views, rankreq[0])
             
-            logger.debug(f'RANK{self.comms.world_rank} 3. SMD0GOTREPACK {time.monotonic()}')
+                logger.debug(f'RANK{self.comms.world_rank} 3. SMD0GOTREPACK {time.monotonic()}')
             
-            requests[rankreq[0]-1] = self.comms.smd_comm.Isend(repack_smds[rankreq[0]], dest=rankreq[0])
+                requests[rankreq[0]-1] = self.comms.smd_comm.Isend(repack_smds[rankreq[0]], dest=rankreq[0])
             
-            logger.debug(f'RANK{self.comms.world_rank} 4. SMD0DONEWITHEB{rankreq[0]} {time.monotonic()}')
+                logger.debug(f'RANK{self.comms.world_rank} 4. SMD0DONEWITHEB{rankreq[0]} {time.monotonic()}')
         
-            # sending data to prometheus
-            self.c_sent.labels('evts', rankreq[0]).inc(self.smdr_man.got_events)
-            self.c_sent.labels('batches', rankreq[0]).inc()
-            self.c_sent.labels('MB', rankreq[0]).inc(memoryview(repack_smds[rankreq[0]]).nbytes/1e6)
-            en = time.monotonic()
-            logger.debug(f'node: smd0 sent {self.smdr_man.got_events} events to {rankreq[0]} rate: {(self.smdr_man.got_events/(en-st))*1e-3} kHz')
+                # sending data to prometheus
+                self.c_sent.labels('evts', rankreq[0]).inc(self.smdr_man.got_events)
+                self.c_sent.labels('batches', rankreq[0]).inc()
+                self.c_sent.labels('MB', rankreq[0]).inc(memoryview(repack_smds[rankreq[0]]).nbytes/1e6)
+                en = time.monotonic()
+                logger.debug(f'node: smd0 sent {self.smdr_man.got_events} events to {rankreq[0]} rate: {(self.smdr_man.got_events/(en-st))*1e-3} kHz')
             
-            # Check for terminating signal
-            t_req_test = t_req.Test()
-            if t_req_test: 
-                logger.debug(f'smd0 got terminating signal from world rank {t_rankreq[0]} (t_req_test:{t_req_test})')
-                break
+                # Check for terminating signal
+                t_req_test = t_req.Test()
+                if t_req_test: 
+                    logger.debug(f'smd0 got terminating signal from world rank {t_rankreq[0]} (t_req_test:{t_req_test})')
+                    break
             
-            found_endrun = self.smdr_man.smdr.found_endrun()
-            if found_endrun: 
-                logger.debug("smd0 found_endrun")
-                break
+                found_endrun = self.smdr_man.smdr.found_endrun()
+                if found_endrun: 
+                    logger.debug("smd0 found_endrun")
+                    break
             
         
-        # end for (smd_chunk, step_chunk)
+            # end for (smd_chunk, step_chunk)
+        finally:
+            self.smdr_man.close_prefetch()
         wait_for(requests)
 
         # check if there are missing steps to be sent 
@@ -344,6 +444,46 @@ class Smd0(object):
         wait_for(requests)
     
 
+class AdaptiveBatchSizer(object):
+    """ Sizes batches for bd ranks according to their throughput.
+
+    The throughput of a bd rank is measured from the time a batch is sent
+    to it until the rank asks for more (exponential moving average of
+    events/s). The fastest rank gets batches of max_size events, slower ones
+    proportionally smaller batches (at least min_size). Because bd ranks
+    pull batches, the events a straggler doesn't get stay with EventBuilder
+    and go to the next rank that asks, i.e. ranks that finish early take
+    over the remaining work of the chunk. Ranks without measurement yet
+    get max_size.
+    """
+    def __init__(self, max_size, min_size=EB_MIN_BATCH_SIZE, alpha=0.3):
+        self.max_size = max_size
+        self.min_size = max(1, min(min_size, max_size))
+        self.alpha = alpha
+        self.rates = {}         # bd rank: events/s
+        self.sent_at = {}       # bd rank: (time sent, no. of events)
+
+    def size(self, rank):
+        rate = self.rates.get(rank)
+        if rate is None:
+            return self.max_size
+        size = int(self.max_size * rate / max(self.rates.values()))
+        return max(self.min_size, min(self.max_size, size))
+
+    def sent(self, rank, n_events):
+        self.sent_at[rank] = (time.monotonic(), n_events)
+
+    def requested(self, rank):
+        """ Updates throughput of the rank when it asks for more data."""
+        sent = self.sent_at.pop(rank, None)
+        if sent is None or sent[1] == 0:
+            return
+        rate = sent[1] / max(time.monotonic() - sent[0], 1e-6)
+        if rank in self.rates:
+            rate = (1 - self.alpha) * self.rates[rank] + self.alpha * rate
+        self.rates[rank] = rate
+
+
 class EventBuilderNode(object):
     """Handles both smd_0 and bd_nodes
     Receives blocks of smds from smd_0 then assembles
@@ -358,43 +498,76 @@ class EventBuilderNode(object):
         # Collecting Smd0 performance using prometheus
         self.c_sent     = ds.dsparms.prom_man.get_metric('psana_eb_sent')
         self.requests   = []
+        self.send_bufs  = SendBuffers()
+        set_label('eb')
+        self.batch_sizer= None
+        if EB_ADAPTIVE_BATCH and self.dsparms.destination == 0 \
+                and self.dsparms.smd_callback == 0:
+            self.batch_sizer = AdaptiveBatchSizer(self.dsparms.batch_size)
     
     def _init_requests(self):
         self.requests = [MPI.REQUEST_NULL for i in range(self.comms.bd_size - 1)]
 
+    @traced('eb.repack')
+    def _repack_for_bd(self, smd_batch, dest_rank):
+        # The send buffer of this bd rank is reused so the previous send
+        # to it must be done (this returns immediately when the bd rank
+        # is asking for more data).
+        if self.requests:
+            self.requests[dest_rank-1].Wait()
+        missing_step_views = self.step_hist.get_buffer(dest_rank)
+        return repack_for_bd(smd_batch, missing_step_views, self.configs, 
+                client=dest_rank, send_bufs=self.send_bufs)
+
     def pack(self, *args):
+        sizes = [memoryview(arg).nbytes for arg in args]
         pf = PacketFooter(len(args))
-        batch = bytearray()
-        for i, arg in enumerate(args):
-            pf.set_size(i, memoryview(arg).shape[0])
-            batch += arg
-        batch += pf.footer
+        batch = bytearray(sum(sizes) + memoryview(pf.footer).nbytes)
+        offset = 0
+        for i, (arg, size) in enumerate(zip(args, sizes)):
+            pf.set_size(i, size)
+            batch[offset: offset+size] = arg
+            offset += size
+        batch[offset:] = pf.footer
         return batch
 
 
     def _send_to_dest(self, dest_rank, smd_batch_dict, step_batch_dict, eb_man, batches):
         bd_comm = self.comms.bd_comm
         smd_batch, _ = smd_batch_dict[dest_rank]
-        missing_step_views = self.step_hist.get_buffer(dest_rank)
-        batches[dest_rank] = repack_for_bd(smd_batch, missing_step_views, self.configs, client=dest_rank)
+        batches[dest_rank] = self._repack_for_bd(smd_batch, dest_rank)
         self.requests[dest_rank-1] = bd_comm.Isend(batches[dest_rank], dest=dest_rank)
         del smd_batch_dict[dest_rank] # done sending
         
         step_batch, _ = step_batch_dict[dest_rank]
         if eb_man.eb.nsteps > 0 and memoryview(step_batch).nbytes > 0:  
-            step_pf = PacketFooter(view=step_batch)
-            self.step_hist.extend_buffers(step_pf.split_packets(), dest_rank, as_event=True)
+            self.step_hist.extend_buffers_from_batch(step_batch, dest_rank)
         del step_batch_dict[dest_rank] # done adding
 
     @s_eb_wait_bd.time()
+    @traced('eb.wait_bd')
     def _request_rank(self, rankreq):
         st_req = time.monotonic()
         req = self.comms.bd_comm.Irecv(rankreq, source=MPI.ANY_SOURCE)
         req.Wait()
         en_req = time.monotonic()
         logger.debug(f'WAITTIME: {en_req-st_req:.5f}s. eb{self.comms.smd_rank} for bd{rankreq[0]}') 
+        if self.batch_sizer:
+            self.batch_sizer.requested(rankreq[0])
+
+    def _get_rank(self, rankreq, waiting_bds):
+        """ Gets next bd rank, waiting ones first."""
+        if waiting_bds:
+            logger.debug(f'before waiting_bds={waiting_bds}')
+            rankreq[0] = waiting_bds.pop()
+            logger.debug(f'after pop waiting_bds={waiting_bds}')
+            logger.debug(f'RANK{self.comms.world_rank} 10. EB{self.comms.world_rank}GOTBD{rankreq[0]+1}FROMQUEUE {time.monotonic()}')
+        else:
+            self._request_rank(rankreq)
+            logger.debug(f'RANK{self.comms.world_rank} 10. EB{self.comms.world_rank}GOTBD{rankreq[0]+1}FROMREQ {time.monotonic()}')
 
     @s_eb_wait_smd0.time()
+    @traced('eb.wait_smd0')
     def _request_data(self, smd_comm):
         st = time.monotonic()
         logger.debug(f'RANK{self.comms.world_rank} 5. EB{self.comms.world_rank}SENDREQTOSMD0 {time.monotonic()}')
@@ -421,6 +594,16 @@ class EventBuilderNode(object):
         
         # Initialize Non-blocking Send Requests with Null
         self._init_requests()
+
+        # With adaptive batch sizing, the bd rank is picked before its
+        # batch is built so that the batch can be sized for it.
+        batch_size_fn = None
+        next_ranks = []
+        if self.batch_sizer:
+            def batch_size_fn():
+                self._get_rank(rankreq, waiting_bds)
+                next_ranks.append(rankreq[0])
+                return self.batch_sizer.size(rankreq[0])
         
         while True:
             smd_chunk = self._request_data(smd_comm)
@@ -436,7 +619,7 @@ class EventBuilderNode(object):
             # The key of batches dict is the bd rank.
             batches = {} 
 
-            for smd_batch_dict, step_batch_dict  in eb_man.batches():
+            for smd_batch_dict, step_batch_dict  in eb_man.batches(batch_size_fn=batch_size_fn):
                 
                 # If single item and dest_rank=0, send to any bigdata nodes.
                 if 0 in smd_batch_dict.keys():
@@ -444,17 +627,12 @@ class EventBuilderNode(object):
                     step_batch, _ = step_batch_dict[0]
 
                     logger.debug(f'RANK{self.comms.world_rank} 9. EB{self.comms.world_rank}REQBD {time.monotonic()}')
-                    if waiting_bds:
-                        logger.debug(f'before waiting_bds={waiting_bds}')
-                        rankreq[0] = waiting_bds.pop()
-                        logger.debug(f'after pop waiting_bds={waiting_bds}')
-                        logger.debug(f'RANK{self.comms.world_rank} 10. EB{self.comms.world_rank}GOTBD{rankreq[0]+1}FROMQUEUE {time.monotonic()}')
+                    if next_ranks:
+                        rankreq[0] = next_ranks.pop()
                     else:
-                        self._request_rank(rankreq)
-                        logger.debug(f'RANK{self.comms.world_rank} 10. EB{self.comms.world_rank}GOTBD{rankreq[0]+1}FROMREQ {time.monotonic()}')
+                        self._get_rank(rankreq, waiting_bds)
                     
-                    missing_step_views = self.step_hist.get_buffer(rankreq[0])
-                    batches[rankreq[0]] = repack_for_bd(smd_batch, missing_step_views, self.configs, client=rankreq[0])
+                    batches[rankreq[0]] = self._repack_for_bd(smd_batch, rankreq[0])
                     
                     logger.debug(f'RANK{self.comms.world_rank} 11. EB{self.comms.world_rank}SENDDATATOBD{rankreq[0]+1} {time.monotonic()}')
                     self.requests[rankreq[0]-1] = bd_comm.Isend(batches[rankreq[0]], dest=rankreq[0])
@@ -465,10 +643,11 @@ class EventBuilderNode(object):
                     self.c_sent.labels('evts', rankreq[0]).inc(eb_man.eb.nevents)
                     self.c_sent.labels('batches', rankreq[0]).inc()
                     self.c_sent.labels('MB', rankreq[0]).inc(memoryview(batches[rankreq[0]]).nbytes/1e6)
+                    if self.batch_sizer:
+                        self.batch_sizer.sent(rankreq[0], eb_man.eb.nevents)
                     
                     if eb_man.eb.nsteps > 0 and memoryview(step_batch).nbytes > 0:  
-                        step_pf = PacketFooter(view=step_batch)
-                        self.step_hist.extend_buffers(step_pf.split_packets(), rankreq[0], as_event=True)
+                        self.step_hist.extend_buffers_from_batch(step_batch, rankreq[0])
                     
                           
                 # With > 1 dest_rank, start looping until all dest_rank batches
@@ -500,6 +679,9 @@ class EventBuilderNode(object):
                 # end else -> if 0 in smd_batch_dict.keys() 
             
             # end for smd_batch_dict in ...
+            # A bd rank picked for a batch that turned out empty waits for the next chunk
+            while next_ranks:
+                waiting_bds.append(next_ranks.pop())
             logger.debug(f'RANK{self.comms.world_rank} 12.1 EB{self.comms.world_rank}DONEALLBATCHES {time.monotonic()}')
 
         # end While True
@@ -511,8 +693,7 @@ class EventBuilderNode(object):
         self._init_requests()
         copied_waiting_bds = waiting_bds[:]
         for dest_rank in copied_waiting_bds:
-            missing_step_views = self.step_hist.get_buffer(dest_rank)
-            batches[dest_rank] = repack_for_bd(bytearray(), missing_step_views, self.configs, client=dest_rank)
+            batches[dest_rank] = self._repack_for_bd(bytearray(), dest_rank)
             if batches[dest_rank]:
                 logger.debug(f'RANK{self.comms.world_rank} 12.2 EB{self.comms.world_rank}SENDMISSINGSTEPTOBD{dest_rank+1} {time.monotonic()}')
                 self.requests[dest_rank-1] = bd_comm.Isend(batches[dest_rank], dest_rank)
@@ -528,8 +709,7 @@ class EventBuilderNode(object):
         for i in range(n_bd_nodes-len(waiting_bds)):
             logger.debug(f'i={i} n_bd_nodes={n_bd_nodes} len(waiting_bds)={len(waiting_bds)}')
             self._request_rank(rankreq)
-            missing_step_views = self.step_hist.get_buffer(rankreq[0])
-            batches[rankreq[0]] = repack_for_bd(bytearray(), missing_step_views, self.configs, client=rankreq[0])
+            batches[rankreq[0]] = self._repack_for_bd(bytearray(), rankreq[0])
             if batches[rankreq[0]]:
                 logger.debug(f'RANK{self.comms.world_rank} 12.5 EB{self.comms.world_rank}SENDMISSINGSTEPTOBD{rankreq[0]+1} {time.monotonic()}')
                 self.requests[rankreq[0]-1] = bd_comm.Isend(batches[rankreq[0]], dest=rankreq[0])
@@ -562,10 +742,12 @@ class BigDataNode(object):
         self.ds         = ds
         self.run        = run
         self.comms      = ds.comms
+        set_label('bd')
 
     def start(self):
         
         @s_bd_wait_eb.time()
+        @traced('bd.wait_eb')
         def get_smd():
             bd_comm = self.comms.bd_comm
             bd_rank = self.comms.bd_rank
@@ -589,4 +771,6 @@ class BigDataNode(object):
 
         for i_evt, evt in enumerate(events):
             if self.ds.dsparms.terminate_flag: continue
-            yield evt
+            # time spent in user code until the next event is asked for
+            with span('bd.ana'):
+                yield evt
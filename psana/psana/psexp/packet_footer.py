@@ -1,9 +1,9 @@
-import struct
 import numpy as np
 
 class PacketFooter(object):
 
     n_bytes = 4
+    dtype = np.uint32
 
     def __init__(self, n_packets=0, view=None):
         """ Creates footer for packets
@@ -11,45 +11,62 @@ class PacketFooter(object):
         Each footer element has n_bytes.
         If n_packets is given, creates an empty footer with n_packets .
         If footer is given, sets footer that's available for packet size access.
+
+        Packet sizes are accessed through a numpy uint32 array on the footer
+        bytes (no copy).
         """
 
         if n_packets:
             self.n_packets = n_packets
             self.footer = bytearray((n_packets + 1) * self.n_bytes)
-            self.footer[-self.n_bytes:] = struct.pack("I", self.n_packets)
+            self._footer_arr = np.frombuffer(self.footer, dtype=self.dtype)
+            self._footer_arr[-1] = self.n_packets
         elif view:
-            self.n_packets = struct.unpack("I", view[-self.n_bytes:])[0]
-            self.footer = view[-(self.n_packets + 1)*self.n_bytes:]
             self.view = view
+            view_nbytes = memoryview(view).nbytes
+            self.n_packets = int(np.frombuffer(view, dtype=self.dtype, count=1,
+                offset=view_nbytes - self.n_bytes)[0])
+            footer_nbytes = (self.n_packets + 1) * self.n_bytes
+            self.footer = view[-footer_nbytes:]
+            self._footer_arr = np.frombuffer(view, dtype=self.dtype,
+                    count=self.n_packets + 1, offset=view_nbytes - footer_nbytes)
         else:
             self.n_packets = 0
             self.footer = bytearray()
+            self._footer_arr = np.zeros(1, dtype=self.dtype)
+
+    @property
+    def sizes(self):
+        """ Returns numpy array of all packet sizes. """
+        return self._footer_arr[:self.n_packets]
 
     def set_size(self, idx, size):
         """ Set size of the given packet index. """
         assert idx < self.n_packets
-        st = idx * self.n_bytes
-        self.footer[st: st+self.n_bytes] = struct.pack("I", size)
+        self._footer_arr[idx] = size
 
     def get_size(self, idx):
         """ Return size of the given packet index. """
         assert idx < self.n_packets
-        st = idx * self.n_bytes
-        return struct.unpack("I", self.footer[st: st+self.n_bytes])[0]
+        return int(self._footer_arr[idx])
 
-    def split_packets(self):
-        """ Return list of memoryviews to packets """
-        # generate list of offsets and sizes for the packets
-        sizes = np.asarray([self.get_size(idx) for idx in range(self.n_packets)])
-        offsets = np.asarray([np.sum(sizes[:idx]) for idx in range(self.n_packets)])
+    def get_offsets(self):
+        """ Return numpy array of offsets of all packets in the view. """
+        offsets = np.zeros(self.n_packets, dtype=np.int64)
+        np.cumsum(self.sizes[:-1], out=offsets[1:])
+        return offsets
 
-        memviews = [memoryview(self.view[offsets[idx]: offsets[idx]+sizes[idx]]) for idx in range(self.n_packets)]
-        return memviews
+    def split_packets(self):
+        """ Return list of memoryviews to packets (no copy)"""
+        mv = memoryview(self.view)
+        ends = np.cumsum(self.sizes, dtype=np.int64).tolist()
+        starts = [0] + ends[:-1]
+        return [mv[st:en] for st, en in zip(starts, ends)]
 
     def add_packet(self, packet_size):
         """ Appends the packet_size to the footer and upates n_packets."""
         self.n_packets += 1
-        self.footer[-self.n_bytes:-self.n_bytes] = bytearray(struct.pack("I", packet_size))
-        self.footer[-self.n_bytes:] = struct.pack("I", self.n_packets)
-
-
+        self._footer_arr = None # footer bytes are resized below
+        self.footer[-self.n_bytes:-self.n_bytes] = np.array([packet_size], dtype=self.dtype).tobytes()
+        self._footer_arr = np.frombuffer(self.footer, dtype=self.dtype)
+        self._footer_arr[-1] = self.n_packets
@@ -14,12 +14,15 @@ metrics ={
         'psana_smd0_wait_eb'    : ('Summary', 'time spent (s) waiting for EventBuilders'),
         'psana_eb_sent'         : ('Counter', 'Counting no. of events/batches/MB'),              
         'psana_eb_filter'       : ('Counter', 'Counting no. of batches and time spent'), 
+        'psana_eb_repack'       : ('Counter', 'Counting no. of events/MB copied when repacking batches for BigData'),
         'psana_eb_wait_smd0'    : ('Summary', 'time spent (s) waiting for Smd0'),
         'psana_eb_wait_bd'      : ('Summary', 'time spent (s) waiting for BigData cores'),
         'psana_bd_read'         : ('Counter', 'Counting no. of events processed by BigData'),
         'psana_bd_just_read'    : ('Summary', 'time spent (s) reading bigdata'),
         'psana_bd_gen_smd_batch': ('Summary', 'time spent (s) creating a batch of smd events'),
         'psana_bd_gen_evt'      : ('Summary', 'time spent (s) creating an evt'),
+        'psana_bd_prefetch'     : ('Counter', 'Counting no. of bigdata read-ahead hits/misses/MB'),
+        'psana_bd_on_demand'    : ('Counter', 'Counting no. of on-demand bigdata dgrams/reads/MB'),
         'psana_bd_ana'          : ('Counter', 'time spent (s) in analysis fn on                 \
                                     BigData core'),
         'psana_timestamp'       : ('Gauge',   'Uses different labels (e.g. python_init,         \
@@ -13,6 +13,7 @@ from .tools import RunHelper
 from .envstore_manager import EnvStoreManager
 from .events import Events
 from .step import Step
+from .event_index import IndexedEventReader
 
 class DetectorNameError(Exception): pass
 
@@ -82,6 +83,8 @@ class Run(object):
         if hasattr(ds, "smdr_man"): ds.smdr_man.set_run(self)
         RunHelper(self)
         self._dets   = {}
+        self._xtc_files = list(getattr(ds, 'xtc_files', None) or [])
+        self._indexed_reader = None
 
     def run(self):
         """ Returns integer representaion of run no.
@@ -201,6 +204,18 @@ class Run(object):
     def xtcinfo(self):
         return self.dsparms.xtc_info
 
+    def _get_indexed_reader(self):
+        if self._indexed_reader is None:
+            if not self._xtc_files:
+                raise ValueError('Indexed event access requires exp/run or smd/bigdata files')
+            self._indexed_reader = IndexedEventReader(self, self._xtc_files)
+        return self._indexed_reader
+
+    def event_at(self, i):
+        """ Returns the i-th event of the run using the event index
+        (built on first use when it does not exist)."""
+        return self._get_indexed_reader().event_at(i)
+
     def analyze(self, event_fn=None, det=None):
         for event in self.events():
             if event_fn is not None:
@@ -290,7 +305,13 @@ class RunSerial(Run):
         super()._setup_envstore()
         self._evt_iter = Events(ds, self, smdr_man=ds.smdr_man)
 
-    def events(self):
+    def events(self, timestamps=None):
+        """ Yields all events of the run or, when timestamps are given,
+        only these events read directly using the event index."""
+        if timestamps is not None:
+            yield from self._get_indexed_reader().events(timestamps)
+            return
+
         for evt in self._evt_iter:
             if evt.service() != TransitionId.L1Accept:
                 if evt.service() == TransitionId.EndRun: 
@@ -1,13 +1,25 @@
 from psana.smdreader import SmdReader
 from psana.eventbuilder import EventBuilder
 import os, time
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from psana import dgram
 from psana.event import Event
 from .run import RunSmallData
+from .file_follower import get_follower
+from .tracer import traced
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Smd0 read-ahead: no. of chunks (per smd file) read ahead in a background
+# thread while the current chunk is sent to EventBuilders (0 disables it).
+# It is not started while PS_SMD0_PREFETCH_MAX_PENDING or more sends to
+# EventBuilders are still in flight (reading is not the bottleneck then).
+SMD0_PREFETCH           = int(os.environ.get('PS_SMD0_PREFETCH', 1))
+SMD0_PREFETCH_BLOCKSIZE = int(os.environ.get('PS_SMD0_PREFETCH_BLOCKSIZE', 0x1000000))
+SMD0_PREFETCH_MAX_PENDING = int(os.environ.get('PS_SMD0_PREFETCH_MAX_PENDING', 2))
+
 
 class BatchIterator(object):
     """ Iterates over batches of events.
@@ -70,6 +82,65 @@ class BatchIterator(object):
 
 
 
+class SmdPrefetcher(object):
+    """ Reads ahead smd files in a background thread.
+
+    SmdReader refills its chunk buffers in place (see ParallelReader.just_read)
+    so they can't be filled while Smd0 is still sending views of them. Instead,
+    the next n_chunks*chunksize bytes of each file (from the current file offset)
+    are read through a small staging buffer, which brings them to the page
+    cache. The next SmdReader.get() then only copies from memory and disk
+    reads overlap with repacking and sending to EventBuilders.
+    """
+    def __init__(self, smd_fds, chunksize, n_chunks=SMD0_PREFETCH,
+            blocksize=SMD0_PREFETCH_BLOCKSIZE, prom_counter=None):
+        self.fds = [int(fd) for fd in smd_fds]
+        self.n_chunks = n_chunks
+        self.chunksize = chunksize
+        self.blocksize = min(blocksize, chunksize)
+        self.prom_counter = prom_counter
+        self.prefetched = [0] * len(self.fds)  # file offset reached by read-ahead
+        self._future = None
+        self._executor = None
+        self._buf = None
+        if self.n_chunks > 0:
+            self._executor = ThreadPoolExecutor(max_workers=1,
+                    thread_name_prefix='psana_smd0_prefetch')
+            self._buf = bytearray(self.blocksize)
+
+    def kick(self):
+        """ Starts read-ahead unless the previous one is still running."""
+        if self._executor is None:
+            return
+        if self._future is not None and not self._future.done():
+            return
+        self._future = self._executor.submit(self._read_ahead)
+
+    def _read_ahead(self):
+        view = memoryview(self._buf)
+        got = 0
+        for i, fd in enumerate(self.fds):
+            # SmdReader reads sequentially from the current offset (pread
+            # used here doesn't move it).
+            cur = os.lseek(fd, 0, os.SEEK_CUR)
+            en = min(cur + self.n_chunks * self.chunksize, os.fstat(fd).st_size)
+            st = max(cur, self.prefetched[i])
+            while st < en:
+                n = os.preadv(fd, [view[:min(self.blocksize, en - st)]], st)
+                if n <= 0: break
+                st += n
+                got += n
+            self.prefetched[i] = max(self.prefetched[i], st)
+        if self.prom_counter and got:
+            self.prom_counter.labels('prefetch_MB', 'None').inc(got/1e6)
+        return got
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
 class SmdReaderManager(object):
     def __init__(self, smd_fds, dsparms, configs=None):
         self.n_files = len(smd_fds)
@@ -95,9 +166,22 @@ class SmdReaderManager(object):
         # Collecting Smd0 performance using prometheus
         self.c_read = self.dsparms.prom_man.get_metric('psana_smd0_read')
 
+        # Created by Smd0 (see prefetch)
+        self.smd_fds = smd_fds
+        self.prefetcher = None
+
+        # Live mode: wake up as soon as smd files grow instead of sleeping
+        self._wait_fn = None
+        if self.dsparms.max_retries > 0:
+            follower = get_follower()
+            smd_files = [follower.watch_fd(fd) for fd in smd_fds]
+            names = [smd_file for smd_file in smd_files if smd_file] or None
+            self._wait_fn = functools.partial(follower.wait, names=names)
+
+    @traced('smd0.read')
     def _get(self):
         st = time.monotonic()
-        self.smdr.get(self.dsparms.smd_inprogress_converted)
+        self.smdr.get(self.dsparms.smd_inprogress_converted, wait_fn=self._wait_fn)
         en = time.monotonic()
         logger.debug(f'read {self.smdr.got/1e6:.3f} MB took {en-st}s. rate: {self.smdr.got/(1e6*(en-st))} MB/s')
         self.c_read.labels('MB', 'None').inc(self.smdr.got/1e6)
@@ -219,6 +303,28 @@ class SmdReaderManager(object):
                     is_done = True
                     break
 
+    def seek(self, offsets):
+        """ Continues reading the smd files from the given offsets."""
+        self.smdr.seek([int(offset) for offset in offsets])
+
+    def prefetch(self, n_pending_sends=0):
+        """ Reads ahead the next chunk(s) in the background (Smd0 only)
+        unless n_pending_sends (sends to EventBuilders in flight) reached
+        SMD0_PREFETCH_MAX_PENDING."""
+        if n_pending_sends >= SMD0_PREFETCH_MAX_PENDING:
+            return
+        if self.prefetcher is None:
+            self.prefetcher = SmdPrefetcher(self.smd_fds, self.chunksize,
+                    prom_counter=self.c_read)
+        self.prefetcher.kick()
+
+    def close_prefetch(self):
+        # Smd0 reuses this manager for the next run in the same files:
+        # a new prefetcher is created on the next prefetch().
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+
     @property
     def min_ts(self):
         return self.smdr.min_ts
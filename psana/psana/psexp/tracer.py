@@ -0,0 +1,267 @@
+"""
+Per-rank timeline tracing with Chrome/Perfetto trace export.
+
+Tracing is off unless PS_TRACE is set to an output prefix, e.g.
+
+    PS_TRACE=/tmp/mytrace mpirun -n 5 python myana.py
+
+Each rank records begin/end spans of the psana stages (Smd0 read/repack,
+EventBuilder build/repack, waits between ranks, bigdata reads, analysis
+code between events, smalldata sends/writes) into a ring buffer
+(PS_TRACE_BUFSIZE spans, the latest ones are kept). At exit, every rank
+writes <prefix>.rank<N>.json, then rank 0 waits for the other ranks'
+files (at most PS_TRACE_MERGE_TIMEOUT seconds) and writes:
+    <prefix>.json           merged trace (open with chrome://tracing or ui.perfetto.dev)
+    <prefix>.summary.txt    time spent in each stage per rank and per rank type
+
+No external services are used. When tracing is off, traced() returns the
+function unchanged and span() returns a shared no-op context manager.
+
+Usage:
+    from psana.psexp.tracer import traced, span
+
+    @traced('bd.fill_chunk')
+    def _fill_bd_chunk(self, i_smd): ...
+
+    with span('smd0.repack'):
+        ...
+"""
+
+import os
+import sys
+import time
+import json
+import atexit
+import itertools
+import threading
+import functools
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+TRACE                   = os.environ.get('PS_TRACE', '')
+TRACE_BUFSIZE           = int(os.environ.get('PS_TRACE_BUFSIZE', 0x100000))
+TRACE_MERGE_TIMEOUT     = float(os.environ.get('PS_TRACE_MERGE_TIMEOUT', 60))
+
+
+def _mpi_rank_size():
+    """ Returns (rank, size) of MPI world (0, 1) if MPI is not used."""
+    MPI = sys.modules.get('mpi4py.MPI')
+    if MPI is None or not MPI.Is_initialized() or MPI.Is_finalized():
+        return 0, 1
+    return MPI.COMM_WORLD.Get_rank(), MPI.COMM_WORLD.Get_size()
+
+
+class Tracer(object):
+    """ Records spans (name, thread, begin, duration) into ring buffers."""
+    def __init__(self, prefix, bufsize=TRACE_BUFSIZE):
+        self.prefix     = prefix
+        self.bufsize    = bufsize
+        self.label      = ''
+        self.names      = {}    # span name: id
+        self.tids       = {}    # thread ident: id
+        self.name_ids   = np.zeros(bufsize, dtype=np.int32)
+        self.tid_ids    = np.zeros(bufsize, dtype=np.int32)
+        self.begins     = np.zeros(bufsize, dtype=np.int64)  # ns since t0
+        self.durations  = np.zeros(bufsize, dtype=np.int64)  # ns
+        self._counter   = itertools.count()
+        self._lock      = threading.Lock()
+        # perf_counter is used for spans, wall clock to align ranks
+        self.t0_wall    = time.time_ns()
+        self.t0         = time.perf_counter_ns()
+
+    def set_label(self, label):
+        self.label = label
+
+    def _id(self, table, key):
+        i = table.get(key)
+        if i is None:
+            with self._lock:
+                i = table.setdefault(key, len(table))
+        return i
+
+    def record(self, name, t_begin, t_end):
+        """ Records span name from t_begin to t_end (perf_counter_ns)."""
+        i = next(self._counter) % self.bufsize
+        self.name_ids[i] = self._id(self.names, name)
+        self.tid_ids[i] = self._id(self.tids, threading.get_ident())
+        self.begins[i] = t_begin - self.t0
+        self.durations[i] = t_end - t_begin
+
+    def spans(self, n_recorded):
+        """ Returns name_ids, tid_ids, begins, durations of the kept spans (time order)."""
+        n = min(n_recorded, self.bufsize)
+        order = np.argsort(self.begins[:n], kind='stable')
+        return self.name_ids[order], self.tid_ids[order], self.begins[order], self.durations[order]
+
+    def rank_trace(self, rank):
+        """ Returns dict with Chrome trace events and stage totals of this rank."""
+        names = {i: name for name, i in self.names.items()}
+        n_recorded = next(self._counter) # no. of record() calls so far
+        name_ids, tid_ids, begins, durations = self.spans(n_recorded)
+        t0_us = self.t0_wall / 1e3
+        label = f'rank {rank}' + (f' ({self.label})' if self.label else '')
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': rank, 'tid': 0,
+                   'args': {'name': label}},
+                  {'name': 'process_sort_index', 'ph': 'M', 'pid': rank, 'tid': 0,
+                   'args': {'sort_index': rank}}]
+        for name_id, tid, begin, duration in zip(name_ids.tolist(), tid_ids.tolist(),
+                begins.tolist(), durations.tolist()):
+            events.append({'name': names[name_id], 'ph': 'X', 'pid': rank, 'tid': tid,
+                           'ts': t0_us + begin/1e3, 'dur': duration/1e3})
+
+        totals = {}
+        for name_id, name in names.items():
+            sel = name_ids == name_id
+            totals[name] = [int(np.count_nonzero(sel)), int(durations[sel].sum())]
+        return {'rank': rank, 'label': self.label,
+                'wall': time.perf_counter_ns() - self.t0,
+                'n_recorded': n_recorded, 'n_kept': int(name_ids.shape[0]),
+                'totals': totals, 'traceEvents': events}
+
+    def dump(self):
+        """ Writes this rank's trace and, on rank 0, the merged trace and summary."""
+        rank, size = _mpi_rank_size()
+        rank_file = f'{self.prefix}.rank{rank}.json'
+        write_json(rank_file, self.rank_trace(rank))
+        if rank == 0:
+            rank_files = [f'{self.prefix}.rank{r}.json' for r in range(size)]
+            deadline = time.monotonic() + TRACE_MERGE_TIMEOUT
+            while not all(os.path.exists(f) for f in rank_files) and time.monotonic() < deadline:
+                time.sleep(0.5)
+            merge(rank_files, self.prefix)
+
+
+def write_json(filename, obj):
+    """ Writes obj to filename atomically (readers never see a partial file)."""
+    tmp_file = f'{filename}.tmp{os.getpid()}'
+    with open(tmp_file, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp_file, filename)
+
+
+def summary(rank_traces):
+    """ Returns text summary of where wall time went (inclusive span times)."""
+    lines = []
+    fmt = '  %-24s %10s %12s %12s %7s'
+    by_label = {}
+    for rt in rank_traces:
+        wall = max(rt['wall'], 1)
+        lines.append(f"rank {rt['rank']} ({rt['label'] or 'unknown'}) wall: {wall/1e9:.3f} s"
+                + (f" (kept {rt['n_kept']} of {rt['n_recorded']} spans)" if rt['n_kept'] < rt['n_recorded'] else ''))
+        lines.append(fmt % ('stage', 'count', 'total (s)', 'mean (ms)', '% wall'))
+        for name, (count, total) in sorted(rt['totals'].items(), key=lambda x: -x[1][1]):
+            lines.append(fmt % (name, count, f'{total/1e9:.3f}', f'{total/1e6/max(count,1):.3f}', f'{100*total/wall:.1f}'))
+            by_label.setdefault(rt['label'], {}).setdefault(name, [0, 0])
+            by_label[rt['label']][name][0] += count
+            by_label[rt['label']][name][1] += total
+        by_label.setdefault(rt['label'], {})
+        by_label[rt['label']].setdefault('_wall', [0, 0])[1] += wall
+        lines.append('')
+
+    lines.append('all ranks by type')
+    for label, totals in by_label.items():
+        wall = max(totals.pop('_wall')[1], 1)
+        lines.append(f"{label or 'unknown'} (sum of wall: {wall/1e9:.3f} s)")
+        lines.append(fmt % ('stage', 'count', 'total (s)', 'mean (ms)', '% wall'))
+        for name, (count, total) in sorted(totals.items(), key=lambda x: -x[1][1]):
+            lines.append(fmt % (name, count, f'{total/1e9:.3f}', f'{total/1e6/max(count,1):.3f}', f'{100*total/wall:.1f}'))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def merge(rank_files, prefix):
+    """ Merges per-rank trace files into <prefix>.json and <prefix>.summary.txt."""
+    rank_traces = []
+    for rank_file in rank_files:
+        if not os.path.exists(rank_file):
+            logger.warning(f'tracer: {rank_file} not found (rank still running?) - skipped')
+            continue
+        with open(rank_file) as f:
+            rank_traces.append(json.load(f))
+
+    events = []
+    for rt in rank_traces:
+        events.extend(rt.pop('traceEvents'))
+    write_json(f'{prefix}.json', {'traceEvents': events, 'displayTimeUnit': 'ms'})
+    with open(f'{prefix}.summary.txt', 'w') as f:
+        f.write(summary(rank_traces))
+    logger.info(f'tracer: wrote {prefix}.json and {prefix}.summary.txt')
+
+
+class _Span(object):
+    __slots__ = ('tracer', 'name', 't0')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.record(self.name, self.t0, time.perf_counter_ns())
+
+
+class _NullSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+_null_span = _NullSpan()
+
+
+_tracer = None
+if TRACE:
+    _tracer = Tracer(TRACE)
+    atexit.register(_tracer.dump)
+
+
+def get_tracer():
+    """ Returns the tracer of this process (None if tracing is off)."""
+    return _tracer
+
+
+def set_label(label):
+    """ Sets rank type shown in the trace (e.g. smd0, eb, bd, srv)."""
+    if _tracer is not None:
+        _tracer.set_label(label)
+
+
+def span(name):
+    """ Returns context manager that records a span."""
+    if _tracer is None:
+        return _null_span
+    return _Span(_tracer, name)
+
+
+def traced(name):
+    """ Decorator that records a span for every call (no-op if tracing is off)."""
+    def decorator(fn):
+        if _tracer is None:
+            return fn
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter_ns()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _tracer.record(name, t0, time.perf_counter_ns())
+        return wrapper
+    return decorator
+
+
+if __name__ == '__main__':
+    # Merges per-rank files of a job that didn't finish merging, e.g.
+    # python -m psana.psexp.tracer /tmp/mytrace
+    import glob
+    prefix = sys.argv[1]
+    rank_files = sorted(glob.glob(f'{prefix}.rank*.json'),
+            key=lambda f: int(f[len(prefix)+5:-5]))
+    merge(rank_files, prefix)
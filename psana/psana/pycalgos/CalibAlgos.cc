@@ -0,0 +1,166 @@
+#include "CalibAlgos.hh"
+
+#include <algorithm>
+#include <cmath>
+#include <vector>
+
+namespace calibalgos {
+
+//-------------------------------------------------------------------
+
+void gain_range_lut(uint8_t* lut_grind, uint8_t* lut_hm)
+{
+  // the same as gain_maps_epix10ka_any_alg with first matching map as in np.select
+  for (unsigned cb=0; cb<64; ++cb) {
+    unsigned m60 = cb & 60;
+    unsigned m28 = cb & 28;
+    unsigned m12 = cb & 12;
+    bool gr[7] = {m28==28, m28==12, m12==8, m60==16, m60==0, m60==48, m60==32};
+    uint8_t grind = GAIN_RANGE_DEFAULT;
+    for (uint8_t i=0; i<7; ++i) if (gr[i]) {grind = i; break;}
+    lut_grind[cb] = grind;
+    lut_hm[cb] = (gr[0] || gr[1] || gr[3] || gr[4]) ? 1 : 0;
+  }
+}
+
+//-------------------------------------------------------------------
+
+void calib_epix_multigain(const uint16_t* raw, const uint8_t* cbits,
+                          const float* peds, const float* gfac, const uint8_t* mask,
+                          float* out, uint8_t* grinds, uint8_t* cmmask,
+                          size_t nevts, size_t npix,
+                          uint16_t data_bit_mask, uint16_t data_gain_bit, unsigned gain_bit_shift,
+                          bool cm_hm_only)
+{
+  uint8_t lut_grind[64];
+  uint8_t lut_hm[64];
+  gain_range_lut(lut_grind, lut_hm);
+
+  for (size_t e=0; e<nevts; ++e) {
+    const uint16_t* r = raw + e*npix;
+    float* o = out + e*npix;
+    uint8_t* gi = grinds ? grinds + e*npix : 0;
+    uint8_t* cm = cmmask ? cmmask + e*npix : 0;
+    for (size_t i=0; i<npix; ++i) {
+      uint16_t v = r[i];
+      unsigned cb = (cbits[i] | ((v & data_gain_bit) >> gain_bit_shift)) & 63;
+      uint8_t grind = lut_grind[cb];
+      size_t ic = grind*npix + i;
+      float f = (float)(v & data_bit_mask);
+      if (peds) f -= peds[ic];
+      if (gfac) f *= gfac[ic];
+      if (mask) f *= mask[i];
+      o[i] = f;
+      if (gi) gi[i] = grind;
+      if (cm) cm[i] = (mask ? (mask[i] > 0) : 1) & (cm_hm_only ? lut_hm[cb] : 1);
+    }
+  }
+}
+
+//-------------------------------------------------------------------
+
+void apply_gain_factor(float* out, const uint8_t* grinds, const float* gfac, const uint8_t* mask,
+                       size_t nevts, size_t npix)
+{
+  for (size_t e=0; e<nevts; ++e) {
+    float* o = out + e*npix;
+    const uint8_t* gi = grinds + e*npix;
+    for (size_t i=0; i<npix; ++i) {
+      if (gfac) o[i] *= gfac[gi[i]*npix + i];
+      if (mask) o[i] *= mask[i];
+    }
+  }
+}
+
+//-------------------------------------------------------------------
+
+// Median of n values in work (reordered), the same as numpy median for float.
+static inline float median(float* work, size_t n)
+{
+  size_t k = n/2;
+  std::nth_element(work, work + k, work + n);
+  float v = work[k];
+  if (n%2) return v;
+  float vlo = *std::max_element(work, work + k);
+  return (vlo + v) / 2;
+}
+
+static inline bool is_limited(float cmode, float cormax)
+{
+  return cormax >= 0 && !(std::fabs(cmode) < cormax);
+}
+
+void common_mode_rows(float* data, const uint8_t* mask, size_t rows, size_t cols, size_t stride,
+                      float cormax, size_t npix_min, float* work)
+{
+  for (size_t r=0; r<rows; ++r) {
+    float* d = data + r*stride;
+    const uint8_t* m = mask + r*stride;
+    size_t n = 0;
+    for (size_t c=0; c<cols; ++c) if (m[c]) work[n++] = d[c];
+    if (n <= npix_min) continue;
+    float cmode = median(work, n);
+    if (is_limited(cmode, cormax)) continue;
+    for (size_t c=0; c<cols; ++c) if (m[c]) d[c] -= cmode;
+  }
+}
+
+void common_mode_cols(float* data, const uint8_t* mask, size_t rows, size_t cols, size_t stride,
+                      float cormax, size_t npix_min, float* work)
+{
+  for (size_t c=0; c<cols; ++c) {
+    size_t n = 0;
+    for (size_t r=0; r<rows; ++r) if (mask[r*stride + c]) work[n++] = data[r*stride + c];
+    if (n <= npix_min) continue;
+    float cmode = median(work, n);
+    if (is_limited(cmode, cormax)) continue;
+    for (size_t r=0; r<rows; ++r) if (mask[r*stride + c]) data[r*stride + c] -= cmode;
+  }
+}
+
+void common_mode_2d(float* data, const uint8_t* mask, size_t rows, size_t cols, size_t stride,
+                    float cormax, size_t npix_min, float* work)
+{
+  size_t n = 0;
+  for (size_t r=0; r<rows; ++r)
+    for (size_t c=0; c<cols; ++c) if (mask[r*stride + c]) work[n++] = data[r*stride + c];
+  if (n < npix_min || n == 0) return;
+  float cmode = median(work, n);
+  if (is_limited(cmode, cormax)) return;
+  for (size_t r=0; r<rows; ++r)
+    for (size_t c=0; c<cols; ++c) if (mask[r*stride + c]) data[r*stride + c] -= cmode;
+}
+
+//-------------------------------------------------------------------
+
+void common_mode_epix_multigain(float* data, const uint8_t* mask, size_t nsegs, size_t rows, size_t cols,
+                                unsigned mode, size_t nbanks, float cormax, size_t npix_min)
+{
+  // the same as common_mode_epix_multigain_apply in UtilsEpix10ka.py
+  std::vector<float> work(rows*cols);
+  size_t hrows = rows/2;
+  size_t bcols = cols/nbanks;
+  for (size_t s=0; s<nsegs; ++s) {
+    float* d = data + s*rows*cols;
+    const uint8_t* m = mask + s*rows*cols;
+
+    if (mode & 4) // in banks of (hrows, bcols) pixels
+      for (size_t h=0; h<2; ++h)
+        for (size_t b=0; b<nbanks; ++b) {
+          size_t offset = h*hrows*cols + b*bcols;
+          common_mode_2d(d + offset, m + offset, (h ? rows-hrows : hrows), bcols, cols, cormax, npix_min, &work[0]);
+        }
+
+    if (mode & 1) // in rows per bank
+      for (size_t b=0; b<nbanks; ++b)
+        common_mode_rows(d + b*bcols, m + b*bcols, rows, bcols, cols, cormax, npix_min, &work[0]);
+
+    if (mode & 2) // in columns of half-segments
+      for (size_t h=0; h<2; ++h) {
+        size_t offset = h*hrows*cols;
+        common_mode_cols(d + offset, m + offset, (h ? rows-hrows : hrows), cols, cols, cormax, npix_min, &work[0]);
+      }
+  }
+}
+
+} // namespace calibalgos
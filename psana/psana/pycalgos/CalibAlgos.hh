@@ -0,0 +1,65 @@
+#ifndef PSANA_CALIBALGOS_H
+#define PSANA_CALIBALGOS_H
+
+//-------------------------------------------------------------------
+// Calibration kernels for multi-gain area detectors (epix10ka, epixhr)
+//
+// Arrays are C-contiguous, pixels of all segments are flattened:
+//   raw    (nevts, npix) uint16 - raw data
+//   cbits  (npix) uint8         - pixel control bits from configuration
+//   peds   (8, npix) float      - pedestals for gain range indices 0-6 and default (0) for index 7
+//   gfac   (8, npix) float      - gain factors for gain range indices 0-6 and default (1) for index 7
+//   mask   (npix) uint8         - 0/1 - bad/good pixels
+//   out    (nevts, npix) float  - calibrated data
+//   grinds (nevts, npix) uint8  - per-pixel gain range index [0,7]
+//   cmmask (nevts, npix) uint8  - mask of pixels used in common mode correction
+// Any of peds, gfac, mask, grinds, cmmask can be NULL.
+//-------------------------------------------------------------------
+
+#include <cstddef>
+#include <stdint.h>
+
+namespace calibalgos {
+
+const uint8_t GAIN_RANGE_DEFAULT = 7; // pixel does not match any of gain ranges
+const unsigned NGAIN_RANGES = 8;      // 7 gain ranges + default
+
+// Per-pixel gain range index and flag of H/M gain ranges (FH, FM, AHL-H, AML-M)
+// for 6-bit control bits (configuration bits | data gain bit moved to bit 5).
+void gain_range_lut(uint8_t* lut_grind, uint8_t* lut_hm);
+
+// Gain bit decode, pedestal subtraction, gain factor and mask in one pass.
+// If gfac is NULL the gain factor is not applied (see apply_gain_factor).
+// cmmask (if not NULL) is filled with mask & (H/M gain range if cm_hm_only);
+// masked pixels are zero in out and not changed by the common mode correction.
+void calib_epix_multigain(const uint16_t* raw, const uint8_t* cbits,
+                          const float* peds, const float* gfac, const uint8_t* mask,
+                          float* out, uint8_t* grinds, uint8_t* cmmask,
+                          size_t nevts, size_t npix,
+                          uint16_t data_bit_mask, uint16_t data_gain_bit, unsigned gain_bit_shift,
+                          bool cm_hm_only);
+
+// out *= gfac[grinds] * mask
+void apply_gain_factor(float* out, const uint8_t* grinds, const float* gfac, const uint8_t* mask,
+                       size_t nevts, size_t npix);
+
+// Median common mode for a block of rows x cols pixels with row stride (in pixels).
+// Corrections are evaluated for good (mask>0) pixels only and subtracted from good pixels.
+// cormax < 0 - correction is not limited.
+// rows/cols: correction per row/column if number of good pixels > npix_min,
+// 2d: correction per block if number of good pixels >= npix_min.
+void common_mode_rows(float* data, const uint8_t* mask, size_t rows, size_t cols, size_t stride,
+                      float cormax, size_t npix_min, float* work);
+void common_mode_cols(float* data, const uint8_t* mask, size_t rows, size_t cols, size_t stride,
+                      float cormax, size_t npix_min, float* work);
+void common_mode_2d(float* data, const uint8_t* mask, size_t rows, size_t cols, size_t stride,
+                    float cormax, size_t npix_min, float* work);
+
+// Common mode correction of the epix multi-gain detectors for nsegs segments of rows x cols pixels,
+// mode bitword: 4 - in banks of (rows/2, cols/nbanks), 1 - in rows per bank, 2 - in columns of half-segments.
+void common_mode_epix_multigain(float* data, const uint8_t* mask, size_t nsegs, size_t rows, size_t cols,
+                                unsigned mode, size_t nbanks, float cormax, size_t npix_min);
+
+} // namespace calibalgos
+
+#endif // PSANA_CALIBALGOS_H
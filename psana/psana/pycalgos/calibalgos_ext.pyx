@@ -0,0 +1,124 @@
+#
+# cythonize calibration kernels of CalibAlgos.cc for multi-gain area detectors
+#
+# command to build this module only
+# ./build_all.sh -m -d -b NDARRAY
+#
+# Usage::
+#   from calibalgos_ext import calib_epix_multigain, apply_gain_factor, common_mode_epix_multigain
+#
+
+import numpy as np
+from libc.stdint cimport uint8_t, uint16_t
+from libcpp cimport bool
+
+
+cdef extern from "CalibAlgos.hh" namespace "calibalgos":
+    void c_calib_epix_multigain "calibalgos::calib_epix_multigain"(
+            const uint16_t* raw, const uint8_t* cbits,
+            const float* peds, const float* gfac, const uint8_t* mask,
+            float* out, uint8_t* grinds, uint8_t* cmmask,
+            size_t nevts, size_t npix,
+            uint16_t data_bit_mask, uint16_t data_gain_bit, unsigned gain_bit_shift,
+            bool cm_hm_only) nogil
+    void c_apply_gain_factor "calibalgos::apply_gain_factor"(
+            float* out, const uint8_t* grinds, const float* gfac, const uint8_t* mask,
+            size_t nevts, size_t npix) nogil
+    void c_common_mode_epix_multigain "calibalgos::common_mode_epix_multigain"(
+            float* data, const uint8_t* mask, size_t nsegs, size_t rows, size_t cols,
+            unsigned mode, size_t nbanks, float cormax, size_t npix_min) nogil
+
+
+cdef const uint8_t* _ptr_u8(a):
+    cdef const uint8_t[::1] v
+    if a is None: return NULL
+    assert a.flags.c_contiguous # pointer to data of a (not to a copy)
+    v = a.reshape(-1)
+    return &v[0]
+
+
+cdef const float* _ptr_f32(a):
+    cdef const float[::1] v
+    if a is None: return NULL
+    assert a.flags.c_contiguous
+    v = a.reshape(-1)
+    return &v[0]
+
+
+def calib_epix_multigain(raw, cbits, peds, gfac, mask, out, grinds=None, cmmask=None,\
+                         uint16_t data_bit_mask=0x3fff, uint16_t data_gain_bit=0o40000, unsigned gain_bit_shift=9,\
+                         bool cm_hm_only=True):
+    """Gain bit decode, pedestal subtraction, gain factor and mask in one pass over raw data.
+
+    Parameters
+    ----------
+    - raw (np.uint16, C-contiguous) - raw data shaped as (<nsegs>, <rows>, <cols>) or (<nevts>, <nsegs>, <rows>, <cols>)
+    - cbits (np.uint8) - (<nsegs>, <rows>, <cols>) pixel control bits from configuration
+    - peds, gfac (np.float32 or None) - (8, <nsegs>, <rows>, <cols>) constants for gain range indices 0-6 and defaults
+      if gfac is None, the gain factor is not applied (see apply_gain_factor)
+    - mask (np.uint8 or None) - (<nsegs>, <rows>, <cols>)
+    - out (np.float32) - output array shaped as raw
+    - grinds, cmmask (np.uint8 or None) - output gain range indices and common mode mask shaped as raw
+    """
+    cdef size_t npix = cbits.size
+    cdef size_t nevts = raw.size // npix
+    assert raw.size == nevts * npix and out.size == raw.size
+    assert peds is None or peds.size == 8 * npix
+    assert gfac is None or gfac.size == 8 * npix
+    assert mask is None or mask.size == npix
+    assert grinds is None or grinds.size == raw.size
+    assert cmmask is None or cmmask.size == raw.size
+    assert raw.flags.c_contiguous and out.flags.c_contiguous
+    cdef const uint16_t[::1] _raw = raw.reshape(-1)
+    cdef float[::1] _out = out.reshape(-1)
+    cdef uint8_t[::1] _grinds
+    cdef uint8_t[::1] _cmmask
+    cdef uint8_t* p_grinds = NULL
+    cdef uint8_t* p_cmmask = NULL
+    if grinds is not None:
+        _grinds = grinds.reshape(-1)
+        p_grinds = &_grinds[0]
+    if cmmask is not None:
+        _cmmask = cmmask.reshape(-1)
+        p_cmmask = &_cmmask[0]
+    cdef const uint8_t* p_cbits = _ptr_u8(cbits)
+    cdef const float* p_peds = _ptr_f32(peds)
+    cdef const float* p_gfac = _ptr_f32(gfac)
+    cdef const uint8_t* p_mask = _ptr_u8(mask)
+    with nogil:
+        c_calib_epix_multigain(&_raw[0], p_cbits, p_peds, p_gfac, p_mask, &_out[0], p_grinds, p_cmmask,\
+                               nevts, npix, data_bit_mask, data_gain_bit, gain_bit_shift, cm_hm_only)
+    return out
+
+
+def apply_gain_factor(out, grinds, gfac, mask):
+    """out *= gfac[grinds] * mask, where out and grinds are shaped as raw in calib_epix_multigain."""
+    cdef size_t npix = gfac.size // 8 if gfac is not None else mask.size
+    cdef size_t nevts = out.size // npix
+    assert out.size == nevts * npix and grinds.size == out.size
+    assert mask is None or mask.size == npix
+    assert out.flags.c_contiguous
+    cdef float[::1] _out = out.reshape(-1)
+    cdef const uint8_t* p_grinds = _ptr_u8(grinds)
+    cdef const float* p_gfac = _ptr_f32(gfac)
+    cdef const uint8_t* p_mask = _ptr_u8(mask)
+    with nogil:
+        c_apply_gain_factor(&_out[0], p_grinds, p_gfac, p_mask, nevts, npix)
+    return out
+
+
+def common_mode_epix_multigain(data, cmmask, unsigned mode, cormax=None, size_t npix_min=10, size_t nbanks=8):
+    """Median common mode correction of data (np.float32, C-contiguous) shaped as (..., <rows>, <cols>)
+       for good pixels in cmmask, the same as common_mode_epix_multigain_apply in UtilsEpix10ka.py.
+    """
+    assert data.shape == cmmask.shape and data.shape[-1] % nbanks == 0
+    assert data.flags.c_contiguous
+    cdef size_t rows = data.shape[-2]
+    cdef size_t cols = data.shape[-1]
+    cdef size_t nsegs = data.size // (rows * cols)
+    cdef float _cormax = -1 if cormax is None else cormax
+    cdef float[::1] _data = data.reshape(-1)
+    cdef const uint8_t* p_mask = _ptr_u8(cmmask)
+    with nogil:
+        c_common_mode_epix_multigain(&_data[0], p_mask, nsegs, rows, cols, mode, nbanks, _cormax, npix_min)
+    return data
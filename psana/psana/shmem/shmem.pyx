@@ -5,6 +5,8 @@ cdef extern from "psalg/shmem/ShmemClient.hh" namespace "psalg::shmem":
         void *get(int& ev_index, size_t& buf_size)
         void free(int ev_index, size_t buf_size)
 
+from cpython.buffer cimport PyBUF_WRITABLE
+
 cdef class PyShmemClient:
     """ Python wrapper for C++ class.
     """
@@ -42,8 +44,64 @@ cdef class PyShmemClient:
 
         return cview
 
+    def get_buffer(self):
+        """ Returns the next shmem buffer as a read-only ShmemBuffer without
+        copying (None if no buffer is available). The buffer is given back
+        to the server when the ShmemBuffer and every view on it are released.
+        """
+        cdef char* buf
+        cdef int ev_index = -1
+        cdef size_t buf_size = 0
+        cdef ShmemBuffer sbuf
+
+        buf = <char*>self.client.get(ev_index,buf_size)
+        if buf == NULL:
+          return
+
+        sbuf = ShmemBuffer.__new__(ShmemBuffer)
+        sbuf.owner = self
+        sbuf.buf = buf
+        sbuf.index = ev_index
+        sbuf.size = buf_size
+        return sbuf
+
     def free(self,dgram):
         self.client.free(dgram._shmem_index,dgram._shmem_size)
 
     def freeByIndex(self, index, size):
         self.client.free(index, size)
+
+
+cdef class ShmemBuffer:
+    """ Read-only buffer pointing into a shmem slot held by PyShmemClient.
+    The slot is freed when the last reference to this object (including
+    memoryviews, Dgrams and numpy arrays built on it) goes away.
+    """
+    cdef PyShmemClient owner
+    cdef char* buf
+    cdef int index
+    cdef size_t size
+    cdef Py_ssize_t shape[1]
+
+    def __getbuffer__(self, Py_buffer *buffer, int flags):
+        if flags & PyBUF_WRITABLE:
+            raise BufferError('ShmemBuffer is read-only')
+        self.shape[0] = self.size
+        buffer.buf = self.buf
+        buffer.format = 'B'
+        buffer.internal = NULL
+        buffer.itemsize = 1
+        buffer.len = self.size
+        buffer.ndim = 1
+        buffer.obj = self
+        buffer.readonly = 1
+        buffer.shape = self.shape
+        buffer.strides = NULL
+        buffer.suboffsets = NULL
+
+    def __releasebuffer__(self, Py_buffer *buffer):
+        pass
+
+    def __dealloc__(self):
+        if self.owner is not None and self.index >= 0:
+            self.owner.client.free(self.index, self.size)
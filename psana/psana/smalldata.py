@@ -9,11 +9,12 @@ Analysis consists of two different process types:
     > these perform per-event analysis
     > are associted with one specific server
     > after processing `batch_size` events, send a
-      dict of data over to their server
+      columnar batch (one array per dataset) over to their
+      server as raw buffers
 
   2. servers (srv)
     > recv a batch of events from one of many clients
-    > add these batches to a `cache`
+    > add whole columns of these batches to a `cache`
     > when the cache is full, write to disk
     > each server produces its OWN hdf5 file
 
@@ -67,6 +68,7 @@ from collections.abc import MutableMapping
 # -----------------------------------------------------------------------------
 
 from psana.psexp.tools import mode
+from psana.psexp.tracer import traced, set_label
 
 if mode == 'mpi':
     from mpi4py import MPI
@@ -93,6 +95,10 @@ FLOAT_TYPES = [float, np.float16, np.float32, np.float64, np.float128, float]
 RAGGED_PREFIX   = 'ragged_'
 UNALIGED_PREFIX = 'unaligned_'
 
+# MPI tags of batch messages: header (pickled) and data (raw buffer)
+HEADER_TAG = 0
+DATA_TAG   = 1
+
 def is_unaligned(dset_name):
     return dset_name.split('/')[-1].startswith(UNALIGED_PREFIX)
 
@@ -113,6 +119,28 @@ def _flatten_dictionary(d, parent_key='', sep='/'):
     return dict(items)
 
 
+def _get_dset_info(dataset_name, data):
+    """
+    Returns (dtype, shape) of a dataset from its (first) data
+    """
+
+    if type(data) == int:
+        shape = ()
+        dtype = 'i8'
+    elif type(data) == float:
+        shape = ()
+        dtype = 'f8'
+    elif hasattr(data, 'dtype'):
+        shape = data.shape
+        dtype = data.dtype
+    else:
+        raise TypeError('Type: Dataset %s type %s not compatible' % (dataset_name, type(data)))
+
+    if shape==(0,): raise ValueError('Dataset %s has illegal shape (0,)' % dataset_name)
+
+    return np.dtype(dtype), shape
+
+
 def _get_missing_value(dtype):
 
     if type(dtype) is not np.dtype:
@@ -161,11 +189,128 @@ class CacheArray:
         self.n_events += 1
         return
 
+    def extend(self, data):
+        """
+        Appends rows of data up to the cache size,
+        returns the number of rows appended
+        """
+        n = min(data.shape[0], self.cache_size - self.n_events)
+        self.data[self.n_events:self.n_events+n,...] = data[:n]
+        self.n_events += n
+        return n
+
     def reset(self):
         self.n_events = 0
         return
 
 
+class ColumnBatch:
+    """
+    A batch of events stored by columns: for each dataset one array
+    with the data of the events that have it, a presence mask over
+    the events of the batch and the (dtype, shape) of the dataset
+    taken from its first data.
+
+    Clients fill the batch event by event (`new_event`, `update`) and
+    ship it to their server as one raw buffer (`to_buffer`), servers
+    rebuild it with `from_buffer`.
+    """
+
+    def __init__(self):
+        self.n_events = 0
+        self._values  = {} # dataset_name --> ([event index], [data])
+        self._columns = {} # dataset_name --> (present, data, (dtype, shape))
+        return
+
+    def __len__(self):
+        return self.n_events
+
+    def new_event(self, event_data_dict):
+        self.n_events += 1
+        self.update(event_data_dict)
+        return
+
+    def update(self, event_data_dict):
+        """
+        Adds data to the last event of the batch, data of a dataset
+        already in the event replaces the previous one
+        """
+        i_evt = self.n_events - 1
+        for dataset_name, data in event_data_dict.items():
+            if dataset_name not in self._values:
+                self._values[dataset_name] = ([i_evt], [data])
+                continue
+            evt_inds, values = self._values[dataset_name]
+            if evt_inds[-1] == i_evt:
+                values[-1] = data
+            else:
+                evt_inds.append(i_evt)
+                values.append(data)
+        return
+
+    @property
+    def columns(self):
+        """
+        dict dataset_name --> (present, data, (dtype, shape)), where data
+        holds only the events with present == True (in event order)
+        """
+        for dataset_name, (evt_inds, values) in self._values.items():
+            present = np.zeros(self.n_events, dtype=bool)
+            present[evt_inds] = True
+            self._columns[dataset_name] = (present, np.asarray(values),
+                                           _get_dset_info(dataset_name, values[0]))
+        self._values = {}
+        return self._columns
+
+    def events(self):
+        """
+        Yields dicts of data per event (dataset_name --> data)
+        """
+        columns = self.columns
+        rows = {dataset_name: np.cumsum(present) - 1 for dataset_name, (present, _, _) in columns.items()}
+        for i_evt in range(self.n_events):
+            yield {dataset_name: data[rows[dataset_name][i_evt]] \
+                   for dataset_name, (present, data, _) in columns.items() if present[i_evt]}
+
+    def to_buffer(self):
+        """
+        Returns (header, buffer): header describes the columns (dict)
+        and the buffer (np.uint8) holds presence bitmaps and data
+        """
+        dsets = []
+        arrays = []
+        for dataset_name, (present, data, (dtype, shape)) in self.columns.items():
+            data = np.ascontiguousarray(data)
+            dsets.append((dataset_name, dtype.str, shape, data.dtype.str, data.shape))
+            arrays += [np.packbits(present), data]
+
+        nbytes = sum(a.nbytes for a in arrays)
+        buf = np.empty(nbytes, dtype=np.uint8)
+        offset = 0
+        for a in arrays:
+            buf[offset:offset+a.nbytes] = a.reshape(-1).view(np.uint8)
+            offset += a.nbytes
+
+        header = {'n_events': self.n_events, 'nbytes': nbytes, 'dsets': dsets}
+        return header, buf
+
+    @classmethod
+    def from_buffer(cls, header, buf):
+        batch = cls()
+        batch.n_events = header['n_events']
+        n_bits = (batch.n_events + 7) // 8
+        offset = 0
+        for dataset_name, dtype, shape, data_dtype, data_shape in header['dsets']:
+            present = np.unpackbits(buf[offset:offset+n_bits], count=batch.n_events).astype(bool)
+            offset += n_bits
+            data_dtype = np.dtype(data_dtype)
+            nbytes = int(np.prod(data_shape)) * data_dtype.itemsize
+            data = buf[offset:offset+nbytes].view(data_dtype).reshape(data_shape)
+            offset += nbytes
+            batch._columns[dataset_name] = (present, data, (np.dtype(dtype), tuple(shape)))
+        return batch
+
+
 class Server: # (hdf5 handling)
 
     def __init__(self, filename=None, smdcomm=None, cache_size=10000,
@@ -187,15 +332,23 @@ class Server: # (hdf5 handling)
         if (self.filename is not None):
             self.file_handle = h5py.File(self.filename, 'w')
 
+        set_label('srv')
+
         return
 
     def recv_loop(self):
 
         num_clients_done = 0
         num_clients = self.smdcomm.Get_size() - 1
+        status = MPI.Status()
         while num_clients_done < num_clients:
-            msg = self.smdcomm.recv(source=MPI.ANY_SOURCE)
-            if type(msg) is list:
+            msg = self.smdcomm.recv(source=MPI.ANY_SOURCE, tag=HEADER_TAG, status=status)
+            if type(msg) is dict:
+                # batch header, the data follows as one raw buffer
+                buf = np.empty(msg['nbytes'], dtype=np.uint8)
+                self.smdcomm.Recv(buf, source=status.Get_source(), tag=DATA_TAG)
+                self.handle(ColumnBatch.from_buffer(msg, buf))
+            elif type(msg) is list:
                 self.handle(msg)
             elif msg == 'done':
                 num_clients_done += 1
@@ -203,55 +356,62 @@ class Server: # (hdf5 handling)
         return
 
 
+    @traced('smalldata.srv_handle')
     def handle(self, batch):
+        """
+        batch: ColumnBatch or list of dicts of data per event
+        """
 
-        for event_data_dict in batch:
+        if type(batch) is list:
+            event_dicts = batch
+            batch = ColumnBatch()
+            for event_data_dict in event_dicts:
+                batch.new_event(event_data_dict)
 
-            for cb in self.callbacks:
+        for cb in self.callbacks:
+            for event_data_dict in batch.events():
                 cb(event_data_dict)
 
-            if self.filename is not None:
+        if self.filename is not None:
 
-                # to_backfill: list of keys we have seen previously
-                #              we want to be sure to backfill if we
-                #              dont see them
-                to_backfill = list(self._dsets.keys())
+            # to_backfill: list of keys we have seen previously
+            #              we want to be sure to backfill if we
+            #              dont see them
+            to_backfill = list(self._dsets.keys())
 
-                for dataset_name, data in event_data_dict.items():
+            for dataset_name, (present, data, dset_info) in batch.columns.items():
 
-                    if dataset_name not in self._dsets.keys():
-                        self.new_dset(dataset_name, data)
-                    else:
-                        to_backfill.remove(dataset_name)
+                if dataset_name not in self._dsets.keys():
+                    self.new_dset(dataset_name, dset_info)
+                else:
+                    to_backfill.remove(dataset_name)
+
+                if is_unaligned(dataset_name) or present.all():
                     self.append_to_cache(dataset_name, data)
+                else:
+                    # fill events without this dataset with missing values
+                    dtype, shape = self._dsets[dataset_name]
+                    rows = np.empty((batch.n_events,) + shape, dtype=dtype)
+                    rows[~present] = _get_missing_value(dtype)
+                    rows[present] = data
+                    self.append_to_cache(dataset_name, rows)
 
-                for dataset_name in to_backfill:
-                    if not is_unaligned(dataset_name):
-                        self.backfill(dataset_name, 1)
+            for dataset_name in to_backfill:
+                if not is_unaligned(dataset_name):
+                    self.backfill(dataset_name, batch.n_events)
 
-            self.num_events_seen += 1
+        self.num_events_seen += batch.n_events
 
         return
 
 
-    def new_dset(self, dataset_name, data):
-
-        if type(data) == int:
-            shape = ()
-            maxshape = (None,)
-            dtype = 'i8'
-        elif type(data) == float:
-            shape = ()
-            maxshape = (None,)
-            dtype = 'f8'
-        elif hasattr(data, 'dtype'):
-            shape = data.shape
-            maxshape = (None,) + data.shape
-            dtype = data.dtype
-        else:
-            raise TypeError('Type: Dataset %s type %s not compatible' % (dataset_name, type(data)))
+    def new_dset(self, dataset_name, dset_info):
+        """
+        dset_info: (dtype, shape) of the dataset (see _get_dset_info)
+        """
 
-        if shape==(0,): raise ValueError('Dataset %s has illegal shape (0,)' % dataset_name)
+        dtype, shape = dset_info
+        maxshape = (None,) + shape
 
         self._dsets[dataset_name] = (dtype, shape)
         dset = self.file_handle.create_dataset(dataset_name,
@@ -267,6 +427,10 @@ class Server: # (hdf5 handling)
 
 
     def append_to_cache(self, dataset_name, data):
+        """
+        Appends rows of data (first dimension is events) to the cache,
+        full caches are written to file
+        """
 
         if dataset_name not in self._cache.keys():
             dtype, shape = self._dsets[dataset_name]
@@ -275,14 +439,16 @@ class Server: # (hdf5 handling)
         else:
             cache = self._cache[dataset_name]
 
-        cache.append(data)
-
-        if cache.n_events == self.cache_size:
-            self.write_to_file(dataset_name, cache)
+        i_row = 0
+        while i_row < data.shape[0]:
+            i_row += cache.extend(data[i_row:])
+            if cache.n_events == self.cache_size:
+                self.write_to_file(dataset_name, cache)
 
         return
 
 
+    @traced('smalldata.srv_write')
     def write_to_file(self, dataset_name, cache):
         dset = self.file_handle.get(dataset_name)
         new_size = (dset.shape[0] + cache.n_events,) + dset.shape[1:]
@@ -298,11 +464,13 @@ class Server: # (hdf5 handling)
         dtype, shape = self._dsets[dataset_name]
 
         missing_value = _get_missing_value(dtype) 
-        fill_data = np.empty(shape, dtype=dtype)
+        fill_data = np.empty((min(num_to_backfill, self.cache_size),) + shape, dtype=dtype)
         fill_data.fill(missing_value)
     
-        for i in range(num_to_backfill):
-            self.append_to_cache(dataset_name, fill_data)
+        while num_to_backfill > 0:
+            n = min(num_to_backfill, fill_data.shape[0])
+            self.append_to_cache(dataset_name, fill_data[:n])
+            num_to_backfill -= n
         
         return
 
@@ -363,7 +531,7 @@ class SmallData: # (client)
         """
 
         self.batch_size = batch_size
-        self._batch = []
+        self._batch = ColumnBatch()
         self._previous_timestamp = -1
 
         if cache_size is None:
@@ -479,7 +647,7 @@ class SmallData: # (client)
 
         #   >> multiple calls to self.event(...), same event as before
         if timestamp == self._previous_timestamp:
-            self._batch[-1].update(event_data_dict)
+            self._batch.update(event_data_dict)
 
         #   >> we have a new event
         elif timestamp > self._previous_timestamp:
@@ -491,12 +659,12 @@ class SmallData: # (client)
                 if MODE == 'SERIAL':
                     self._server.handle(self._batch)
                 elif MODE == 'PARALLEL':
-                    self._srvcomm.send(self._batch, dest=0)
-                self._batch = []           
+                    self._send_batch()
+                self._batch = ColumnBatch()
 
             event_data_dict['timestamp'] = timestamp
             self._previous_timestamp = timestamp
-            self._batch.append(event_data_dict)
+            self._batch.new_event(event_data_dict)
 
         else:
             # FIXME: cpo
@@ -515,6 +683,17 @@ class SmallData: # (client)
         return
 
 
+    @traced('smalldata.send')
+    def _send_batch(self):
+        """
+        Sends the batch to the server: header (pickled), then data (raw buffer)
+        """
+        header, buf = self._batch.to_buffer()
+        self._srvcomm.send(header, dest=0, tag=HEADER_TAG)
+        self._srvcomm.Send(buf, dest=0, tag=DATA_TAG)
+        return
+
+
     @property
     def summary(self):
         """
@@ -676,8 +855,8 @@ class SmallData: # (client)
         if self._type == 'client':
             # we want to send the finish signal to the server
             if len(self._batch) > 0:
-                self._srvcomm.send(self._batch, dest=0)
-            self._srvcomm.send('done', dest=0)
+                self._send_batch()
+            self._srvcomm.send('done', dest=0, tag=HEADER_TAG)
 
         elif self._type == 'server':
             self._server.done()
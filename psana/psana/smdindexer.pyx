@@ -0,0 +1,204 @@
+## cython: linetrace=True
+## distutils: define_macros=CYTHON_TRACE_NOGIL=1
+
+from dgramlite cimport Xtc, Sequence, Dgram
+from libc.stdint cimport uint32_t, uint64_t, int64_t
+from cpython cimport array
+import array
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_ANY_CONTIGUOUS, PyBUF_SIMPLE
+cimport cython
+import numpy as np
+
+# Values from xtcdata TypeId::Type and psana.psexp.TransitionId
+cdef enum:
+    TYPEID_MASK         = 0x0fff
+    TYPEID_SHAPESDATA   = 1
+    TYPEID_DATA         = 3
+    L1ACCEPT            = 12
+
+# Size of one PacketFooter element (see psana.psexp.PacketFooter.n_bytes)
+cdef enum:
+    FOOTER_NBYTES       = 4
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def index_smd_batch(view, int n_smd_files, use_smds, bint has_bigdata,
+        int64_t bd_chunksize,
+        int64_t[:, :] bd_offset_array,
+        int64_t[:, :] bd_size_array,
+        int64_t[:, :] smd_offset_array,
+        int64_t[:, :] smd_size_array,
+        int64_t[:, :] cutoff_flag_array,
+        int64_t[:] services):
+    """ Fills offset, size, cutoff flag and service arrays for a batch of smd events.
+
+    This is the compiled equivalent of the per-dgram loop in
+    EventManager._get_offset_and_size. The batch layout (see PacketFooter) is
+    [
+      [[d_bytes][d_bytes]....[evt_footer]] <-- 1 event
+      [[d_bytes][d_bytes]....[evt_footer]]
+      [chunk_footer]]
+    ]
+    Only the raw Dgram and Xtc headers are read. For L1Accept dgrams of streams
+    with bigdata, offset and size of the bigdata dgram are read from the smdinfo
+    ShapesData, which the smd writer (xtcdata Smd::generate) always places as
+    the only ShapesData in the dgram:
+        Dgram | ShapesData Xtc | Data Xtc | intOffset (u64) | intDgramSize (u64)
+
+    All output arrays must be pre-allocated by the caller with shape
+    (n_events, n_smd_files) (services: n_events) and cutoff_flag_array set to 1.
+
+    Raises ValueError when an L1Accept dgram does not have the expected smdinfo
+    layout so that the caller can fall back to the python path.
+    """
+    cdef Py_buffer buf
+    cdef char* view_ptr
+    cdef uint32_t* chunk_footer
+    cdef uint32_t* evt_footer
+    cdef uint32_t n_events
+    cdef uint32_t n_evt_packets
+    cdef Py_ssize_t view_nbytes
+    cdef int64_t evt_offset = 0
+    cdef int64_t evt_size
+    cdef int64_t offset
+    cdef int64_t dg_size
+    cdef int64_t bd_offset, bd_size
+    cdef int i_evt, i_smd
+    cdef int i_first_L1 = -1
+    cdef unsigned service
+    cdef Dgram* dg
+    cdef Xtc* shapesdata
+    cdef Xtc* data
+    cdef uint64_t* smdinfo
+
+    cdef array.array c_use_smds = array.array('i', [1 if flag else 0 for flag in use_smds] if use_smds else [0]*n_smd_files)
+
+    # For comparing if the next dgram should be in the same read
+    cdef array.array current_bd_offsets = array.array('q', [0]*n_smd_files)
+    # Current chunk size (gets reset at boundary)
+    cdef array.array current_bd_chunk_sizes = array.array('q', [0]*n_smd_files)
+
+    PyObject_GetBuffer(view, &buf, PyBUF_SIMPLE | PyBUF_ANY_CONTIGUOUS)
+    try:
+        view_ptr = <char *>buf.buf
+        view_nbytes = buf.len
+        n_events = (<uint32_t *>(view_ptr + view_nbytes - FOOTER_NBYTES))[0]
+        chunk_footer = <uint32_t *>(view_ptr + view_nbytes - (n_events + 1) * FOOTER_NBYTES)
+
+        for i_evt in range(n_events):
+            evt_size = chunk_footer[i_evt]
+            n_evt_packets = (<uint32_t *>(view_ptr + evt_offset + evt_size - FOOTER_NBYTES))[0]
+            if n_evt_packets != n_smd_files:
+                raise ValueError(f'Event footer has {n_evt_packets} packets (expected: {n_smd_files})')
+            evt_footer = <uint32_t *>(view_ptr + evt_offset + evt_size - (n_evt_packets + 1) * FOOTER_NBYTES)
+
+            offset = evt_offset
+            for i_smd in range(n_smd_files):
+                dg_size = evt_footer[i_smd]
+
+                # Only get offset and size of non-missing dgram
+                if dg_size == 0:
+                    cutoff_flag_array[i_evt, i_smd] = 0
+                    continue
+
+                dg = <Dgram *>(view_ptr + offset)
+                service = (dg.env>>24)&0xf
+                smd_offset_array[i_evt, i_smd] = offset
+                smd_size_array[i_evt, i_smd] = sizeof(Dgram) + (dg.xtc.extent - sizeof(Xtc))
+                services[i_evt] = service
+
+                # For L1 with bigdata files, store offset and size found in smd dgrams.
+                if service == L1ACCEPT and has_bigdata:
+                    if i_first_L1 == -1:
+                        i_first_L1 = i_evt
+
+                    if not c_use_smds[i_smd]:
+                        shapesdata = <Xtc *>(view_ptr + offset + sizeof(Dgram))
+                        data = <Xtc *>(<char *>shapesdata + sizeof(Xtc))
+                        if dg.xtc.extent < 3 * sizeof(Xtc) + 2 * sizeof(uint64_t) \
+                                or (shapesdata.contains & TYPEID_MASK) != TYPEID_SHAPESDATA \
+                                or (data.contains & TYPEID_MASK) != TYPEID_DATA \
+                                or data.extent < sizeof(Xtc) + 2 * sizeof(uint64_t):
+                            raise ValueError(f'Unexpected smdinfo layout in smd dgram (i_evt={i_evt} i_smd={i_smd})')
+                        smdinfo = <uint64_t *>(<char *>data + sizeof(Xtc))
+                        bd_offset = smdinfo[0]
+                        bd_size = smdinfo[1]
+                        bd_offset_array[i_evt, i_smd] = bd_offset
+                        bd_size_array[i_evt, i_smd] = bd_size
+
+                        # Check continuous chunk
+                        if current_bd_offsets[i_smd] == bd_offset \
+                                and i_evt != i_first_L1 \
+                                and current_bd_chunk_sizes[i_smd] + bd_size < bd_chunksize:
+                            cutoff_flag_array[i_evt, i_smd] = 0
+                            current_bd_chunk_sizes[i_smd] += bd_size
+                        else:
+                            current_bd_chunk_sizes[i_smd] = bd_size
+
+                        current_bd_offsets[i_smd] = bd_offset + bd_size
+
+                offset += dg_size
+
+            evt_offset += evt_size
+    finally:
+        PyBuffer_Release(&buf)
+
+    return n_events
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def index_batch_packets(view):
+    """ Returns offsets and sizes of all packets of all events in a batch.
+
+    The batch is a list of events, each with its own event footer (see
+    index_smd_batch for the layout). Output arrays have shape
+    (n_events, n_packets) where n_packets is the no. of packets in the
+    first event footer. Raises ValueError when events have different
+    no. of packets.
+    """
+    cdef Py_buffer buf
+    cdef char* view_ptr
+    cdef uint32_t* chunk_footer
+    cdef uint32_t* evt_footer
+    cdef uint32_t n_events
+    cdef uint32_t n_packets = 0
+    cdef uint32_t n_evt_packets
+    cdef int64_t evt_offset = 0
+    cdef int64_t offset
+    cdef int64_t evt_size
+    cdef int i_evt, i_pkt
+    cdef int64_t[:, :] offsets
+    cdef int64_t[:, :] sizes
+
+    PyObject_GetBuffer(view, &buf, PyBUF_SIMPLE | PyBUF_ANY_CONTIGUOUS)
+    try:
+        view_ptr = <char *>buf.buf
+        if buf.len == 0:
+            return np.zeros((0, 0), dtype=np.int64), np.zeros((0, 0), dtype=np.int64)
+        n_events = (<uint32_t *>(view_ptr + buf.len - FOOTER_NBYTES))[0]
+        chunk_footer = <uint32_t *>(view_ptr + buf.len - (n_events + 1) * FOOTER_NBYTES)
+        if n_events > 0:
+            n_packets = (<uint32_t *>(view_ptr + chunk_footer[0] - FOOTER_NBYTES))[0]
+        offsets_arr = np.zeros((n_events, n_packets), dtype=np.int64)
+        sizes_arr = np.zeros((n_events, n_packets), dtype=np.int64)
+        offsets = offsets_arr
+        sizes = sizes_arr
+
+        for i_evt in range(n_events):
+            evt_size = chunk_footer[i_evt]
+            n_evt_packets = (<uint32_t *>(view_ptr + evt_offset + evt_size - FOOTER_NBYTES))[0]
+            if n_evt_packets != n_packets:
+                raise ValueError(f'Event footer has {n_evt_packets} packets (expected: {n_packets})')
+            evt_footer = <uint32_t *>(view_ptr + evt_offset + evt_size - (n_evt_packets + 1) * FOOTER_NBYTES)
+            offset = evt_offset
+            for i_pkt in range(n_packets):
+                offsets[i_evt, i_pkt] = offset
+                sizes[i_evt, i_pkt] = evt_footer[i_pkt]
+                offset += evt_footer[i_pkt]
+            evt_offset += evt_size
+    finally:
+        PyBuffer_Release(&buf)
+
+    return offsets_arr, sizes_arr
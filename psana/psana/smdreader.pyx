@@ -117,9 +117,14 @@ cdef class SmdReader:
         # creating any fake dgrams using DgramEdit.
         self.configs = configs
 
-    def get(self, smd_inprogress_converted):
+    def get(self, smd_inprogress_converted, wait_fn=None):
         """SmdReaderManager only calls this function when there's no more event
-        in one or more buffers. Reset the indices for buffers that need re-read."""
+        in one or more buffers. Reset the indices for buffers that need re-read.
+
+        In live mode, wait_fn(timeout) is used instead of sleeping between retries
+        (returns True when woken up early by new data, see FileFollower). Wake-ups
+        don't count as retries, but the wait is still bounded by max_retries*sleep_secs
+        seconds: a wake-up may come from a file that is not the one missing data."""
 
         # Exit if EndRun is found for all files. This is safe even though
         # we support mulirun in one xtc2 file but this is only for shmem mode,
@@ -140,6 +145,7 @@ cdef class SmdReader:
         if self.max_retries > 0:
 
             cn_retries = 0
+            deadline = time.monotonic() + self.max_retries * self.sleep_secs
             while not self.is_complete():
                 flag_founds = smd_inprogress_converted()
 
@@ -149,7 +155,13 @@ cdef class SmdReader:
                 # to read but we'll still need to do sleep.
                 if all(flag_founds): break
 
-                time.sleep(self.sleep_secs)
+                if wait_fn is None:
+                    time.sleep(self.sleep_secs)
+                elif wait_fn(self.sleep_secs):
+                    self.prl_reader.just_read()
+                    if time.monotonic() < deadline: continue
+                    print(f'waiting for an event...gave up after {self.max_retries * self.sleep_secs}s (use PS_R_MAX_RETRIES for different value)')
+                    break
                 print(f'waiting for an event...retry#{cn_retries+1} (max_retries={self.max_retries}, use PS_R_MAX_RETRIES for different value)')
                 self.prl_reader.just_read()
                 cn_retries += 1
@@ -299,6 +311,19 @@ cdef class SmdReader:
 
         self.total_time += en_all - st_all
 
+    def seek(self, offsets):
+        """ Moves the smd files to the given offsets and drops all buffered
+        data (e.g. to skip the rest of a run using the event index)."""
+        cdef int i
+        for i in range(self.prl_reader.nfiles):
+            os.lseek(self.prl_reader.file_descriptors[i], offsets[i], os.SEEK_SET)
+            self.i_starts[i] = 0
+            self.i_ends[i] = 0
+            self.i_stepbuf_starts[i] = 0
+            self.i_stepbuf_ends[i] = 0
+        self.prl_reader.reset_buffers()
+        self.winner = -1
+
     def get_next_fake_ts(self):
         """Returns next fake timestamp 
 
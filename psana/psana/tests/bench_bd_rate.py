@@ -0,0 +1,71 @@
+""" Measures events/s per bigdata rank.
+
+Usage examples:
+    # compare compiled smd batch indexer against the python path
+    PS_SMD_INDEXER=0 mpirun -n 5 python bench_bd_rate.py -e xpptut15 -r 1 -d <xtc_dir>
+    PS_SMD_INDEXER=1 mpirun -n 5 python bench_bd_rate.py -e xpptut15 -r 1 -d <xtc_dir>
+
+    # on-demand bigdata reads (only streams of detectors given by --det are read)
+    PS_BD_ON_DEMAND=1 mpirun -n 5 python bench_bd_rate.py -e xpptut15 -r 1 -d <xtc_dir> --det xppcspad
+
+Without -e/-r/-d, the chunking test data in test_data/ are used.
+"""
+import os
+import time
+import argparse
+import numpy as np
+from psana import DataSource
+
+
+def bench_bd_rate(exp, run, xtc_dir, max_events=0, batch_size=1000, detectors=[]):
+    ds = DataSource(exp=exp, run=run, dir=xtc_dir, max_events=max_events, batch_size=batch_size)
+
+    n_events = 0
+    st = 0
+    for myrun in ds.runs():
+        dets = [myrun.Detector(det_name) for det_name in detectors]
+        for evt in myrun.events():
+            if st == 0:
+                st = time.monotonic()
+            for det in dets:
+                det.raw.raw(evt)
+            n_events += 1
+    en = time.monotonic()
+    return n_events, en - st if st > 0 else 0
+
+
+def report(n_events, elapsed):
+    from psana.psexp.tools import mode
+    env_keys = ('PS_SMD_INDEXER', 'PS_BD_CHUNKSIZE', 'PS_BD_ON_DEMAND', 'PS_EB_NODES')
+    env_str = ' '.join([f'{key}={os.environ[key]}' for key in env_keys if key in os.environ])
+    rate = n_events / elapsed if elapsed > 0 else 0
+    if mode == 'mpi':
+        from mpi4py import MPI
+        comm = MPI.COMM_WORLD
+        rates = comm.gather(rate, root=0)
+        counts = comm.gather(n_events, root=0)
+        if comm.Get_rank() == 0:
+            rates = np.asarray(rates)
+            counts = np.asarray(counts)
+            bd_rates = rates[counts > 0]
+            if bd_rates.size:
+                print(f'{env_str} #bd_ranks={bd_rates.size} #events={np.sum(counts)} '
+                      f'events/s per bd rank: mean={np.mean(bd_rates):.1f} '
+                      f'min={np.min(bd_rates):.1f} max={np.max(bd_rates):.1f}')
+    else:
+        print(f'{env_str} #events={n_events} events/s={rate:.1f}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='bigdata event rate benchmark')
+    parser.add_argument('-e', '--exp', default='xpptut15', help='experiment name')
+    parser.add_argument('-r', '--run', type=int, default=1, help='run number')
+    parser.add_argument('-d', '--dir', default=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_data', 'chunking'), help='xtc2 directory')
+    parser.add_argument('-n', '--max_events', type=int, default=0, help='max. no. of events')
+    parser.add_argument('-b', '--batch_size', type=int, default=1000, help='batch size')
+    parser.add_argument('--det', action='append', default=[], help='detector name(s) to read raw data from')
+    args = parser.parse_args()
+
+    n_events, elapsed = bench_bd_rate(args.exp, args.run, args.dir,
+            max_events=args.max_events, batch_size=args.batch_size, detectors=args.det)
+    report(n_events, elapsed)
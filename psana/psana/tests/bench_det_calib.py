@@ -0,0 +1,68 @@
+""" Micro-benchmark for per-event det.raw.calib(evt) latency.
+
+Usage examples:
+    python bench_det_calib.py
+    python bench_det_calib.py -n 200 --nsegs 16 --segs 0,1,2,3 --segs 0,5,10,15
+
+Creates AreaDetector with synthetic pedestals for nsegs epix10ka-like
+segments (nsegs x 352 x 384) and synthetic events for the
+given daq segments, then times calib(evt) with constants for daq segments
+cached per run (current) and re-sliced by np.take on every call (old
+behavior, emulated by dropping the cache before each call).
+"""
+import time
+import argparse
+import numpy as np
+from psana.detector.areadetector import AreaDetector
+
+
+class ConfigInfo:
+    def __init__(self, segs):
+        self.configs = []
+        self.sorted_segment_ids = segs
+        self.dgram_inds = None
+        self.uniqueid = 'bench'
+        self.dettype = 'bench'
+
+
+class Segment:
+    def __init__(self, raw):
+        self.raw = raw
+
+
+class Event:
+    def __init__(self, det_name, segs, shape):
+        self._det_segments = {(det_name, 'raw'): {k: Segment(np.random.randint(0, 1<<14, shape, dtype=np.uint16)) for k in segs}}
+
+    def _get_det_segments(self, det_name, drp_class_name, dgram_inds=None):
+        return self._det_segments.get((det_name, drp_class_name))
+
+
+def bench(n_events, nsegs, segs, shape=(352, 384)):
+    calibconst = {'pedestals': (np.random.random((nsegs,) + shape).astype(np.float32), {})}
+    det = AreaDetector('bench', 'raw', ConfigInfo(segs), calibconst)
+    evts = [Event('bench', segs, shape) for i in range(n_events)]
+
+    results = {}
+    for name, reset in (('cached', False), ('np.take', True)):
+        if reset: det._daq_segs_slice = lambda: None
+        det.calib(evts[0])
+        st = time.monotonic()
+        for evt in evts:
+            if reset: det._daq_segs_cons_.clear()
+            det.calib(evt)
+        results[name] = time.monotonic() - st
+
+    for name, elapsed in results.items():
+        print(f'#segs={len(segs):2d}/{nsegs} segs={segs} {name:10s} {elapsed/n_events*1e3:8.3f} ms/event')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='det.raw.calib(evt) micro-benchmark')
+    parser.add_argument('-n', '--n_events', type=int, default=100, help='no. of events')
+    parser.add_argument('--nsegs', type=int, default=16, help='total no. of detector segments in constants')
+    parser.add_argument('--segs', action='append', help='comma-separated daq segments (default: 0,1,2,3 and 0,5,10,15)')
+    args = parser.parse_args()
+
+    for segs in args.segs if args.segs else ['0,1,2,3', '0,5,10,15']:
+        bench(args.n_events, args.nsegs, [int(k) for k in segs.split(',')])
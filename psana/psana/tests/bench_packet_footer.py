@@ -0,0 +1,82 @@
+""" Micro-benchmark for splitting smd batches with PacketFooter.
+
+Usage examples:
+    python bench_packet_footer.py
+    python bench_packet_footer.py -n 1000 -n 100000 -s 8 --legacy
+
+Builds a synthetic batch (n events, each with s packets and an event
+footer) and times splitting the batch into events and events into packets
+with PacketFooter, with the compiled footer indexer (psana.smdindexer) and,
+with --legacy, with the old struct-based per-packet implementation.
+"""
+import time
+import struct
+import argparse
+import numpy as np
+from psana.psexp.packet_footer import PacketFooter
+
+
+def make_batch(n_events, n_packets, packet_size=64):
+    evt_pf = PacketFooter(n_packets)
+    for i in range(n_packets):
+        evt_pf.set_size(i, packet_size)
+    evt = bytes(packet_size * n_packets) + bytes(evt_pf.footer)
+    batch_pf = PacketFooter(n_events)
+    batch_pf.sizes[:] = len(evt)
+    return bytearray(evt * n_events) + batch_pf.footer
+
+
+def legacy_split_packets(view):
+    """ Old implementation: struct.unpack per packet and O(n^2) offsets."""
+    n_packets = struct.unpack("I", view[-4:])[0]
+    footer = view[-(n_packets + 1)*4:]
+    sizes = np.asarray([struct.unpack("I", footer[idx*4: idx*4+4])[0] for idx in range(n_packets)])
+    offsets = np.asarray([np.sum(sizes[:idx]) for idx in range(n_packets)])
+    return [memoryview(view[offsets[idx]: offsets[idx]+sizes[idx]]) for idx in range(n_packets)]
+
+
+def split_all(batch, split_fn):
+    n_bytes = 0
+    for evt in split_fn(batch):
+        for packet in split_fn(evt):
+            n_bytes += packet.nbytes
+    return n_bytes
+
+
+def bench(n_events, n_packets, legacy=False):
+    batch = make_batch(n_events, n_packets)
+    results = {}
+
+    st = time.monotonic()
+    n_bytes = split_all(batch, lambda view: PacketFooter(view=view).split_packets())
+    results['PacketFooter'] = time.monotonic() - st
+
+    try:
+        from psana.smdindexer import index_batch_packets
+        st = time.monotonic()
+        offsets, sizes = index_batch_packets(batch)
+        mv = memoryview(batch)
+        assert n_bytes == sum([mv[st: st+size].nbytes for st, size in zip(offsets.ravel().tolist(), sizes.ravel().tolist())])
+        results['index_batch_packets'] = time.monotonic() - st
+    except ImportError:
+        pass
+
+    if legacy:
+        st = time.monotonic()
+        assert n_bytes == split_all(batch, legacy_split_packets)
+        results['legacy'] = time.monotonic() - st
+
+    for name, elapsed in results.items():
+        print(f'#events={n_events:7d} #packets={n_packets} {name:20s} {elapsed*1e3:10.2f} ms '
+              f'({n_events/elapsed:.0f} events/s)')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='PacketFooter micro-benchmark')
+    parser.add_argument('-n', '--n_events', type=int, action='append', help='no. of events per batch (default: 1000, 10000, 100000)')
+    parser.add_argument('-s', '--n_packets', type=int, default=4, help='no. of packets (smd files) per event')
+    parser.add_argument('--legacy', action='store_true', help='also time the old struct-based implementation (slow for large batches)')
+    args = parser.parse_args()
+
+    for n_events in args.n_events if args.n_events else [1000, 10000, 100000]:
+        bench(n_events, args.n_packets, legacy=args.legacy)
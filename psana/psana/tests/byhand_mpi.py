@@ -37,11 +37,37 @@ class Test:
         
         run_intg_det = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'run_intg_det.py')
         subprocess.check_call(['mpirun','-n','4','python',run_intg_det], env=env)
+
+        # Indexed event access (index built on Smd0 and broadcast)
+        run_event_index = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'run_event_index.py')
+        subprocess.check_call(['mpirun','-n','5','python',run_event_index,str(tmp_path / 'event_index')], env=env)
         
+        # Bigdata batches repacked by EventBuilder cores give the same events as serial
+        run_bd_modes = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'run_bd_modes.py')
+        expected = subprocess.check_output(['python',run_bd_modes], env=env)
+        assert len(expected.splitlines()) == 15
+        assert subprocess.check_output(['mpirun','-n','5','python',run_bd_modes], env=env) == expected
+
+        # Smd0 read-ahead off and on (small batches: many read-aheads) give the same events
+        for smd0_prefetch in ('0', '1'):
+            env_prefetch = dict(env, PS_SMD0_PREFETCH=smd0_prefetch, PS_SMD_N_EVENTS='2')
+            assert subprocess.check_output(['mpirun','-n','5','python',run_bd_modes], env=env_prefetch) == expected
+
+        # EventBuilder batches sized by bd rank throughput give the same events
+        env_adaptive = dict(env, PS_EB_ADAPTIVE_BATCH='1')
+        assert subprocess.check_output(['mpirun','-n','5','python',run_bd_modes], env=env_adaptive) == expected
+
+        # Parallel dark processing (1st stage gathered, 2nd stage reduced) gives the serial results
+        run_dark_proc = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'run_dark_proc.py')
+        subprocess.check_call(['mpirun','-n','4','python',run_dark_proc], env=env)
+
         # Test more than 1 eb node
         env['PS_EB_NODES'] = '2'
         subprocess.check_call(['mpirun','-n','7','python',run_mixed_rate], env=env)
         subprocess.check_call(['mpirun','-n','7','python',run_chunking], env=env)
+        assert subprocess.check_output(['mpirun','-n','7','python',run_bd_modes], env=env) == expected
+        env_adaptive = dict(env, PS_EB_ADAPTIVE_BATCH='1')
+        assert subprocess.check_output(['mpirun','-n','7','python',run_bd_modes], env=env_adaptive) == expected
         
         env['PS_EB_NODES'] = '1' # reset no. of eventbuilder cores
         env['PS_SRV_NODES'] = '2'
@@ -0,0 +1,33 @@
+""" Prints timestamp, service and checksum of the event data (smd and
+bigdata dgrams) of every event in test_data/chunking. Used to compare
+bigdata reading modes (PS_BD_ON_DEMAND, PS_BD_READAHEAD, PS_BD_MMAP) and
+parallel runs (bigdata batches repacked by EventBuilder cores) against the
+default serial mode."""
+from psana import DataSource
+import os
+import hashlib
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+rank = comm.Get_rank()
+
+def run_bd_modes(xtc_dir=None):
+    if xtc_dir is None:
+        xtc_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_data', 'chunking')
+    # Small batches: each bigdata core gets several batches
+    ds = DataSource(exp='xpptut15', run=1, dir=xtc_dir, batch_size=2)
+    lines = []
+    for run in ds.runs():
+        for evt in run.events():
+            checksum = hashlib.md5(evt._to_bytes()).hexdigest()
+            lines.append(f'{evt.timestamp} {evt.service()} {checksum}')
+    all_lines = comm.gather(lines, root=0)
+    if rank == 0:
+        return sorted([line for rank_lines in all_lines for line in rank_lines],
+                key=lambda line: int(line.split()[0]))
+    return None
+
+if __name__ == "__main__":
+    lines = run_bd_modes()
+    if rank == 0:
+        for line in lines:
+            print(line)
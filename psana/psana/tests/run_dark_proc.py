@@ -0,0 +1,39 @@
+""" Parallel dark processing: events are split between ranks, the 1st stage
+data block is gathered on rank 0 and the 2nd stage accumulators are reduced
+on rank 0. Checks that the reduced sums, extrema and constants match the
+serial processing of the same events."""
+import numpy as np
+from mpi4py import MPI
+import psana.detector.UtilsCalib as uac
+comm = MPI.COMM_WORLD
+rank = comm.Get_rank()
+size = comm.Get_size()
+
+def run_dark_proc(nrecs, nrecs1, data, comm=None):
+    dpo = uac.DarkProc(nrecs=nrecs, nrecs1=nrecs1, plotim=0, comm=comm)
+    for i, raw in enumerate(data):
+        if dpo.event(raw, i) == 2: break
+    dpo.summary()
+    return dpo
+
+def run_test_dark_proc():
+    # nrecs1 and nrecs are split evenly: rank parts of the block and of
+    # the 2nd stage are events rank, rank+size, ... of the serial ones
+    nrecs, nrecs1 = 40*size, 8*size
+    rng = np.random.default_rng(0)
+    data = (1000 + rng.normal(0, 5, (nrecs, 4, 64))).astype(np.uint16)
+    data[::7, 0, :8] = 0 # below int_lo
+    reduced = run_dark_proc(nrecs, nrecs1, data[rank::size], comm=comm)
+    if rank != 0: return
+
+    serial = run_dark_proc(nrecs, nrecs1, data)
+    for name in ('gate_lo', 'gate_hi', 'arr_med', 'abs_dev', 'arr_sum0',\
+                 'sta_int_lo', 'sta_int_hi', 'arr_max', 'arr_min'):
+        np.testing.assert_array_equal(getattr(reduced, name), getattr(serial, name), err_msg=name)
+    for name in ('arr_sum1', 'arr_sum2'): # summation order differs
+        np.testing.assert_allclose(getattr(reduced, name), getattr(serial, name), rtol=1e-12, err_msg=name)
+    for c_reduced, c_serial in zip(reduced.constants_av1_rms_sta(), serial.constants_av1_rms_sta()):
+        np.testing.assert_allclose(c_reduced, c_serial, rtol=1e-9)
+
+if __name__ == "__main__":
+    run_test_dark_proc()
@@ -0,0 +1,49 @@
+from psana import DataSource
+import os, sys, shutil
+import numpy as np
+from mpi4py import MPI
+comm = MPI.COMM_WORLD
+rank = comm.Get_rank()
+size = comm.Get_size()
+
+def setup_event_index_files(xtc_dir, runnums=(1, 2, 3)):
+    """ Copies test_data/chunking (run 1) as runs with the given run numbers."""
+    src_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_data', 'chunking')
+    os.makedirs(os.path.join(xtc_dir, 'smalldata'))
+    for runnum in runnums:
+        for filename in ('data-r0001-s000-c000.xtc2', 'data-r0001-s000-c001.xtc2',
+                os.path.join('smalldata', 'data-r0001-s000-c000.smd.xtc2')):
+            shutil.copy(os.path.join(src_dir, filename),
+                    os.path.join(xtc_dir, filename.replace('r0001', 'r%s'%(str(runnum).zfill(4)))))
+
+def _gather_timestamps(timestamps):
+    all_timestamps = comm.allgather(timestamps)
+    return sorted([ts for rank_timestamps in all_timestamps for ts in rank_timestamps])
+
+def run_test_event_index(xtc_dir):
+    # Runs 1 and 3 are read normally and run 2 (same events as run 1) is
+    # read with the event index: the next run must be found after it.
+    ds = DataSource(exp='xpptut15', run=[1, 2, 3], dir=xtc_dir, batch_size=1)
+    run_timestamps = {}
+    for run in ds.runs():
+        if run.runnum == 2:
+            selected = run_timestamps[1][::2]
+            timestamps = [evt.timestamp for evt in run.events(timestamps=selected)]
+            run_timestamps[2] = _gather_timestamps(timestamps)
+            assert run_timestamps[2] == selected
+        else:
+            timestamps = [evt.timestamp for evt in run.events()]
+            run_timestamps[run.runnum] = _gather_timestamps(timestamps)
+            assert len(run_timestamps[run.runnum]) == 15
+
+    assert sorted(run_timestamps) == [1, 2, 3]
+    assert run_timestamps[3] == run_timestamps[1]
+    if rank == 0:
+        assert os.path.exists(os.path.join(xtc_dir, 'smalldata', 'data-r0002.smd.idx.npz'))
+
+if __name__ == "__main__":
+    xtc_dir = sys.argv[1]
+    if rank == 0:
+        setup_event_index_files(xtc_dir)
+    comm.Barrier()
+    run_test_event_index(xtc_dir)
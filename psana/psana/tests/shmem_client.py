@@ -36,13 +36,22 @@ def launch_client(pid, supervisor=-1):
 
     cspad = run.Detector('xppcspad')
     hsd = run.Detector('xpphsd')
+    # Copies of events must own their data: in zero-copy mode (PS_SHMEM_ZERO_COPY=1)
+    # the shmem buffers of the events are given back and reused by the server
+    copies = []
     for evt in run.events():
         assert(hsd.raw.calib(evt).shape==(5,))
         assert(hsd.fex.calib(evt).shape==(6,))
         padarray = vals.padarray
         assert(np.array_equal(cspad.raw.calib(evt),np.stack((padarray,padarray))))
         assert(np.array_equal(cspad.raw.image(evt),np.vstack((padarray,padarray))))
+        copies.append((evt.copy(), evt.timestamp, bytes(evt._to_bytes())))
         dg_count += 1
+
+    for evt, timestamp, evt_bytes in copies:
+        assert evt.timestamp == timestamp
+        assert bytes(evt._to_bytes()) == evt_bytes
+        assert(np.array_equal(cspad.raw.calib(evt),np.stack((vals.padarray,vals.padarray))))
     return dg_count  
 
 #------------------------------
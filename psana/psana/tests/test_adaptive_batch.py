@@ -0,0 +1,40 @@
+import time
+import unittest
+from psana.psexp.node import AdaptiveBatchSizer
+
+
+class TestAdaptiveBatchSizer(unittest.TestCase):
+
+    def _round(self, sizer, rank, n_events, secs):
+        sizer.sent(rank, n_events)
+        sizer.sent_at[rank] = (time.monotonic() - secs, n_events)
+        sizer.requested(rank)
+
+    def test_no_measurement(self):
+        sizer = AdaptiveBatchSizer(1000)
+        self.assertEqual(sizer.size(1), 1000)
+        sizer.requested(1) # first request (nothing sent yet)
+        self.assertEqual(sizer.size(1), 1000)
+
+    def test_straggler(self):
+        sizer = AdaptiveBatchSizer(1000, min_size=10)
+        self._round(sizer, 1, 1000, 1.0)
+        self._round(sizer, 2, 1000, 4.0)
+        self._round(sizer, 3, 1000, 1000.0)
+        self.assertEqual(sizer.size(1), 1000)
+        self.assertAlmostEqual(sizer.size(2), 250, delta=2)
+        self.assertEqual(sizer.size(3), 10)
+        self.assertEqual(sizer.size(4), 1000)
+
+    def test_moving_average(self):
+        sizer = AdaptiveBatchSizer(1000, alpha=0.5)
+        self._round(sizer, 1, 1000, 1.0)
+        self._round(sizer, 2, 1000, 1.0)
+        self._round(sizer, 2, 1000, 1e6)
+        self.assertAlmostEqual(sizer.size(2), 500, delta=2)
+        self._round(sizer, 2, 1000, 1e6)
+        self.assertAlmostEqual(sizer.size(2), 250, delta=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import json
+import threading
+import unittest
+import unittest.mock
+import os
+import tempfile
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import psana.pscalib.calib.MDBWebUtils as wu
+import psana.pscalib.calib.MDBWebCache as wc
+
+
+class CalibHandler(BaseHTTPRequestHandler):
+    """Stand-in for the calibration web service (find_docs and gridfs only)."""
+    docs = [{'_id': 'doc0', 'ctype': 'pedestals', 'run': 1, 'id_data': 'data0'}]
+    payloads = {'data0': b'0123456789', 'data1': b'pixel_status', 'data2': b'geometry'}
+    requests = []
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        CalibHandler.requests.append(parsed.path)
+        parts = parsed.path.strip('/').split('/')
+        if len(parts) == 3 and parts[1] == 'gridfs' and parts[2] in self.payloads:
+            body = self.payloads[parts[2]]
+        elif len(parts) == 2 and 'query_string' in parse_qs(parsed.query):
+            body = json.dumps(self.docs).encode()
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCalibCache(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), CalibHandler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        CalibHandler.requests = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def set_env(self, **kwargs):
+        patcher = unittest.mock.patch.dict('os.environ', kwargs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_data_hit_miss(self):
+        self.set_env(LCLS_CALIB_CACHE_DIR=self.tmpdir.name)
+        for _ in range(3):
+            self.assertEqual(wu.get_data_for_id('testdb', 'data0', url=self.url), b'0123456789')
+        self.assertEqual(CalibHandler.requests.count('/testdb/gridfs/data0'), 1)
+        self.assertEqual(wc.calib_cache().hits, 2)
+
+    def test_docs_ttl(self):
+        self.set_env(LCLS_CALIB_CACHE_DIR=self.tmpdir.name, LCLS_CALIB_CACHE_TTL='0')
+        wu.find_docs('testdb', 'testcol', query={'ctype': 'pedestals'}, url=self.url)
+        wu.find_docs('testdb', 'testcol', query={'ctype': 'pedestals'}, url=self.url)
+        self.assertEqual(CalibHandler.requests.count('/testdb/testcol'), 2)
+
+        self.set_env(LCLS_CALIB_CACHE_DIR=self.tmpdir.name, LCLS_CALIB_CACHE_TTL='60')
+        docs = wu.find_docs('testdb', 'testcol', query={'ctype': 'pedestals'}, url=self.url)
+        self.assertEqual(wu.find_docs('testdb', 'testcol', query={'ctype': 'pedestals'}, url=self.url), docs)
+        self.assertEqual(CalibHandler.requests.count('/testdb/testcol'), 3)
+
+    def test_eviction(self):
+        self.set_env(LCLS_CALIB_CACHE_DIR=self.tmpdir.name, LCLS_CALIB_CACHE_MAXBYTES='15')
+        cache = wc.calib_cache()
+        cache.put_data(self.url, 'testdb', 'a', b'0'*10)
+        os.utime(cache._path('data', self.url, 'testdb', 'a'), (0, 0))
+        cache.put_data(self.url, 'testdb', 'b', b'1'*10)
+        self.assertIsNone(cache.get_data(self.url, 'testdb', 'a'))
+        self.assertEqual(cache.get_data(self.url, 'testdb', 'b'), b'1'*10)
+
+    def test_evict_on_limit(self):
+        # The cache directory is walked on the first write and then only when the size estimate exceeds the limit
+        self.set_env(LCLS_CALIB_CACHE_DIR=self.tmpdir.name, LCLS_CALIB_CACHE_MAXBYTES='35')
+        cache = wc.calib_cache()
+        with unittest.mock.patch('os.walk', wraps=os.walk) as walk:
+            for key in ('a', 'b', 'c'):
+                cache.put_data(self.url, 'testdb', key, b'0'*10)
+            cache.put_data(self.url, 'testdb', 'a', b'1'*10) # replaced, same size
+            self.assertEqual(walk.call_count, 1)
+            self.assertEqual(cache.nbytes, 30)
+            cache.put_data(self.url, 'testdb', 'd', b'2'*10)
+            self.assertEqual(walk.call_count, 2)
+        self.assertEqual(cache.nbytes, 30)
+        self.assertIsNone(cache.get_data(self.url, 'testdb', 'b'))
+
+    def test_concurrent_writes(self):
+        # Threads writing the same key at the same time use their own temporary files
+        self.set_env(LCLS_CALIB_CACHE_DIR=self.tmpdir.name)
+        cache = wc.calib_cache()
+        payloads = [b'0'*10, b'1'*10]
+        barrier = threading.Barrier(len(payloads), timeout=10)
+        errors = []
+        os_replace = os.replace
+        def replace(src, dst):
+            barrier.wait() # both temporary files are written
+            try:
+                os_replace(src, dst)
+            except OSError as err:
+                errors.append(err)
+                raise
+        with unittest.mock.patch('os.replace', replace):
+            threads = [threading.Thread(target=cache.put_data, args=(self.url, 'testdb', 'a', s)) for s in payloads]
+            for t in threads: t.start()
+            for t in threads: t.join()
+        self.assertEqual(errors, [])
+        self.assertIn(cache.get_data(self.url, 'testdb', 'a'), payloads)
+        path = cache._path('data', self.url, 'testdb', 'a')
+        self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])
+
+    def test_get_data_for_docs(self):
+        self.set_env(LCLS_CALIB_CACHE_DIR='')
+        docs = [{'ctype': ctype, 'data_type': 'str', 'id_data': id_data} for ctype, id_data in\
+                (('pedestals', 'data0'), ('pixel_status', 'data1'), ('geometry', 'data2'))]
+        datas = wu.get_data_for_docs([('testdb', doc) for doc in docs], url=self.url)
+        self.assertEqual(datas, ['0123456789', 'pixel_status', 'geometry'])
+        self.assertEqual(len(CalibHandler.requests), 3)
+
+    def test_off(self):
+        self.set_env(LCLS_CALIB_CACHE_DIR='')
+        self.assertIsNone(wc.calib_cache())
+        wu.get_data_for_id('testdb', 'data0', url=self.url)
+        wu.get_data_for_id('testdb', 'data0', url=self.url)
+        self.assertEqual(CalibHandler.requests.count('/testdb/gridfs/data0'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
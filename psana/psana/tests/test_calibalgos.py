@@ -0,0 +1,110 @@
+import unittest
+import numpy as np
+import psana.detector.UtilsEpix10ka as ue
+
+try:
+    import calibalgos_ext
+except ImportError:
+    calibalgos_ext = None
+
+
+class CMStore:
+    def __init__(self, cmpars, mask):
+        self.cmpars = cmpars
+        self.mask = mask
+        self.arr1 = np.ones(mask.shape, dtype=np.int8)
+
+
+class ExtStore(CMStore):
+    def __init__(self, cmpars, mask, cbits, peds, gfac):
+        super().__init__(cmpars, mask)
+        self.cbits_u8 = cbits
+        self.mask_u8 = mask
+        self.peds_gfac = (peds, gfac)
+
+    def constants_for_grinds(self):
+        return self.peds_gfac
+
+
+class DetRaw:
+    _data_bit_mask = ue.M14
+    _data_gain_bit = ue.B14
+    _gain_bit_shift = 9
+
+
+@unittest.skipIf(calibalgos_ext is None, 'calibalgos_ext is not built')
+class TestCalibAlgos(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.shape = (2, 352, 384)
+        self.peds = (rng.random((7,) + self.shape) * 50 + 1000).astype(np.float32)
+        self.gfac = (rng.random((7,) + self.shape) + 0.5).astype(np.float32)
+        self.cbits = rng.choice([28, 12, 8, 16, 0, 4, 24], self.shape).astype(np.uint8)
+        self.mask = (rng.random(self.shape) > 0.05).astype(np.uint8)
+        raw = np.clip(1000 + rng.normal(0, 3, self.shape) + rng.normal(0, 5, (2, 1, 384)), 0, ue.M14).astype(np.uint16)
+        self.raw = raw | ((rng.random(self.shape) > 0.9).astype(np.uint16) << 14)
+
+    def constants_for_grinds(self):
+        peds = np.concatenate((self.peds, np.zeros((1,) + self.shape, dtype=np.float32)))
+        gfac = np.concatenate((self.gfac, np.ones((1,) + self.shape, dtype=np.float32)))
+        return peds, gfac
+
+    def test_calib_epix_multigain(self):
+        gmaps = ue.gain_maps_epix10ka_any_alg(ue.cbits_config_and_data_detector_alg(self.raw, self.cbits, ue.B14, 9))
+        expected = np.array(self.raw & ue.M14, dtype=np.float32)
+        expected -= ue.event_constants_for_gmaps(gmaps, self.peds, default=0)
+        expected = expected * ue.event_constants_for_gmaps(gmaps, self.gfac, default=1) * self.mask
+
+        peds, gfac = self.constants_for_grinds()
+        out = np.empty(self.shape, dtype=np.float32)
+        grinds = np.empty(self.shape, dtype=np.uint8)
+        calibalgos_ext.calib_epix_multigain(self.raw, self.cbits, peds, gfac, self.mask, out, grinds=grinds)
+        np.testing.assert_array_equal(out, expected)
+        np.testing.assert_array_equal(grinds, ue.map_gain_range_index_for_gmaps(gmaps, default=7))
+
+    def test_calib_epix_multigain_wo_gfac(self):
+        gmaps = ue.gain_maps_epix10ka_any_alg(ue.cbits_config_and_data_detector_alg(self.raw, self.cbits, ue.B14, 9))
+        expected = np.array(self.raw & ue.M14, dtype=np.float32)
+        expected -= ue.event_constants_for_gmaps(gmaps, self.peds, default=0)
+        expected *= self.mask
+
+        peds, _ = self.constants_for_grinds()
+        out = np.empty(self.shape, dtype=np.float32)
+        calibalgos_ext.calib_epix_multigain(self.raw, self.cbits, peds, None, self.mask, out)
+        np.testing.assert_array_equal(out, expected)
+
+        # calib_epix10ka_ext w/o common mode keeps the mask and warns about missing gain factor
+        store = ExtStore(None, self.mask, self.cbits, peds, None)
+        with self.assertLogs(ue.logger, level='WARNING'):
+            out = ue.calib_epix10ka_ext(DetRaw(), self.raw, store)
+        np.testing.assert_array_equal(out, expected)
+
+        # and with common mode
+        cmpars = (7, 1, 100, 10)
+        ue.common_mode_epix_multigain_apply(expected, gmaps, CMStore(cmpars, self.mask))
+        store.cmpars = cmpars
+        with self.assertLogs(ue.logger, level='WARNING'):
+            out = ue.calib_epix10ka_ext(DetRaw(), self.raw, store)
+        np.testing.assert_array_equal(out, expected)
+
+    def test_common_mode(self):
+        peds, gfac = self.constants_for_grinds()
+        gmaps = ue.gain_maps_epix10ka_any_alg(ue.cbits_config_and_data_detector_alg(self.raw, self.cbits, ue.B14, 9))
+        for cmpars in ((7, 1, 100, 10), (7, 2, 100, 10), (7, 4, 100, 10), (7, 7, 3, 10), (0, 7, 100, 10)):
+            expected = np.array(self.raw & ue.M14, dtype=np.float32)
+            expected -= ue.event_constants_for_gmaps(gmaps, self.peds, default=0)
+            ue.common_mode_epix_multigain_apply(expected, gmaps, CMStore(cmpars, self.mask))
+            expected *= self.mask # masked pixels are not corrected
+
+            out = np.empty(self.shape, dtype=np.float32)
+            cmmask = np.empty(self.shape, dtype=np.uint8)
+            calibalgos_ext.calib_epix_multigain(self.raw, self.cbits, peds, None, self.mask, out,\
+                                                grinds=np.empty(self.shape, dtype=np.uint8), cmmask=cmmask,\
+                                                cm_hm_only=cmpars[0]==7)
+            calibalgos_ext.common_mode_epix_multigain(out, cmmask, cmpars[1], cormax=cmpars[2], npix_min=cmpars[3])
+            np.testing.assert_array_equal(out, expected, err_msg='cmpars=%s' % str(cmpars))
+
+
+if __name__ == '__main__':
+    unittest.main()
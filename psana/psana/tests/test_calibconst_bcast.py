@@ -0,0 +1,110 @@
+import copy
+import unittest
+import numpy as np
+from mpi4py import MPI
+from psana.psexp.calibconst_bcast import CalibConstBcast, _split, _join, _iter_refs, _get_offsets, get_doc_ids, _is_comparable, ALIGN_NBYTES
+
+
+class TestCalibConstBcast(unittest.TestCase):
+
+    def setUp(self):
+        self.calibconst = {
+            'epix10ka': {
+                'pedestals':    (np.arange(24, dtype=np.float32).reshape(2,3,4), {'_id': 'a', 'ctype': 'pedestals'}),
+                'geometry':     ('geometry text', {'_id': 'b', 'ctype': 'geometry'}),
+                'pixel_gain':   (np.ones((3,5), dtype=np.float64), {'_id': 'c', 'ctype': 'pixel_gain'}),
+            },
+            'tmo_opal': None,
+        }
+
+    def test_split_join(self):
+        skeleton, arrays = _split(self.calibconst)
+        self.assertEqual(len(arrays), 2)
+        refs = _iter_refs(skeleton)
+        self.assertEqual([ref.shape for ref in refs], [(2,3,4), (3,5)])
+        offsets, nbytes = _get_offsets(refs)
+        self.assertEqual(offsets[1] % ALIGN_NBYTES, 0)
+        self.assertGreaterEqual(nbytes, 24*4 + 15*8)
+
+        copies = [np.empty(ref.shape, dtype=ref.dtype) for ref in refs]
+        for src, dst in zip(arrays, copies):
+            dst[...] = src
+        calibconst = _join(skeleton, copies)
+        self.assertIsNone(calibconst['tmo_opal'])
+        self.assertEqual(calibconst['epix10ka']['geometry'][0], 'geometry text')
+        for ctype in ('pedestals', 'pixel_gain'):
+            data, doc = calibconst['epix10ka'][ctype]
+            np.testing.assert_array_equal(data, self.calibconst['epix10ka'][ctype][0])
+            self.assertEqual(doc, self.calibconst['epix10ka'][ctype][1])
+
+    def test_doc_ids(self):
+        doc_ids = get_doc_ids(self.calibconst)
+        self.assertEqual(doc_ids, {'epix10ka': {'pedestals': 'a', 'geometry': 'b', 'pixel_gain': 'c'}, 'tmo_opal': None})
+        self.assertTrue(_is_comparable(doc_ids))
+        del self.calibconst['epix10ka']['geometry'][1]['_id']
+        self.assertFalse(_is_comparable(get_doc_ids(self.calibconst)))
+
+    def _assert_same_calibconst(self, calibconst, expected):
+        self.assertEqual(set(calibconst), set(expected))
+        self.assertIsNone(calibconst['tmo_opal'])
+        for ctype, (data, doc) in expected['epix10ka'].items():
+            out_data, out_doc = calibconst['epix10ka'][ctype]
+            if isinstance(data, np.ndarray):
+                self.assertEqual(out_data.dtype, data.dtype)
+                np.testing.assert_array_equal(out_data, data)
+            else:
+                self.assertEqual(out_data, data)
+            self.assertEqual(out_doc, doc)
+
+    def test_bcast_raw(self):
+        calib_bcast = CalibConstBcast(MPI.COMM_SELF, bcast_mode='raw')
+        calibconst = calib_bcast.bcast(self.calibconst)
+        self._assert_same_calibconst(calibconst, self.calibconst)
+
+    def test_bcast_shmem(self):
+        calib_bcast = CalibConstBcast(MPI.COMM_SELF, bcast_mode='shmem')
+        calibconst = calib_bcast.bcast(self.calibconst)
+        self._assert_same_calibconst(calibconst, self.calibconst)
+        self.assertFalse(calibconst['epix10ka']['pedestals'][0].flags.writeable)
+
+        # Arrays of the previous constants stay valid after new ones arrive
+        pedestals = calibconst['epix10ka']['pedestals'][0]
+        window = calib_bcast.windows[0][0]
+        new_calibconst = copy.deepcopy(self.calibconst)
+        new_calibconst['epix10ka']['pedestals'] = (np.zeros((2,3,4), dtype=np.float32), {'_id': 'd', 'ctype': 'pedestals'})
+        calibconst = calib_bcast.bcast(new_calibconst)
+        self._assert_same_calibconst(calibconst, new_calibconst)
+        self.assertEqual(len(calib_bcast.windows), 2)
+        self.assertEqual(pedestals.sum(), np.arange(24).sum())
+        np.testing.assert_array_equal(pedestals, self.calibconst['epix10ka']['pedestals'][0])
+
+        # The previous window is freed at the next bcast when its arrays are released
+        del pedestals
+        self.assertIs(calib_bcast.bcast(new_calibconst), calibconst)
+        self.assertEqual(len(calib_bcast.windows), 1)
+        self.assertEqual(window, MPI.WIN_NULL)
+        self._assert_same_calibconst(calibconst, new_calibconst)
+
+    def test_bcast_skip_unchanged(self):
+        calib_bcast = CalibConstBcast(MPI.COMM_SELF, bcast_mode='raw')
+        calibconst = calib_bcast.bcast(self.calibconst)
+
+        # Same document ids: the previous constants are returned as is
+        same_ids = copy.deepcopy(self.calibconst)
+        same_ids['epix10ka']['pixel_gain'] = (np.zeros((3,5), dtype=np.float64), same_ids['epix10ka']['pixel_gain'][1])
+        self.assertIs(calib_bcast.bcast(same_ids), calibconst)
+
+        # A changed document id sends the new constants
+        new_ids = copy.deepcopy(same_ids)
+        new_ids['epix10ka']['pixel_gain'][1]['_id'] = 'e'
+        new_calibconst = calib_bcast.bcast(new_ids)
+        self.assertIsNot(new_calibconst, calibconst)
+        self._assert_same_calibconst(new_calibconst, new_ids)
+
+        # Constants without document ids are always sent
+        del new_ids['epix10ka']['geometry'][1]['_id']
+        self.assertIsNot(calib_bcast.bcast(new_ids), new_calibconst)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import numpy as np
+import psana.detector.UtilsCommonMode as ucm
+
+
+def _cmode_ma(marr, npix, npix_min, cormax, axis):
+    cmode = np.ma.median(marr, axis=axis).filled(0)
+    cmode = np.select((npix > npix_min,), (cmode,), default=0)
+    if cormax is not None:
+        cmode = np.select((np.fabs(cmode) < cormax,), (cmode,), default=0)
+    return cmode
+
+
+def common_mode_reference(arrf, mask, mode, cormax, npix_min, nbanks_rows_cols=(2,8)):
+    """np.ma implementation of common_mode_apply for banks/rows/columns (before the vectorized engine)."""
+    nbr, nbc = nbanks_rows_cols
+    hrows = arrf.shape[1] // nbr
+    bcols = arrf.shape[2] // nbc
+    halves = (slice(0, hrows), slice(hrows, None))
+    banks = [slice(i*bcols, (i+1)*bcols) for i in range(nbc)]
+    for s in range(arrf.shape[0]):
+        a, m = arrf[s], mask[s] > 0
+        if mode & 4: # in banks
+            for rs in halves:
+                for cs in banks:
+                    b, good = a[rs, cs], m[rs, cs]
+                    if good.sum() < npix_min: continue
+                    cmode = np.median(b[good])
+                    if cormax is None or np.fabs(cmode) < cormax:
+                        b[good] -= cmode
+        if mode & 1: # in rows per bank
+            for cs in banks:
+                b, good = a[:, cs], m[:, cs]
+                cmode = _cmode_ma(np.ma.array(b, mask=~good), good.sum(axis=1), npix_min, cormax, 1)
+                b[good] -= np.broadcast_to(cmode[:,None], b.shape)[good]
+        if mode & 2: # in columns per bank
+            for rs in halves:
+                b, good = a[rs], m[rs]
+                cmode = _cmode_ma(np.ma.array(b, mask=~good), good.sum(axis=0), npix_min, cormax, 0)
+                b[good] -= np.broadcast_to(cmode[None,:], b.shape)[good]
+
+
+class TestCommonMode(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.shape = (3, 352, 384)
+        self.data = (rng.normal(0, 5, self.shape) + rng.normal(0, 5, (3, 1, 384))).astype(np.float32)
+        self.mask = (rng.random(self.shape) > 0.1).astype(np.uint8)
+        self.mask[1, :, :40] = 0
+
+    def test_masked_median(self):
+        lanes = self.data.reshape(-1, 48)
+        lmask = self.mask.reshape(-1, 48) > 0
+        lmask[:5] = False
+        cmode, npix = ucm.masked_median(lanes, lmask)
+        expected = np.ma.median(np.ma.masked_array(lanes, mask=~lmask), axis=1)
+        valid = npix > 0
+        np.testing.assert_array_equal(npix, lmask.sum(axis=1))
+        np.testing.assert_array_equal(cmode[valid], expected[valid])
+
+    def test_common_mode_rows(self):
+        for s in range(self.shape[0]):
+            expected = self.data[s].copy()
+            m = self.mask[s]
+            for r in range(expected.shape[0]):
+                good = m[r] > 0
+                if good.sum() > 10:
+                    expected[r, good] -= np.median(expected[r, good])
+            out = self.data[s].copy()
+            ucm.common_mode_rows(out, mask=m, cormax=None, npix_min=10)
+            np.testing.assert_array_equal(out, expected)
+
+    def test_common_mode_apply_reference(self):
+        for mode in (1, 2, 4, 7):
+            for cormax in (None, 100, 3):
+                msg = 'mode=%d cormax=%s' % (mode, str(cormax))
+                expected = self.data.copy()
+                common_mode_reference(expected, self.mask, mode, cormax, 10)
+                out = self.data.copy()
+                ucm.common_mode_apply(out, self.mask, (0, mode, cormax, 10))
+                np.testing.assert_array_equal(out, expected, err_msg=msg)
+                out = self.data.copy()
+                ucm.common_mode_segments(out, self.mask, mode, cormax=cormax, npix_min=10, nthreads=3)
+                np.testing.assert_array_equal(out, expected, err_msg=msg)
+
+    def test_algos(self):
+        for algo in ucm.CM_ALGOS:
+            out = self.data.copy()
+            ucm.common_mode_segments(out, self.mask, 7, cormax=None, algo=algo)
+            self.assertLess(np.abs(out[self.mask > 0].mean()), 0.5, msg=algo)
+
+
+if __name__ == '__main__':
+    unittest.main()
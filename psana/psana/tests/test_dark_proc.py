@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from mpi4py import MPI
+import psana.detector.UtilsCalib as uac
+
+
+class TestDarkProc(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.shape = (4, 64)
+        self.data = (1000 + rng.normal(0, 5, (300,) + self.shape)).astype(np.uint16)
+
+    def test_p2quantile(self):
+        x = np.random.default_rng(1).normal(0, 1, (2000,) + self.shape).astype(np.float32)
+        for p in (0.05, 0.5, 0.95):
+            q = uac.P2Quantile(p)
+            for v in x: q.add(v)
+            self.assertLess(np.abs(q.value() - np.quantile(x, p, axis=0)).max(), 0.3, msg='p=%.2f' % p)
+
+    def test_gate_limits(self):
+        qlo = np.array([0.5, 990.2, 1000.])
+        qhi = np.array([20000., 1010.7, 1000.])
+        gate_lo, gate_hi = uac.gate_limits(qlo, qhi, np.uint16, int_lo=1, int_hi=16000)
+        np.testing.assert_array_equal(gate_lo, [1, 990, 1000])
+        np.testing.assert_array_equal(gate_hi, [16000, 1011, 1001])
+
+    def test_qstream(self):
+        consts = []
+        for qstream in (False, True):
+            dpo = uac.DarkProc(nrecs=200, nrecs1=50, plotim=0, qstream=qstream)
+            for i, raw in enumerate(self.data):
+                if dpo.event(raw, i) == 2: break
+            dpo.summary()
+            consts.append(dpo.constants_av1_rms_sta())
+        np.testing.assert_allclose(consts[1][0], consts[0][0], atol=2)
+        np.testing.assert_array_equal(consts[1][2], consts[0][2])
+
+    def test_comm_self(self):
+        # gather/bcast of the 1st stage and Reduce of the 2nd stage give the serial results
+        dpos = []
+        for comm in (None, MPI.COMM_SELF):
+            dpo = uac.DarkProc(nrecs=200, nrecs1=50, plotim=0, comm=comm)
+            for i, raw in enumerate(self.data):
+                if dpo.event(raw, i) == 2: break
+            dpo.summary()
+            dpos.append(dpo)
+        serial, reduced = dpos
+        for name in ('gate_lo', 'gate_hi', 'arr_med', 'abs_dev', 'arr_sum0', 'arr_sum1', 'arr_sum2',\
+                     'sta_int_lo', 'sta_int_hi', 'arr_max', 'arr_min'):
+            np.testing.assert_array_equal(getattr(reduced, name), getattr(serial, name), err_msg=name)
+        for c_reduced, c_serial in zip(reduced.constants_av1_rms_sta(), serial.constants_av1_rms_sta()):
+            np.testing.assert_array_equal(c_reduced, c_serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
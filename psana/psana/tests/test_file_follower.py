@@ -0,0 +1,123 @@
+import os
+import time
+import tempfile
+import threading
+import functools
+import unittest
+import numpy as np
+from psana.psexp.file_follower import FileFollower, file_key
+from psana.smdreader import SmdReader
+
+
+class TestFileFollower(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fname = os.path.join(self.tmpdir.name, 'xpptut15-r0001-s000-c000.smd.xtc2')
+        self.inprogress = self.fname + '.inprogress'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _later(self, fn, delay=0.2):
+        t = threading.Timer(delay, fn)
+        t.start()
+        return t
+
+    def _append(self, fname, nbytes):
+        with open(fname, 'ab') as f:
+            f.write(b'\0' * nbytes)
+
+    def test_file_key(self):
+        self.assertEqual(file_key(self.inprogress), file_key(self.fname))
+        self.assertEqual(file_key(self.fname), os.path.basename(self.fname))
+
+    def test_wakeup_on_growth(self):
+        follower = FileFollower(poll_interval=10)
+        if not follower.active:
+            self.skipTest('inotify is not available')
+        self._append(self.inprogress, 10)
+        fd = os.open(self.inprogress, os.O_RDONLY)
+        try:
+            name = follower.watch_fd(fd)
+            t = self._later(lambda: self._append(self.inprogress, 100))
+            st = time.monotonic()
+            found = follower.wait_until(lambda: os.fstat(fd).st_size >= 110, 5, names=[name])
+            t.join()
+            self.assertTrue(found)
+            self.assertLess(time.monotonic() - st, 2)
+        finally:
+            os.close(fd)
+
+    def test_wakeup_on_rename(self):
+        follower = FileFollower(poll_interval=10)
+        if not follower.active:
+            self.skipTest('inotify is not available')
+        self._append(self.inprogress, 10)
+        follower.watch(self.fname)
+        t = self._later(lambda: os.rename(self.inprogress, self.fname))
+        st = time.monotonic()
+        found = follower.wait_until(lambda: os.path.isfile(self.fname), 5, names=[self.fname])
+        t.join()
+        self.assertTrue(found)
+        self.assertLess(time.monotonic() - st, 2)
+
+    def test_other_files_ignored(self):
+        follower = FileFollower(poll_interval=10)
+        if not follower.active:
+            self.skipTest('inotify is not available')
+        follower.watch(self.fname)
+        t = self._later(lambda: self._append(os.path.join(self.tmpdir.name, 'other.xtc2'), 10), delay=0.05)
+        self.assertFalse(follower.wait(0.5, names=[self.fname]))
+        t.join()
+        t = self._later(lambda: self._append(self.fname, 10), delay=0.05)
+        self.assertTrue(follower.wait(5, names=[self.fname]))
+        t.join()
+
+    def test_polling(self):
+        follower = FileFollower(poll_interval=0.05, use_inotify=0)
+        self.assertFalse(follower.active)
+        follower.watch(self.fname)
+        t = self._later(lambda: self._append(self.fname, 10))
+        found = follower.wait_until(lambda: os.path.isfile(self.fname), 5, names=[self.fname])
+        t.join()
+        self.assertTrue(found)
+        self.assertFalse(follower.wait_until(lambda: False, 0.1))
+
+    def test_smdreader_stalled_stream(self):
+        # A stream that keeps growing must not keep SmdReader waiting for a stalled one
+        follower = FileFollower(poll_interval=10)
+        if not follower.active:
+            self.skipTest('inotify is not available')
+        smd_file = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                'test_data', 'chunking', 'smalldata', 'data-r0001-s000-c000.smd.xtc2')
+        with open(smd_file, 'rb') as f:
+            smd_data = f.read()
+        stalled = os.path.join(self.tmpdir.name, 'xpptut15-r0001-s001-c000.smd.xtc2.inprogress')
+        self._append(stalled, 0)
+        stop = threading.Event()
+        def grow():
+            for st in range(0, len(smd_data), 256):
+                if stop.wait(0.05): break
+                with open(self.inprogress, 'ab') as f:
+                    f.write(smd_data[st: st+256])
+        self._append(self.inprogress, 0)
+        fds = np.array([os.open(fname, os.O_RDONLY) for fname in (stalled, self.inprogress)], dtype=np.int32)
+        t = threading.Thread(target=grow)
+        try:
+            names = [follower.watch_fd(fd) for fd in fds]
+            smdr = SmdReader(fds, 0x100000, 2)
+            t.start()
+            st = time.monotonic()
+            smdr.get(lambda: [False, False], wait_fn=functools.partial(follower.wait, names=names))
+            self.assertLess(time.monotonic() - st, 4) # max_retries * 1s
+            self.assertFalse(smdr.is_complete())
+            self.assertTrue(t.is_alive())
+        finally:
+            stop.set()
+            t.join()
+            for fd in fds: os.close(fd)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import unittest
+import numpy as np
+from psana.pscalib.geometry.GeometryAccess import GeometryAccess
+
+DIR_GEO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../pscalib/geometry/data')
+
+
+class TestGeometryAccess(unittest.TestCase):
+
+    def test_pixel_coords(self):
+        for fname in ('geometry-def-cspad.data', 'geometry-def-epixhr1x4-20.data', 'geometry-def-pnccd.data'):
+            geo = GeometryAccess(os.path.join(DIR_GEO, fname))
+            top = geo.get_top_geo()
+            for geo_obj in geo.list_of_geos: geo_obj.tilt_geo(dt_z=0.01)
+            for do_tilt in (True, False):
+                expected = top.get_pixel_coords(do_tilt) # recursive evaluation
+                result = geo.get_pixel_coords(do_tilt=do_tilt)
+                for e, r in zip(expected, result):
+                    np.testing.assert_array_equal(r, e, err_msg='%s do_tilt=%s' % (fname, do_tilt))
+
+    def test_move_geo(self):
+        geo = GeometryAccess(os.path.join(DIR_GEO, 'geometry-def-cspad.data'))
+        X0 = geo.get_pixel_coords()[0].copy()
+        rows0, _ = geo.get_pixel_coord_indexes()
+        self.assertIs(geo.get_pixel_coords()[0], geo.get_pixel_coords()[0])
+        geo.move_geo('SENS2X1:V1', 3, dx=1000)
+        X1 = geo.get_pixel_coords()[0]
+        np.testing.assert_array_equal(X1, geo.get_top_geo().get_pixel_coords()[0])
+        changed = np.any((X1 != X0).reshape(32, -1), axis=1)
+        np.testing.assert_array_equal(np.flatnonzero(changed), [3])
+        rows1, _ = geo.get_pixel_coord_indexes()
+        self.assertFalse(np.array_equal(rows0, rows1))
+
+    def test_fallback_cache(self):
+        # CSPAD2X2 is not batched: coordinates and indexes are still cached and re-evaluated when moved
+        geo = GeometryAccess(os.path.join(DIR_GEO, 'geometry-def-cspad2x2.data'))
+        X0 = geo.get_pixel_coords()[0]
+        self.assertIs(geo.get_pixel_coords()[0], X0)
+        rows0, _ = geo.get_pixel_coord_indexes()
+        self.assertIs(geo.get_pixel_coord_indexes()[0], rows0)
+        self.assertIsNot(geo.get_pixel_coords(cframe=1)[0], X0)
+        self.assertIs(geo.get_pixel_coords()[0], X0)
+        geo.move_geo('CSPAD2X2:V1', 0, dx=1000)
+        X1 = geo.get_pixel_coords()[0]
+        self.assertIsNot(X1, X0)
+        np.testing.assert_array_equal(X1, geo.get_top_geo().get_pixel_coords()[0])
+        np.testing.assert_array_equal(X1, X0 + 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+import psana.detector.UtilsAreaDetector as uad
+
+
+class TestImagePlan(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.shape = (2, 30, 40)
+        self.rows = rng.integers(0, 50, self.shape).astype(np.uint)
+        self.cols = rng.integers(0, 60, self.shape).astype(np.uint)
+        self.nda = rng.normal(100, 10, self.shape).astype(np.float32)
+        self.plan = uad.image_plan(self.rows, self.cols)
+
+    def test_multipixel(self):
+        img_shape = uad.image_shape(self.rows, self.cols)
+        inds = np.ravel_multi_index((self.rows.ravel().astype(int), self.cols.ravel().astype(int)), img_shape)
+        last = np.zeros(img_shape[0] * img_shape[1], dtype=np.float32)
+        last[inds] = self.nda.ravel()
+        vmax = last.copy()
+        np.maximum.at(vmax, inds, self.nda.ravel())
+        nent = np.bincount(inds, minlength=last.size)
+        vsum = np.bincount(inds, weights=self.nda.ravel(), minlength=last.size)
+        vmean = np.where(nent > 1, vsum / np.maximum(nent, 1), last)
+        for mapmode, expected in ((1, last), (2, vmax), (3, vmean)):
+            img = uad.img_from_image_plan(self.plan, self.nda, mapmode=mapmode, fillholes=False)
+            np.testing.assert_allclose(img.ravel(), expected, rtol=1e-6, err_msg='mapmode=%d' % mapmode)
+        np.testing.assert_array_equal(uad.img_entries_from_image_plan(self.plan).ravel(), nent)
+
+    def test_rows_cols(self):
+        rows, cols = uad.rows_cols_from_image_plan(self.plan)
+        np.testing.assert_array_equal(rows, self.rows)
+        np.testing.assert_array_equal(cols, self.cols)
+
+    def test_holes(self):
+        _, _, hole_rows, hole_cols, _ = uad.statistics_of_holes(self.rows, self.cols)
+        np.testing.assert_array_equal(self.plan['hole_rows'], hole_rows)
+        np.testing.assert_array_equal(self.plan['hole_cols'], hole_cols)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,6 +18,17 @@ class TestPacketFooter(unittest.TestCase) :
         views = pf2.split_packets()
         assert memoryview(views[0]).shape[0] == 7
         assert memoryview(views[1]).shape[0] == 7
+        assert bytes(views[1]) == b'packet1'
+        assert list(pf2.get_offsets()) == [0, 7]
+
+    def test_add_packet(self):
+        pf = PacketFooter(1)
+        pf.set_size(0, 5)
+        pf.add_packet(3)
+        assert pf.n_packets == 2
+        assert list(pf.sizes) == [5, 3]
+        pf2 = PacketFooter(view=bytearray(8) + pf.footer)
+        assert [memoryview(v).nbytes for v in pf2.split_packets()] == [5, 3]
 
 
 if __name__ == "__main__":
@@ -15,10 +15,10 @@ class Test:
         cmd_args = ['shmemServer','-c',str(client_count),'-n','10','-f',tmp_file,'-p','shmem_test_'+pid,'-s','0x80000']
         return subprocess.Popen(cmd_args)
 
-    def launch_client(self,pid):
+    def launch_client(self,pid,env=None):
         shmem_file = os.path.dirname(os.path.realpath(__file__))+'/shmem_client.py'  
         cmd_args = ['python',shmem_file,pid]
-        return subprocess.Popen(cmd_args)
+        return subprocess.Popen(cmd_args,env=env,stderr=subprocess.PIPE)
                 
     @staticmethod
     def setup_input_files(tmp_path):
@@ -28,22 +28,26 @@ class Test:
         subprocess.call(['xtcwriter','-t','-n',str(dgram_count),'-f',str(tmp_file)])
         return tmp_file
         
-    def test_shmem(self, tmp_path):
+    @pytest.mark.parametrize('zero_copy', ['0', '1'])
+    def test_shmem(self, tmp_path, zero_copy):
         cli = []
         pid = str(os.getpid())
+        env = dict(os.environ, PS_SHMEM_ZERO_COPY=zero_copy)
         tmp_file = self.setup_input_files(tmp_path)
         srv = self.launch_server(tmp_file,pid)
         assert srv != None,"server launch failure"
         try:
             for i in range(client_count):
-              cli.append(self.launch_client(pid))
+              cli.append(self.launch_client(pid,env=env))
               assert cli[i] != None,"client "+str(i)+ " launch failure"
         except:
             srv.kill()
             raise
         nevents = 0
         for i in range(client_count):
-          cli[i].wait()
+          _, err = cli[i].communicate()
+          # the exit code is the number of events: check that the client didn't fail
+          assert b'Traceback' not in err, err.decode()
           nevents += cli[i].returncode
         # cpo thinks the precise number of events in this assert
         # is not guaranteed, given the flexible nature of shmem
@@ -11,3 +11,20 @@ def test_smalldata(tmp_path):
     return
 
 
+
+def test_column_batch():
+    import numpy as np
+    from psana.smalldata import ColumnBatch
+    batch = ColumnBatch()
+    for i in range(10):
+        batch.new_event({'timestamp': i, 'oneint': 1, 'arrfloat': np.ones(2) * i})
+        if i % 2 == 0:
+            batch.update({'unaligned_int': 3, 'oneint': 2})
+    header, buf = batch.to_buffer()
+    columns = ColumnBatch.from_buffer(header, buf).columns
+    present, data, (dtype, shape) = columns['unaligned_int']
+    assert np.array_equal(present, np.arange(10) % 2 == 0)
+    assert np.array_equal(data, [3] * 5) and dtype == np.int64 and shape == ()
+    assert np.array_equal(columns['oneint'][1], [2, 1] * 5)
+    assert np.array_equal(columns['arrfloat'][1], np.arange(10)[:, None] * np.ones(2))
+    return
@@ -0,0 +1,79 @@
+import struct
+import unittest
+import numpy as np
+from psana.psexp import TransitionId
+from psana.smdindexer import index_smd_batch
+
+
+def make_dgram(service, ts, payload=b''):
+    # Dgram: seq.low | seq.high | env | Xtc (src | damage | contains | extent)
+    xtc = struct.pack('<IHHI', 0, 0, 0, 12 + len(payload))
+    return struct.pack('<IIi', ts & 0xffffffff, ts >> 32, service << 24) + xtc + payload
+
+
+def make_smd_l1(ts, bd_offset, bd_size):
+    # ShapesData (TypeId=1) containing Data (TypeId=3) with intOffset and intDgramSize
+    data = struct.pack('<IHHI', 0, 0, 3, 12 + 16) + struct.pack('<QQ', bd_offset, bd_size)
+    shapesdata = struct.pack('<IHHI', 0, 0, 1, 12 + len(data)) + data
+    return make_dgram(TransitionId.L1Accept, ts, shapesdata)
+
+
+def make_batch(events):
+    """ events: list of list of dgram bytes (None for a missing dgram)"""
+    batch = bytearray()
+    evt_sizes = []
+    for dgrams in events:
+        evt = bytearray()
+        for d in dgrams:
+            if d is not None: evt.extend(d)
+        sizes = [len(d) if d is not None else 0 for d in dgrams]
+        evt.extend(struct.pack(f'<{len(dgrams)+1}I', *sizes, len(dgrams)))
+        batch.extend(evt)
+        evt_sizes.append(len(evt))
+    batch.extend(struct.pack(f'<{len(events)+1}I', *evt_sizes, len(events)))
+    return batch
+
+
+class TestSmdIndexer(unittest.TestCase):
+
+    def test_offsets_and_cutoffs(self):
+        events = [
+            [make_dgram(TransitionId.BeginStep, 1), make_dgram(TransitionId.BeginStep, 1)],
+            [make_smd_l1(2, 0, 100),                make_smd_l1(2, 0, 50)],
+            [make_smd_l1(3, 100, 100),              None],
+            [make_smd_l1(4, 300, 100),              make_smd_l1(4, 50, 50)],
+        ]
+        batch = make_batch(events)
+        n_events, n_smds = len(events), 2
+        shape = (n_events, n_smds)
+        bd_offsets  = np.zeros(shape, dtype=np.int64)
+        bd_sizes    = np.zeros(shape, dtype=np.int64)
+        smd_offsets = np.zeros(shape, dtype=np.int64)
+        smd_sizes   = np.zeros(shape, dtype=np.int64)
+        cutoffs     = np.ones(shape, dtype=np.int64)
+        services    = np.zeros(n_events, dtype=np.int64)
+
+        got = index_smd_batch(batch, n_smds, [False, False], True, 0x1000000,
+                bd_offsets, bd_sizes, smd_offsets, smd_sizes, cutoffs, services)
+
+        assert got == n_events
+        assert list(services) == [TransitionId.BeginStep] + [TransitionId.L1Accept]*3
+        assert list(bd_offsets[:, 0]) == [0, 0, 100, 300]
+        assert list(bd_sizes[:, 1]) == [0, 50, 0, 50]
+        assert list(smd_sizes[:, 0]) == [24, 64, 64, 64]
+        assert smd_offsets[1, 1] == smd_offsets[1, 0] + 64
+        # First L1 and non-contiguous reads are cutoff points, missing dgrams are not.
+        assert list(cutoffs[:, 0]) == [1, 1, 0, 1]
+        assert list(cutoffs[:, 1]) == [1, 1, 0, 0]
+
+    def test_unexpected_layout(self):
+        batch = make_batch([[make_dgram(TransitionId.L1Accept, 1)]])
+        shape = (1, 1)
+        arrays = [np.zeros(shape, dtype=np.int64) for i in range(4)] + \
+                [np.ones(shape, dtype=np.int64), np.zeros(1, dtype=np.int64)]
+        with self.assertRaises(ValueError):
+            index_smd_batch(batch, 1, [False], True, 0x1000000, *arrays)
+
+
+if __name__ == "__main__":
+    unittest.main()
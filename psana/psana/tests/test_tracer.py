@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import unittest
+import psana.psexp.tracer as tracer
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.prefix = os.path.join(self.tmpdir.name, 'trace')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _record(self, tr, name, secs):
+        t0 = time.perf_counter_ns()
+        tr.record(name, t0, t0 + int(secs*1e9))
+
+    def test_rank_trace(self):
+        tr = tracer.Tracer(self.prefix, bufsize=16)
+        tr.set_label('bd')
+        self._record(tr, 'bd.fill_chunk', 0.5)
+        self._record(tr, 'bd.ana', 0.25)
+        self._record(tr, 'bd.ana', 0.25)
+        t = threading.Thread(target=self._record, args=(tr, 'bd.fill_chunk', 0.1))
+        t.start(); t.join()
+        rt = tr.rank_trace(3)
+        self.assertEqual(rt['n_recorded'], 4)
+        self.assertEqual(rt['totals']['bd.ana'], [2, int(0.5e9)])
+        self.assertEqual(rt['totals']['bd.fill_chunk'], [2, int(0.6e9)])
+        spans = [e for e in rt['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual(len(spans), 4)
+        self.assertEqual(len(set(e['tid'] for e in spans)), 2)
+        self.assertTrue(all(e['pid'] == 3 for e in rt['traceEvents']))
+        self.assertEqual(spans, sorted(spans, key=lambda e: e['ts']))
+
+    def test_ring_buffer(self):
+        tr = tracer.Tracer(self.prefix, bufsize=4)
+        for i in range(10):
+            self._record(tr, f'stage{i}', 0.001)
+        rt = tr.rank_trace(0)
+        self.assertEqual(rt['n_recorded'], 10)
+        self.assertEqual(rt['n_kept'], 4)
+        names = [e['name'] for e in rt['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual(names, ['stage6', 'stage7', 'stage8', 'stage9'])
+
+    def test_merge(self):
+        rank_files = []
+        for rank, label in enumerate(['smd0', 'eb', 'bd', 'bd']):
+            tr = tracer.Tracer(self.prefix, bufsize=16)
+            tr.set_label(label)
+            self._record(tr, f'{label}.stage', 0.1*(rank+1))
+            rank_files.append(f'{self.prefix}.rank{rank}.json')
+            tracer.write_json(rank_files[-1], tr.rank_trace(rank))
+        tracer.merge(rank_files, self.prefix)
+        with open(f'{self.prefix}.json') as f:
+            merged = json.load(f)
+        spans = [e for e in merged['traceEvents'] if e['ph'] == 'X']
+        self.assertEqual(sorted(e['pid'] for e in spans), [0, 1, 2, 3])
+        with open(f'{self.prefix}.summary.txt') as f:
+            text = f.read()
+        self.assertIn('rank 2 (bd)', text)
+        self.assertIn('bd (sum of wall', text)
+        self.assertIn('bd.stage', text)
+
+    def test_off(self):
+        if tracer.get_tracer() is not None:
+            self.skipTest('PS_TRACE is set')
+        fn = lambda x: x
+        self.assertIs(tracer.traced('x')(fn), fn)
+        with tracer.span('x'):
+            pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,11 +7,15 @@ from xtc import xtc
 from det import det, detnames, det_container
 
 import hashlib
+import numpy as np
+from types import SimpleNamespace
 from psana import DataSource
 import dgramCreate as dc
 from setup_input_files import setup_input_files
 from run_chunking import run_test_chunking
 from run_early_termination import run_test_early_termination
+from run_event_index import setup_event_index_files, run_test_event_index
+from psana.psexp.event_index import EventIndex
 
 
 class Test:
@@ -154,6 +158,112 @@ class Test:
     def test_chunking(self):
         run_test_chunking()
 
+    @pytest.mark.parametrize('mode_env', [{'PS_BD_ON_DEMAND': '1'},
+                                          {'PS_BD_READAHEAD': '2'},
+                                          {'PS_BD_READAHEAD': '2', 'PS_BD_CHUNKSIZE': '4096'},
+                                          {'PS_BD_MMAP': '1'},
+                                          {'PS_BD_MMAP': '1', 'PS_BD_CHUNKSIZE': '4096'}])
+    def test_bd_modes(self, mode_env):
+        # Bigdata reading modes are set at import time: run each in its own process
+        run_bd_modes = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'run_bd_modes.py')
+        expected = subprocess.check_output(['python', run_bd_modes])
+        env = dict(os.environ, **mode_env)
+        result = subprocess.check_output(['python', run_bd_modes], env=env)
+        assert len(expected.splitlines()) == 15
+        assert result == expected
+
+    def test_bd_readahead_close(self, monkeypatch):
+        # Reads in flight are waited for at the end of each batch, by the next
+        # EventManager (e.g. after a break) and before the files are closed
+        import psana.psexp.event_manager as event_manager
+        monkeypatch.setattr(event_manager, 'BD_READAHEAD', 2)
+        monkeypatch.setenv('PS_BD_CHUNKSIZE', '4096')
+        xtc_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_data', 'chunking')
+        ds = DataSource(exp='xpptut15', run=1, dir=xtc_dir, batch_size=4)
+        run = next(ds.runs())
+        assert len([evt for evt in run.events()]) == 15
+        assert ds.dm.bd_readahead is None
+
+        ds = DataSource(exp='xpptut15', run=1, dir=xtc_dir, batch_size=4)
+        run = next(ds.runs())
+        for i, evt in enumerate(run.events()):
+            if i == 5: break
+        evt_man = ds.dm.bd_readahead
+        assert evt_man is not None
+        ds.dm.close()
+        assert ds.dm.bd_readahead is None
+        assert evt_man.prefetches == [{}] * evt_man.n_smd_files
+        assert evt_man.prefetch_nbytes == 0
+
+    def test_env_values(self):
+        xtc_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_data', 'mixed_rate')
+        ds = DataSource(exp='xpptut15', run=1, dir=xtc_dir)
+        run = next(ds.runs())
+        edet = run.Detector('HX2:DVD:GCC:01:PMON')
+        timestamps, nanoseconds = [], []
+        for evt in run.events():
+            timestamps.append(evt.timestamp)
+            nanoseconds.append(evt._nanoseconds)
+
+        # Array of timestamps (any order, any integer dtype) gives the same values as events
+        store = run.esm.stores['epics']
+        expected = store.values([SimpleNamespace(timestamp=ts) for ts in timestamps], edet._var_name)
+        timestamps = np.array(timestamps, dtype=np.uint64)
+        assert edet(timestamps) == expected
+        order = np.argsort(timestamps)[::-1]
+        assert edet(timestamps[order]) == [expected[i] for i in order]
+        assert edet(timestamps.astype(np.int64)) == expected
+        assert all([val == 41.0 for val, ns in zip(expected, nanoseconds) if ns >= 30]) # first SlowUpdate is ts 30
+
+    def test_event_index(self, tmp_path):
+        xtc_dir = str(tmp_path / 'chunking')
+        shutil.copytree(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_data', 'chunking'), xtc_dir)
+        ds = DataSource(exp='xpptut15', run=1, dir=xtc_dir)
+        run = next(ds.runs())
+        timestamps = [evt.timestamp for evt in run.events()]
+
+        ds = DataSource(exp='xpptut15', run=1, dir=xtc_dir)
+        run = next(ds.runs())
+        assert run.event_at(3).timestamp == timestamps[3]
+        assert run.event_at(-1).timestamp == timestamps[-1]
+        selected = [evt.timestamp for evt in run.events(timestamps=timestamps[::2])]
+        assert selected == timestamps[::2]
+        assert os.path.exists(os.path.join(xtc_dir, 'smalldata', 'data-r0001.smd.idx.npz'))
+
+    def test_event_index_multi_run(self, tmp_path):
+        xtc_dir = str(tmp_path / 'event_index')
+        setup_event_index_files(xtc_dir)
+        run_test_event_index(xtc_dir)
+
+    def test_event_index_rebuild(self, tmp_path):
+        xtc_dir = str(tmp_path / 'chunking')
+        shutil.copytree(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_data', 'chunking'), xtc_dir)
+        index_file = os.path.join(xtc_dir, 'smalldata', 'data-r0001.smd.idx.npz')
+        smd_file = os.path.join(xtc_dir, 'smalldata', 'data-r0001-s000-c000.smd.xtc2')
+        ds = DataSource(exp='xpptut15', run=1, dir=xtc_dir)
+        run = next(ds.runs())
+        timestamps = [evt.timestamp for evt in run.events()]
+        assert run.event_at(5).timestamp == timestamps[5]
+
+        # Index no longer matches the smd file (e.g. the run was still being written)
+        index = EventIndex.load(index_file)
+        index.columns['smd_file_sizes'] = index.smd_file_sizes - 100
+        index.save(index_file)
+        assert EventIndex.load(index_file).is_stale([smd_file])
+        ds = DataSource(exp='xpptut15', run=1, dir=xtc_dir)
+        run = next(ds.runs())
+        assert run.event_at(-1).timestamp == timestamps[-1]
+        assert not EventIndex.load(index_file).is_stale([smd_file])
+
+        # Unreadable index file
+        with open(index_file, 'wb') as f:
+            f.write(b'not an index')
+        ds = DataSource(exp='xpptut15', run=1, dir=xtc_dir)
+        run = next(ds.runs())
+        selected = [evt.timestamp for evt in run.events(timestamps=timestamps[1::3])]
+        assert selected == timestamps[1::3]
+        assert not EventIndex.load(index_file).is_stale([smd_file])
+
 
 
 
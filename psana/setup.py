@@ -115,6 +115,7 @@ if 'PSANA' in BUILD_LIST :
             'hdf5explorer        = psana.graphqt.app.hdf5explorer:hdf5explorer_gui',
             'screengrabber       = psana.graphqt.ScreenGrabberQt5:run_GUIScreenGrabber',
             'detnames            = psana.app.detnames:detnames',
+            'build_event_index   = psana.app.build_event_index:build_event_index',
             'config_dump         = psana.app.config_dump:config_dump',
             'xtcavDark           = psana.xtcav.app.xtcavDark:__main__',
             'xtcavLasingOff      = psana.xtcav.app.xtcavLasingOff:__main__',
@@ -275,6 +276,14 @@ if 'DGRAM' in BUILD_LIST :
     )
     CYTHON_EXTS.append(ext)
 
+    ext = Extension("psana.smdindexer",
+                    sources=["psana/smdindexer.pyx"],
+                    include_dirs=["psana"],
+                    extra_compile_args=extra_c_compile_args,
+                    extra_link_args=extra_link_args,
+    )
+    CYTHON_EXTS.append(ext)
+
     ext = Extension("psana.parallelreader",
                     sources=["psana/parallelreader.pyx"],
                     include_dirs=["psana"],
@@ -344,6 +353,16 @@ if 'NDARRAY' in BUILD_LIST :
     )
     CYTHON_EXTS.append(ext)
 
+    ext = Extension("calibalgos_ext",
+                    sources=["psana/pycalgos/calibalgos_ext.pyx",
+                             "psana/pycalgos/CalibAlgos.cc"],
+                    language="c++",
+                    extra_compile_args = extra_cxx_compile_args + ['-O3'],
+                    include_dirs=["psana/pycalgos",np.get_include()],
+                    extra_link_args = extra_link_args,
+    )
+    CYTHON_EXTS.append(ext)
+
 
 setup(
     name = 'psana',